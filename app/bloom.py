@@ -0,0 +1,43 @@
+import math
+from hashlib import blake2b
+from threading import Lock
+from typing import Iterator
+
+
+class BloomFilter:
+    """
+    A compact set of strings which can have false positives but no false negatives.
+    Elements can't be removed.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        """
+        :param capacity: The number of elements for which the false positive rate stays below error_rate
+        :param error_rate: The false positive rate at capacity
+        """
+
+        self.size: int = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes: int = max(1, round(self.size / max(capacity, 1) * math.log(2)))
+        self._bits: bytearray = bytearray((self.size + 7) // 8)
+        self._lock: Lock = Lock()
+
+    def _positions(self, element: str) -> Iterator[int]:
+        digest: bytes = blake2b(element.encode(), digest_size=16).digest()
+        first: int = int.from_bytes(digest[:8], "little")
+        second: int = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, element: str) -> None:
+        """
+        Adds an element.
+        :param element: The element
+        """
+
+        positions = list(self._positions(element))
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, element: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(element))
@@ -0,0 +1,149 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+
+class _PendingLoad:
+    """
+    The loads of one key which are currently running.
+    """
+
+    __slots__ = ("count", "version")
+
+    def __init__(self):
+        self.count: int = 0
+        self.version: int = 0
+
+
+class TTLCache:
+    """
+    A thread-safe cache which holds at most max_size entries for ttl seconds each.
+    When it is full, the least recently used entry is dropped.
+    Keys can be assigned to groups, so all entries of a group can be dropped at once.
+    """
+
+    def __init__(self, ttl: float, max_size: int, group: Optional[Callable[[Hashable], Hashable]] = None):
+        self.ttl: float = ttl
+        self.max_size: int = max_size
+        self.hits: int = 0
+        self.misses: int = 0
+        self._group: Optional[Callable[[Hashable], Hashable]] = group
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._groups: Dict[Hashable, Set[Hashable]] = {}
+        self._pending: Dict[Hashable, _PendingLoad] = {}
+        self._lock: Lock = Lock()
+
+    def get_or_load(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        """
+        Returns the cached value of a key and loads and stores it if it is missing or expired.
+        :param key: The key
+        :param load: Computes the value on a miss
+        :return: The value
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            pending: _PendingLoad = self._pending.setdefault(key, _PendingLoad())
+            pending.count += 1
+            version: int = pending.version
+
+        try:
+            value: Any = load()
+        except Exception:
+            with self._lock:
+                self._finish(key, pending)
+            raise
+
+        with self._lock:
+            self._finish(key, pending)
+            # Don't store a value that was loaded before the key was invalidated, it may already be outdated.
+            if version == pending.version:
+                self._store(key, value)
+
+        return value
+
+    def _finish(self, key: Hashable, pending: _PendingLoad) -> None:
+        pending.count -= 1
+        if not pending.count:
+            del self._pending[key]
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        if self._group is not None:
+            self._groups.setdefault(self._group(key), set()).add(key)
+
+        while len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: Hashable) -> None:
+        if self._entries.pop(key, None) is None or self._group is None:
+            return
+
+        group: Hashable = self._group(key)
+        keys: Set[Hashable] = self._groups[group]
+        keys.discard(key)
+        if not keys:
+            del self._groups[group]
+
+    def _outdate(self, key: Hashable) -> None:
+        pending: Optional[_PendingLoad] = self._pending.get(key)
+        if pending is not None:
+            pending.version += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Drops the entry of a key.
+        :param key: The key
+        """
+
+        with self._lock:
+            self._outdate(key)
+            self._drop(key)
+
+    def invalidate_group(self, group: Hashable) -> None:
+        """
+        Drops all entries of a group.
+        :param group: The group
+        """
+
+        with self._lock:
+            for key in self._pending:
+                if self._group(key) == group:
+                    self._outdate(key)
+            for key in list(self._groups.get(group, ())):
+                self._drop(key)
+
+    def clear(self) -> None:
+        """
+        Drops all entries and resets the hit and miss counters.
+        """
+
+        with self._lock:
+            for key in self._pending:
+                self._outdate(key)
+            self._entries.clear()
+            self._groups.clear()
+            self.hits = self.misses = 0
+
+    def info(self) -> Dict[str, Any]:
+        """
+        Describes the current state of the cache.
+        :return: The number of entries, hits and misses and the hit rate
+        """
+
+        with self._lock:
+            lookups: int = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
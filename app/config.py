@@ -0,0 +1,26 @@
+import os
+
+# A service is only sent a new allocation if one of its resources changes by more than this.
+SCALE_EPSILON: float = float(os.environ.get("SCALE_EPSILON", "0.001"))
+
+# Decisions whether a user who doesn't own a device may access it are cached for this many seconds.
+ACCESS_CACHE_TTL: float = float(os.environ.get("ACCESS_CACHE_TTL", "10"))
+ACCESS_CACHE_SIZE: int = int(os.environ.get("ACCESS_CACHE_SIZE", "10000"))
+
+# Rows of recently used devices are cached for this many seconds, so lookups by uuid don't hit the database.
+DEVICE_CACHE_TTL: float = float(os.environ.get("DEVICE_CACHE_TTL", "60"))
+DEVICE_CACHE_SIZE: int = int(os.environ.get("DEVICE_CACHE_SIZE", "10000"))
+
+# Batch endpoints of other microservices reject requests for more devices or users than this.
+MAX_BATCH_SIZE: int = int(os.environ.get("MAX_BATCH_SIZE", "1000"))
+
+# The filter of existing device uuids is sized for twice the devices at startup, but at least this many.
+DEVICE_FILTER_CAPACITY: int = int(os.environ.get("DEVICE_FILTER_CAPACITY", "100000"))
+DEVICE_FILTER_ERROR_RATE: float = float(os.environ.get("DEVICE_FILTER_ERROR_RATE", "0.01"))
+
+# Usage and service allocations are kept in memory and written to the database at this interval.
+# In strict mode they are read from and written to the database on every call instead.
+WORKLOAD_LEDGER_STRICT: bool = os.environ.get("WORKLOAD_LEDGER_STRICT", "false").lower() in ("1", "true")
+WORKLOAD_FLUSH_INTERVAL: float = float(os.environ.get("WORKLOAD_FLUSH_INTERVAL", "1"))
+# Devices without unwritten changes are dropped from memory after they haven't been used for this many seconds.
+WORKLOAD_IDLE_TIMEOUT: float = float(os.environ.get("WORKLOAD_IDLE_TIMEOUT", "300"))
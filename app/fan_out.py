@@ -0,0 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from typing import Callable, Any, List
+
+MAX_WORKERS = 8
+
+_executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="fan-out")
+
+
+def fan_out(*calls: Callable[[], Any]) -> List[Any]:
+    """
+    Runs independent calls (e.g. contact_microservice requests) concurrently on a bounded thread pool.
+    The calls must not use the database session, as it is bound to the calling thread.
+    :param calls: The calls to run
+    :return: The results of the calls in the given order
+    :raises Exception: The first error raised by a call, after all calls have finished
+    """
+
+    if len(calls) <= 1:
+        return [call() for call in calls]
+
+    futures: List[Future] = [_executor.submit(call) for call in calls]
+    wait(futures)
+
+    return [future.result() for future in futures]
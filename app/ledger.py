@@ -0,0 +1,366 @@
+import time
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Set
+
+import stats
+from app import m, wrapper
+from models.service import Service
+from models.workload import Workload
+from resource_vector import ResourceVector
+
+
+class DeviceWorkload:
+    """
+    The workload of a device together with the services running on it.
+    Changes of the usage or of the services must be made while holding the lock.
+    """
+
+    def __init__(self, workload: Workload, services: List[Service]):
+        self.workload: Workload = workload
+        self.services: Dict[str, Service] = {service.service_uuid: service for service in services}
+        self.lock: Lock = Lock()
+
+
+class WorkloadLedger:
+    """
+    Keeps the workloads and services of the devices in use in memory and writes changes to the database
+    in batches (write-behind). In strict mode every device is loaded from the database on each call and changes
+    are written in the current transaction.
+    This assumes that only one instance of this microservice changes the workloads of a database.
+    """
+
+    def __init__(self, strict: bool, flush_interval: float, idle_timeout: float):
+        self.strict: bool = strict
+        self.flush_interval: float = flush_interval
+        self.idle_timeout: float = idle_timeout
+
+        self._lock: Lock = Lock()
+        self._flush_lock: Lock = Lock()
+        self._devices: Dict[str, DeviceWorkload] = {}
+        self._last_used: Dict[str, float] = {}
+        self._service_devices: Dict[str, str] = {}
+        self._persisted: Set[str] = set()
+        self._changed_devices: Set[str] = set()
+        self._changed_services: Set[str] = set()
+
+    def device(self, device_uuid: str) -> Optional[DeviceWorkload]:
+        """
+        Returns the workload of a device and loads it on first use.
+        :param device_uuid: The uuid of the device
+        :return: The workload or None if the device doesn't exist
+        """
+
+        if self.strict:
+            return self._load(device_uuid)
+
+        with self._lock:
+            device: Optional[DeviceWorkload] = self._devices.get(device_uuid)
+            if device is not None:
+                self._last_used[device_uuid] = time.monotonic()
+                return device
+
+        device = self._load(device_uuid)
+        if device is None:
+            return None
+
+        wrapper.session.expunge(device.workload)
+        for service in device.services.values():
+            wrapper.session.expunge(service)
+
+        with self._lock:
+            if device_uuid in self._devices:
+                return self._devices[device_uuid]
+
+            self._devices[device_uuid] = device
+            self._last_used[device_uuid] = time.monotonic()
+            for service_uuid in device.services:
+                self._service_devices[service_uuid] = device_uuid
+                self._persisted.add(service_uuid)
+
+        return device
+
+    def cached(self, device_uuid: str) -> Optional[DeviceWorkload]:
+        """
+        Returns the workload of a device if it is held in memory, without loading it.
+        :param device_uuid: The uuid of the device
+        :return: The workload or None if the device isn't held
+        """
+
+        if self.strict:
+            return None
+
+        with self._lock:
+            return self._devices.get(device_uuid)
+
+    def find_service(self, service_uuid: str) -> Optional[DeviceWorkload]:
+        """
+        Finds the device a service is running on.
+        :param service_uuid: The uuid of the service
+        :return: The workload of the device or None if the service isn't running
+        """
+
+        if not self.strict:
+            with self._lock:
+                device_uuid: Optional[str] = self._service_devices.get(service_uuid)
+                if device_uuid is None and service_uuid in self._persisted:
+                    # stopped, but not deleted from the database yet
+                    return None
+            if device_uuid is not None:
+                return self.device(device_uuid)
+
+        service: Optional[Service] = wrapper.session.query(Service).get(service_uuid)
+        if service is None:
+            return None
+
+        return self.device(service.device_uuid)
+
+    def add_service(self, device: DeviceWorkload, service_uuid: str, allocation: ResourceVector) -> Service:
+        """
+        Starts a service on a device and adds its allocation to the usage.
+        :param device: The workload of the device
+        :param service_uuid: The uuid of the service
+        :param allocation: The allocation of the service
+        :return: The new service
+        """
+
+        service: Service = Service(service_uuid=service_uuid, device_uuid=device.workload.uuid)
+        service.overwrite(allocation)
+        device.services[service_uuid] = service
+
+        if self.strict:
+            wrapper.session.add(service)
+        else:
+            with self._lock:
+                self._service_devices[service_uuid] = device.workload.uuid
+                self._changed_services.add(service_uuid)
+
+        self._use(device, allocation)
+
+        return service
+
+    def remove_service(self, device: DeviceWorkload, service_uuid: str) -> Service:
+        """
+        Stops a service on a device and subtracts its allocation from the usage.
+        :param device: The workload of the device
+        :param service_uuid: The uuid of the service
+        :return: The stopped service
+        """
+
+        if self.strict:
+            service: Service = device.services.pop(service_uuid)
+            wrapper.session.delete(service)
+        else:
+            with self._lock:
+                self._service_devices.pop(service_uuid, None)
+                self._changed_services.add(service_uuid)
+            service: Service = device.services.pop(service_uuid)
+
+        self._use(device, -service.export())
+
+        return service
+
+    def scale_service(self, device: DeviceWorkload, service_uuid: str, allocation: ResourceVector) -> Service:
+        """
+        Changes the allocation of a service and the usage of its device accordingly.
+        :param device: The workload of the device
+        :param service_uuid: The uuid of the service
+        :param allocation: The new allocation of the service
+        :return: The service
+        """
+
+        service: Service = device.services[service_uuid]
+        change: ResourceVector = allocation - service.export()
+        service.overwrite(allocation)
+
+        if not self.strict:
+            with self._lock:
+                self._changed_services.add(service_uuid)
+
+        self._use(device, change)
+
+        return service
+
+    def _use(self, device: DeviceWorkload, change: ResourceVector) -> None:
+        if self.strict:
+            device.workload.service(change)
+            return
+
+        device.workload.usage += change
+
+        with self._lock:
+            self._changed_devices.add(device.workload.uuid)
+
+    def evict(self, device_uuids: List[str]) -> List[str]:
+        """
+        Drops devices from the ledger together with their changes which have not been written yet.
+        This must be called before the workloads or services of these devices are changed in the database directly.
+        :param device_uuids: The uuids of the devices
+        :return: The uuids of the services which were running on the devices
+        """
+
+        service_uuids: List[str] = []
+        with self._flush_lock, self._lock:
+            for device_uuid in device_uuids:
+                self._changed_devices.discard(device_uuid)
+                service_uuids += self._drop(device_uuid)
+
+        return service_uuids
+
+    def _drop(self, device_uuid: str) -> List[str]:
+        device: Optional[DeviceWorkload] = self._devices.pop(device_uuid, None)
+        self._last_used.pop(device_uuid, None)
+        if device is None:
+            return []
+
+        service_uuids: List[str] = list(device.services)
+        for service_uuid in service_uuids:
+            self._service_devices.pop(service_uuid, None)
+            self._changed_services.discard(service_uuid)
+            self._persisted.discard(service_uuid)
+
+        return service_uuids
+
+    def _drop_idle(self) -> int:
+        idle_since: float = time.monotonic() - self.idle_timeout
+        dropped: int = 0
+        with self._lock:
+            for device_uuid, last_used in list(self._last_used.items()):
+                device: DeviceWorkload = self._devices[device_uuid]
+                if (
+                    last_used > idle_since
+                    or device_uuid in self._changed_devices
+                    or device.lock.locked()
+                    or any(service_uuid in self._changed_services for service_uuid in device.services)
+                ):
+                    continue
+
+                self._drop(device_uuid)
+                dropped += 1
+
+        return dropped
+
+    def flush(self) -> int:
+        """
+        Writes the changed workloads and services to the database in one transaction
+        and afterwards drops the devices which have been idle for longer than the idle timeout.
+        :return: The number of written rows
+        """
+
+        if self.strict:
+            return 0
+
+        with self._flush_lock:
+            with self._lock:
+                changed_devices, self._changed_devices = self._changed_devices, set()
+                changed_services, self._changed_services = self._changed_services, set()
+
+                workloads: List[dict] = []
+                for device_uuid in changed_devices:
+                    if device_uuid not in self._devices:
+                        continue
+
+                    usage: ResourceVector = self._devices[device_uuid].workload.usage
+                    workloads.append(
+                        {
+                            "uuid": device_uuid,
+                            "usage_cpu": usage.cpu,
+                            "usage_ram": usage.ram,
+                            "usage_gpu": usage.gpu,
+                            "usage_disk": usage.disk,
+                            "usage_network": usage.network,
+                        }
+                    )
+
+                inserted: List[dict] = []
+                updated: List[dict] = []
+                deleted: List[str] = []
+                for service_uuid in changed_services:
+                    device_uuid: Optional[str] = self._service_devices.get(service_uuid)
+                    if device_uuid is None:
+                        if service_uuid in self._persisted:
+                            deleted.append(service_uuid)
+                        continue
+
+                    # the device may have been evicted while the service was changed
+                    service: Optional[Service] = (
+                        self._devices[device_uuid].services.get(service_uuid) if device_uuid in self._devices else None
+                    )
+                    if service is None:
+                        continue
+
+                    row: dict = {
+                        "service_uuid": service_uuid,
+                        "device_uuid": device_uuid,
+                        "allocated_cpu": service.allocated_cpu,
+                        "allocated_ram": service.allocated_ram,
+                        "allocated_gpu": service.allocated_gpu,
+                        "allocated_disk": service.allocated_disk,
+                        "allocated_network": service.allocated_network,
+                    }
+                    (updated if service_uuid in self._persisted else inserted).append(row)
+
+            try:
+                if deleted:
+                    wrapper.session.query(Service).filter(Service.service_uuid.in_(deleted)).delete(
+                        synchronize_session=False
+                    )
+                if inserted:
+                    wrapper.session.bulk_insert_mappings(Service, inserted)
+                if updated:
+                    wrapper.session.bulk_update_mappings(Service, updated)
+                if workloads:
+                    wrapper.session.bulk_update_mappings(Workload, workloads)
+                wrapper.session.commit()
+            except Exception:
+                wrapper.session.rollback()
+                with self._lock:
+                    self._changed_devices |= changed_devices
+                    self._changed_services |= changed_services
+                raise
+
+            with self._lock:
+                self._persisted |= {row["service_uuid"] for row in inserted}
+                self._persisted -= set(deleted)
+
+            # Only devices without unwritten changes are dropped, so nothing is lost.
+            dropped: int = self._drop_idle()
+
+        written: int = len(workloads) + len(inserted) + len(updated) + len(deleted)
+        if written:
+            stats.increment("workload_rows_flushed", written)
+        if dropped:
+            stats.increment("workload_devices_dropped", dropped)
+
+        return written
+
+    def _load(self, device_uuid: str) -> Optional[DeviceWorkload]:
+        workload: Optional[Workload] = wrapper.session.query(Workload).get(device_uuid)
+        if workload is None:
+            return None
+
+        return DeviceWorkload(workload, wrapper.session.query(Service).filter_by(device_uuid=device_uuid).all())
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+
+            try:
+                self.flush()
+            except Exception as e:
+                m.debug.capture_exception(e)
+            finally:
+                wrapper.Session.remove()
+
+    def start(self) -> Optional[Thread]:
+        """
+        Starts the background thread which writes the changes at the flush interval. Nothing is started in strict mode.
+        :return: The flush thread
+        """
+
+        if self.strict:
+            return None
+
+        thread: Thread = Thread(target=self._run, name="workload-ledger", daemon=True)
+        thread.start()
+
+        return thread
@@ -1,9 +1,25 @@
+import atexit
+import signal
+import sys
+
 import app
+import migrations
+import outbox
 
 if __name__ == "__main__":
     from resources.device import *
     from resources.file import *
     from resources.hardware import *
+    from models.device import Device
+    from resources.game_content import workloads, track_allocations
 
     app.wrapper.Base.metadata.create_all(bind=wrapper.engine)
+    migrations.upgrade(wrapper.engine)
+    Device.build_filter()
+    wrapper.Session.remove()
+    outbox.start_dispatcher()
+    track_allocations()
+    workloads.start()
+    atexit.register(workloads.flush)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     app.m.run()
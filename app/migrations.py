@@ -0,0 +1,154 @@
+from typing import Dict, Optional, List, Tuple, Set, Callable
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex, DropIndex
+
+from app import wrapper
+
+VERSION_TABLE = "device_schema_version"
+
+
+def upgrade(engine: Engine) -> None:
+    """
+    Brings the tables of an existing database up to date with the models.
+    Every migration runs once in its own transaction and is recorded in the version table.
+    :param engine: The database engine
+    """
+
+    with engine.begin() as connection:
+        connection.execute(text(f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (version INTEGER NOT NULL)"))
+        version: int = connection.execute(text(f"SELECT MAX(version) FROM {VERSION_TABLE}")).scalar() or 0
+
+    for number, migration in enumerate(MIGRATIONS, 1):
+        if number <= version:
+            continue
+
+        with engine.begin() as connection:
+            migration(connection)
+            connection.execute(text(f"INSERT INTO {VERSION_TABLE} (version) VALUES (:version)"), version=number)
+
+
+def get_columns(connection: Connection, table: str) -> Set[str]:
+    """
+    Lists the names of the columns of a table.
+    :param connection: The database connection
+    :param table: The name of the table
+    :return: The column names
+    """
+
+    return {column["name"] for column in inspect(connection).get_columns(table)}
+
+
+def add_file_lineage(connection: Connection) -> None:
+    """
+    Adds the lineage column to device_file and fills it for all files which don't have one yet.
+    :param connection: The database connection
+    """
+
+    if "lineage" not in get_columns(connection, "device_file"):
+        connection.execute(text("ALTER TABLE device_file ADD COLUMN lineage TEXT"))
+
+    files: Dict[str, Tuple[Optional[str], Optional[str]]] = {
+        uuid: (parent_dir_uuid, lineage)
+        for uuid, parent_dir_uuid, lineage in connection.execute(
+            text("SELECT uuid, parent_dir_uuid, lineage FROM device_file")
+        )
+    }
+    lineages: Dict[str, str] = {uuid: lineage for uuid, (_, lineage) in files.items() if lineage is not None}
+
+    def build_lineage(uuid: str) -> str:
+        chain: List[str] = []
+        while uuid not in lineages:
+            chain.append(uuid)
+            parent_dir_uuid: Optional[str] = files[uuid][0]
+            if parent_dir_uuid not in files or parent_dir_uuid in chain:
+                lineages[uuid] = uuid + "/"
+                chain.pop()
+                break
+            uuid = parent_dir_uuid
+
+        for child in reversed(chain):
+            lineages[child] = lineages[uuid] + child + "/"
+            uuid = child
+
+        return lineages[uuid]
+
+    missing: List[dict] = [
+        {"uuid": uuid, "lineage": build_lineage(uuid)} for uuid, (_, lineage) in files.items() if lineage is None
+    ]
+    if missing:
+        connection.execute(text("UPDATE device_file SET lineage = :lineage WHERE uuid = :uuid"), missing)
+
+
+def split_file_content(connection: Connection) -> None:
+    """
+    Moves the contents of all files from device_file to device_file_content and drops the old column.
+    :param connection: The database connection
+    """
+
+    if "content" not in get_columns(connection, "device_file"):
+        return
+
+    connection.execute(
+        text(
+            "INSERT INTO device_file_content (file_uuid, device, content) "
+            "SELECT uuid, device, content FROM device_file "
+            "WHERE NOT is_directory AND uuid NOT IN (SELECT file_uuid FROM device_file_content)"
+        )
+    )
+    connection.execute(text("ALTER TABLE device_file DROP COLUMN content"))
+
+
+def create_indexes(connection: Connection) -> None:
+    """
+    Creates all indexes declared on the models which don't exist yet.
+    :param connection: The database connection
+    """
+
+    for table in wrapper.Base.metadata.sorted_tables:
+        existing: Set[str] = {index["name"] for index in inspect(connection).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+
+
+def widen_outbox_next_attempt(connection: Connection) -> None:
+    """
+    Stores the retry times of the outbox in double precision, a single precision float is off by up to a minute.
+    :param connection: The database connection
+    """
+
+    if connection.dialect.name == "mysql":
+        connection.execute(text("ALTER TABLE device_outbox MODIFY next_attempt DOUBLE NOT NULL"))
+
+
+def bound_file_lineage(connection: Connection) -> None:
+    """
+    Turns the lineage of device_file into a bounded column which is indexed as a whole instead of by a prefix.
+    This fails if a file is nested deeper than the new column allows.
+    :param connection: The database connection
+    """
+
+    if connection.dialect.name != "mysql":
+        return
+
+    table = wrapper.Base.metadata.tables["device_file"]
+    index = next(index for index in table.indexes if index.name == "ix_device_file_device_lineage")
+    existing: Set[str] = {other["name"] for other in inspect(connection).get_indexes(table.name)}
+    if index.name in existing:
+        connection.execute(DropIndex(index))
+
+    column_type: str = table.c.lineage.type.compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE device_file MODIFY lineage {column_type}"))
+    connection.execute(CreateIndex(index))
+
+
+# Never reorder or remove entries, the position of a migration is its version.
+MIGRATIONS: List[Callable[[Connection], None]] = [
+    add_file_lineage,
+    split_file_content,
+    create_indexes,
+    widen_outbox_next_attempt,
+    bound_file_lineage,
+]
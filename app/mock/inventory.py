@@ -0,0 +1,50 @@
+from collections import Counter
+from typing import Dict, List, Tuple
+
+
+class Inventory:
+    """
+    A local stand-in for the inventory microservice.
+    Use an instance as side effect of contact_microservice; requests to other microservices are answered with {}.
+    """
+
+    def __init__(self, items: Dict[str, List[str]] = None):
+        self.items: Dict[str, Counter] = {owner: Counter(item_names) for owner, item_names in (items or {}).items()}
+        self.requests: List[Tuple[str, ...]] = []
+
+    def __call__(self, ms: str, endpoint: List[str], data: dict) -> dict:
+        if ms != "inventory":
+            return {}
+
+        self.requests.append(tuple(endpoint))
+        handler = {
+            ("inventory", "summary"): self.summary,
+            ("inventory", "delete_many_by_name"): self.delete_many_by_name,
+            ("inventory", "create_many"): self.create_many,
+        }.get(tuple(endpoint))
+        if handler is None:
+            return {"error": "unknown_endpoint"}
+
+        return handler(data)
+
+    def get(self, owner: str) -> Counter:
+        return self.items.setdefault(owner, Counter())
+
+    def summary(self, data: dict) -> dict:
+        return {"elements": dict(self.get(data["owner"]))}
+
+    def delete_many_by_name(self, data: dict) -> dict:
+        items: Counter = self.get(data["owner"])
+        wanted: Counter = Counter(data["item_names"])
+        if wanted - items:
+            return {"error": "item_not_found"}
+
+        items.subtract(wanted)
+        self.items[data["owner"]] = +items
+
+        return {"ok": True}
+
+    def create_many(self, data: dict) -> dict:
+        self.get(data["owner"]).update(data["item_names"])
+
+        return {"ok": True}
@@ -1,11 +1,30 @@
 import random
-from typing import Dict, Any, Union, Optional
+from typing import Dict, Any, Union, Optional, List
 from uuid import uuid4
 
-from sqlalchemy import Column, String, Boolean
-from sqlalchemy.sql.expression import func, and_
+from sqlalchemy import Column, String, Boolean, Index, func
+from sqlalchemy.orm import make_transient_to_detached, relationship
+from sqlalchemy.sql.expression import and_
 
+import stats
 from app import m, wrapper
+from bloom import BloomFilter
+from cache import TTLCache
+from config import (
+    ACCESS_CACHE_TTL,
+    ACCESS_CACHE_SIZE,
+    DEVICE_CACHE_TTL,
+    DEVICE_CACHE_SIZE,
+    DEVICE_FILTER_CAPACITY,
+    DEVICE_FILTER_ERROR_RATE,
+)
+
+# Whether a user may access a device they don't own, by (user uuid, device uuid), grouped by device uuid.
+access_cache: TTLCache = TTLCache(ACCESS_CACHE_TTL, ACCESS_CACHE_SIZE, group=lambda key: key[1])
+# The columns of a device (or None if it doesn't exist), by device uuid.
+device_cache: TTLCache = TTLCache(DEVICE_CACHE_TTL, DEVICE_CACHE_SIZE)
+# The uuids of all devices, None until it has been built by Device.build_filter.
+device_filter: Optional[BloomFilter] = None
 
 
 class Device(wrapper.Base):
@@ -14,6 +33,10 @@ class Device(wrapper.Base):
     """
 
     __tablename__: str = "device_device"
+    __table_args__: tuple = (
+        Index("ix_device_device_owner_powered_on", "owner", "powered_on"),
+        Index("ix_device_device_powered_on_uuid", "powered_on", "uuid"),
+    )
 
     uuid: Union[Column, str] = Column(String(36), primary_key=True, unique=True)
     name: Union[Column, str] = Column(String(255), nullable=False)
@@ -21,25 +44,33 @@ class Device(wrapper.Base):
     powered_on: Union[Column, bool] = Column(Boolean, nullable=False, default=False)
     starter_device: Union[Column, bool] = Column(Boolean, nullable=False, default=False)
 
+    # Read only, there are no foreign keys between the tables.
+    hardware = relationship(
+        "Hardware", primaryjoin="Device.uuid == foreign(Hardware.device_uuid)", viewonly=True, lazy="select"
+    )
+    workload = relationship(
+        "Workload", primaryjoin="Device.uuid == foreign(Workload.uuid)", viewonly=True, uselist=False, lazy="select"
+    )
+
     @property
     def serialize(self) -> Dict[str, Any]:
         _: str = self.uuid
         d = self.__dict__.copy()
 
         del d["_sa_instance_state"]
+        d.pop("hardware", None)
+        d.pop("workload", None)
 
         return d
 
     @staticmethod
-    def create_starter_device(user: str, powered_on: bool) -> "Device":
-        return Device.create(user, powered_on, True)
-
-    @staticmethod
-    def create(user: str, powered_on: bool, starter_device: Optional[bool] = False) -> "Device":
+    def create(user: str, powered_on: bool, starter_device: Optional[bool] = False, commit: bool = True) -> "Device":
         """
         Creates a new device.
         :param user: The owner's uuid
         :param powered_on: Is powered on?
+        :param starter_device: Is it the starter device of the user?
+        :param commit: Commit the session, otherwise the device is only added to it
         :return: New Device
         """
 
@@ -72,29 +103,132 @@ class Device(wrapper.Base):
         # Return a new device
         device: Device = Device(uuid=uuid, name=name, owner=user, powered_on=powered_on, starter_device=starter_device)
 
+        if device_filter is not None:
+            device_filter.add(uuid)
+
         wrapper.session.add(device)
-        wrapper.session.commit()
+        if commit:
+            wrapper.session.commit()
 
         return device
 
+    @staticmethod
+    def build_filter() -> None:
+        """
+        Builds the filter of existing device uuids from the database.
+        """
+
+        global device_filter
+
+        count: int = wrapper.session.query(func.count(Device.uuid)).scalar()
+        new_filter: BloomFilter = BloomFilter(max(2 * count, DEVICE_FILTER_CAPACITY), DEVICE_FILTER_ERROR_RATE)
+        for (uuid,) in wrapper.session.query(Device.uuid).yield_per(10000):
+            new_filter.add(uuid)
+
+        device_filter = new_filter
+
+    @staticmethod
+    def might_exist(uuid: str) -> bool:
+        """
+        Checks the filter of existing device uuids.
+        :param uuid: The uuid of the device
+        :return: False if there definitely is no such device
+        """
+
+        if device_filter is None or uuid in device_filter:
+            return True
+
+        stats.increment("device_filter_rejections")
+        return False
+
+    @staticmethod
+    def get(uuid: str) -> Optional["Device"]:
+        """
+        Looks up a device by its uuid.
+        Uuids which are not in the filter of existing devices are rejected without querying the database.
+        The columns are cached, so a cached device is attached to the session without querying the database.
+        :param uuid: The uuid of the device
+        :return: The device or None if there is no such device
+        """
+
+        if not Device.might_exist(uuid):
+            return None
+
+        def load() -> Optional[Dict[str, Any]]:
+            loaded: Optional[Device] = wrapper.session.query(Device).get(uuid)
+            return None if loaded is None else loaded.serialize
+
+        columns: Optional[Dict[str, Any]] = device_cache.get_or_load(uuid, load)
+        if columns is None:
+            return None
+
+        device: Device = Device(**columns)
+        make_transient_to_detached(device)
+
+        return wrapper.session.merge(device, load=False)
+
+    @staticmethod
+    def invalidate_cache(device_uuids: List[str]) -> None:
+        """
+        Drops the cached columns of the given devices. Call this after committing a change to them.
+        :param device_uuids: The uuids of the devices
+        """
+
+        for device_uuid in device_uuids:
+            device_cache.invalidate(device_uuid)
+
     def check_access(self, user: str) -> bool:
         """
-        Check if the uuid has access to this device
+        Check if the uuid has access to this device.
+        Users who don't own the device are looked up in the service microservice and the result is cached.
         :param user:
         :return: The permission
         """
         if user == self.owner:
             return True
 
-        return m.contact_microservice("service", ["check_part_owner"], {"user_uuid": user, "device_uuid": self.uuid})[
-            "ok"
-        ]
+        return access_cache.get_or_load(
+            (user, self.uuid),
+            lambda: m.contact_microservice(
+                "service", ["check_part_owner"], {"user_uuid": user, "device_uuid": self.uuid}
+            )["ok"],
+        )
+
+    @staticmethod
+    def invalidate_access(device_uuids: List[str], user: Optional[str] = None) -> None:
+        """
+        Drops the cached access decisions for the given devices.
+        :param device_uuids: The uuids of the devices
+        :param user: Only drop the decisions for this user
+        """
+
+        if user is not None:
+            for device_uuid in device_uuids:
+                access_cache.invalidate((user, device_uuid))
+            return
+
+        for device_uuid in device_uuids:
+            access_cache.invalidate_group(device_uuid)
 
     @staticmethod
     def random(user: str) -> Optional["Device"]:
-        return (
-            wrapper.session.query(Device)
-            .filter(and_(Device.owner != user, Device.powered_on))
-            .order_by(func.random())
-            .first()
-        )
+        """
+        Picks a random powered on device which is not owned by the given user.
+        Device uuids are random, so a random pivot uuid hits a random position in the (powered_on, uuid) index.
+        The first device at or after the pivot is chosen, wrapping around to the start of the index.
+        This way no query has to sort the whole table.
+        The choice is only approximately uniform: a device is picked with a probability proportional to the gap
+        between its uuid and the previous matching one, so the gaps of filtered out devices add to their successors.
+        :param user: The user's uuid
+        :return: A random device or None if there is no such device
+        """
+
+        pivot: str = str(uuid4())
+
+        devices = wrapper.session.query(Device).filter(and_(Device.owner != user, Device.powered_on))
+
+        device: Optional[Device] = devices.filter(Device.uuid >= pivot).order_by(Device.uuid).first()
+        if device is None:
+            device: Optional[Device] = devices.order_by(Device.uuid).first()
+
+        return device
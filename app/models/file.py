@@ -1,43 +1,65 @@
-from typing import Union, Optional
+from typing import Union, Optional, List, Tuple, Dict
 from uuid import uuid4
 
-from sqlalchemy import Column, String, Boolean
+from sqlalchemy import Column, String, Boolean, Index
+from sqlalchemy.orm import aliased, load_only
+from sqlalchemy.sql.expression import and_, func, literal
 
 from app import wrapper
 
 CONTENT_LENGTH = 255
+DELETE_CHUNK_SIZE = 500
+TREE_PAGE_SIZE = 500
+LIST_PAGE_SIZE = 500
+RESOLVE_DEPTH = 16
+# Every level of a lineage is a uuid followed by a slash.
+LINEAGE_SEGMENT = 37
+# The lineage has to fit into the (device, lineage) index of MySQL (3072 bytes) as a whole, which limits the nesting.
+LINEAGE_DEPTH = 24
+FIELDS = ("uuid", "device", "filename", "content", "is_directory", "parent_dir_uuid")
 
 
 class File(wrapper.Base):
     """
     This is the file-model for cryptic-device.
+    The content of a file is stored separately as FileContent and only loaded on demand.
     """
 
     __tablename__: str = "device_file"
+    __table_args__: tuple = (
+        Index("ix_device_file_device_parent_dir_uuid_filename", "device", "parent_dir_uuid", "filename"),
+        Index("ix_device_file_device_lineage", "device", "lineage"),
+    )
 
     uuid: Union[Column, str] = Column(String(36), primary_key=True, unique=True)
     device: Union[Column, str] = Column(String(36), nullable=False)
     filename: Union[Column, str] = Column(String(255, collation="utf8_bin"), nullable=False)
-    content: Union[Column, str] = Column(String(CONTENT_LENGTH), nullable=False)
     is_directory: Union[Column, bool] = Column(Boolean, nullable=False, default=False)
     parent_dir_uuid: Union[Column, str] = Column(String(36))
 
+    # The uuids of all ancestors and the file itself, from the root directory downwards, each followed by a slash.
+    # The lineage of a file is a prefix of the lineages of all of its descendants.
+    # Files can be nested at most LINEAGE_DEPTH levels deep, so the lineage can be indexed without a prefix length
+    # and the index serves ORDER BY lineage as well.
+    lineage: Union[Column, str] = Column(String(LINEAGE_SEGMENT * LINEAGE_DEPTH, collation="utf8_bin"))
+
     @property
     def serialize(self) -> dict:
         _: str = self.uuid
         d: dict = self.__dict__.copy()
 
         del d["_sa_instance_state"]
+        d.pop("lineage", None)
 
         return d
 
     @staticmethod
-    def create(device: str, filename: str, content: str, parent_dir_uuid: Optional[str], is_directory: bool,) -> "File":
+    def create(device: str, filename: str, content: str, parent_dir: Optional["File"], is_directory: bool) -> "File":
         """
         Creates a new file
         :param device: The device's uuid
         :param filename: The name of the new file
-        :param parent_dir_uuid: The parent directory (uuid) of the new file
+        :param parent_dir: The parent directory of the new file
         :param content: The content of the new file
         :param is_directory: If the new file is a directory
         :return: New File
@@ -50,12 +72,274 @@ class File(wrapper.Base):
             uuid=uuid,
             device=device,
             filename=filename,
-            content=content,
-            parent_dir_uuid=parent_dir_uuid,
+            parent_dir_uuid=parent_dir.uuid if parent_dir is not None else None,
             is_directory=is_directory,
+            lineage=File.child_lineage(parent_dir, uuid),
         )
 
+        file.content = content
+
         wrapper.session.add(file)
+        if not is_directory:
+            wrapper.session.add(FileContent(file_uuid=uuid, device=device, content=content))
         wrapper.session.commit()
 
         return file
+
+    def set_content(self, content: str) -> None:
+        """
+        Stores the content of this file. Directories have no content.
+        :param content: The new content
+        """
+
+        self.content = content
+        if not self.is_directory:
+            wrapper.session.merge(FileContent(file_uuid=self.uuid, device=self.device, content=content))
+
+    def load_content(self) -> str:
+        """
+        Loads the content of this file.
+        :return: The content
+        """
+
+        File.load_contents([self])
+
+        return self.content
+
+    @staticmethod
+    def load_contents(files: List["File"]) -> None:
+        """
+        Loads the contents of many files with one query.
+        :param files: The files
+        """
+
+        uuids: List[str] = [file.uuid for file in files if not file.is_directory]
+        contents: Dict[str, str] = {}
+        if uuids:
+            contents: Dict[str, str] = {
+                file_uuid: content
+                for file_uuid, content in wrapper.session.query(FileContent.file_uuid, FileContent.content).filter(
+                    FileContent.file_uuid.in_(uuids)
+                )
+            }
+
+        for file in files:
+            file.content = contents.get(file.uuid, "")
+
+    @staticmethod
+    def child_lineage(parent_dir: Optional["File"], uuid: str) -> str:
+        """
+        Builds the lineage of a file.
+        :param parent_dir: The parent directory of the file
+        :param uuid: The uuid of the file
+        :return: The lineage
+        """
+
+        return (parent_dir.lineage if parent_dir is not None else "") + uuid + "/"
+
+    @staticmethod
+    def resolve(device: str, path: List[str]) -> Optional["File"]:
+        """
+        Looks up a file by its path, joining one alias of device_file per path segment.
+        Long paths are resolved with one query per RESOLVE_DEPTH segments to keep the joins small.
+        :param device: The device's uuid
+        :param path: The filenames from the root directory down to the file
+        :return: The file or None if the path doesn't exist
+        """
+
+        if not path:
+            return None
+
+        file: Optional[File] = None
+        for start in range(0, len(path), RESOLVE_DEPTH):
+            if file is not None and not file.is_directory:
+                return None
+
+            file = File._resolve_from(device, file, path[start : start + RESOLVE_DEPTH])
+            if file is None:
+                return None
+
+        return file
+
+    @staticmethod
+    def _resolve_from(device: str, parent_dir: Optional["File"], path: List[str]) -> Optional["File"]:
+        files: list = [aliased(File) for _ in path]
+
+        query = wrapper.session.query(files[-1]).filter(
+            files[0].parent_dir_uuid.is_(None) if parent_dir is None else files[0].parent_dir_uuid == parent_dir.uuid
+        )
+        for parent, child in zip(files, files[1:]):
+            query = query.filter(parent.is_directory, child.parent_dir_uuid == parent.uuid)
+        for file, filename in zip(files, path):
+            query = query.filter(file.device == device, file.filename == filename)
+
+        return query.first()
+
+    def is_ancestor_of(self, file: "File") -> bool:
+        """
+        Checks if this file is the given file or one of its ancestors.
+        :param file: The file to check
+        :return: The result
+        """
+
+        return file.lineage.startswith(self.lineage)
+
+    @property
+    def depth(self) -> int:
+        """
+        The number of levels from the root directory down to this file, which is 1 for files in the root directory.
+        """
+
+        return len(self.lineage) // LINEAGE_SEGMENT
+
+    def height(self) -> int:
+        """
+        Counts the levels of the subtree of this file, including the file itself.
+        :return: The height
+        """
+
+        if not self.is_directory:
+            return 1
+
+        longest: int = (
+            wrapper.session.query(func.max(func.length(File.lineage)))
+            .filter(File.device == self.device, File.in_lineage(self.lineage))
+            .scalar()
+        )
+
+        return (longest - len(self.lineage)) // LINEAGE_SEGMENT + 1
+
+    @staticmethod
+    def fits_into(parent_dir: Optional["File"], height: int = 1) -> bool:
+        """
+        Checks if a subtree can be placed in a directory without being nested deeper than LINEAGE_DEPTH levels.
+        :param parent_dir: The directory or None for the root directory
+        :param height: The height of the subtree
+        :return: The result
+        """
+
+        return (parent_dir.depth if parent_dir is not None else 0) + height <= LINEAGE_DEPTH
+
+    @staticmethod
+    def in_lineage(lineage: str):
+        """
+        Matches the files whose lineage starts with the given one, i.e. the file and its descendants.
+        This is written as a range instead of a LIKE, so the (device, lineage) index can be searched with it.
+        :param lineage: The lineage of the topmost file, ending with a slash
+        :return: The filter
+        """
+
+        # A lineage ends with a slash and "0" is the character directly after it.
+        return and_(File.lineage >= lineage, File.lineage < lineage[:-1] + "0")
+
+    def subtree(self) -> List[Tuple[str, Optional[str], bool]]:
+        """
+        Collects this file and all of its descendants with one query.
+        :return: A (uuid, parent_dir_uuid, is_directory) row for every file in the subtree
+        """
+
+        return (
+            wrapper.session.query(File.uuid, File.parent_dir_uuid, File.is_directory)
+            .filter(File.device == self.device, File.in_lineage(self.lineage))
+            .all()
+        )
+
+    @staticmethod
+    def page(
+        device: str, parent_dir_uuid: Optional[str], cursor: Optional[str], limit: int, fields: List[str]
+    ) -> List["File"]:
+        """
+        Lists the files in a directory ordered by filename, loading only the given fields.
+        The uuid, the filename and is_directory are always loaded.
+        :param device: The device's uuid
+        :param parent_dir_uuid: The uuid of the directory or None for the root directory
+        :param cursor: Only files with a greater filename are returned
+        :param limit: The maximum number of files
+        :param fields: The columns to load
+        :return: The files
+        """
+
+        columns: set = {"uuid", "filename", "is_directory", *fields} - {"content"}
+        query = (
+            wrapper.session.query(File)
+            .options(load_only(*[name for name in FIELDS if name in columns]))
+            .filter(File.device == device, File.parent_dir_uuid == parent_dir_uuid)
+        )
+        if cursor is not None:
+            query = query.filter(File.filename > cursor)
+
+        files: List[File] = query.order_by(File.filename).limit(limit).all()
+        if "content" in fields:
+            File.load_contents(files)
+
+        return files
+
+    @staticmethod
+    def tree(device: str, parent_dir: Optional["File"], cursor: Optional[str], limit: int) -> List["File"]:
+        """
+        Lists the files below a directory (or the whole device) in lineage order.
+        Parents always come before their children.
+        :param device: The device's uuid
+        :param parent_dir: The directory to list or None for the root directory
+        :param cursor: Only files with a greater lineage are returned
+        :param limit: The maximum number of files
+        :return: The files
+        """
+
+        query = wrapper.session.query(File).filter(File.device == device)
+        if parent_dir is not None:
+            query = query.filter(File.in_lineage(parent_dir.lineage), File.uuid != parent_dir.uuid)
+        if cursor is not None:
+            query = query.filter(File.lineage > cursor)
+
+        return query.order_by(File.lineage).limit(limit).all()
+
+    def move(self, parent_dir: Optional["File"], filename: str) -> None:
+        """
+        Moves this file and updates the lineages of its subtree with one statement.
+        :param parent_dir: The new parent directory
+        :param filename: The new filename
+        """
+
+        old_lineage: str = self.lineage
+        new_lineage: str = File.child_lineage(parent_dir, self.uuid)
+
+        wrapper.session.query(File).filter(File.device == self.device, File.in_lineage(old_lineage)).update(
+            {
+                File.lineage: literal(new_lineage, String)
+                + func.substr(File.lineage, len(old_lineage) + 1, type_=String)
+            },
+            synchronize_session=False,
+        )
+
+        self.filename = filename
+        self.parent_dir_uuid = parent_dir.uuid if parent_dir is not None else None
+        self.lineage = new_lineage
+
+    @staticmethod
+    def delete_many(device: str, uuids: List[str]) -> None:
+        """
+        Deletes files in chunks of bulk statements.
+        :param device: The device's uuid
+        :param uuids: The uuids of the files to delete
+        """
+
+        for i in range(0, len(uuids), DELETE_CHUNK_SIZE):
+            wrapper.session.query(FileContent).filter(
+                FileContent.device == device, FileContent.file_uuid.in_(uuids[i : i + DELETE_CHUNK_SIZE])
+            ).delete(synchronize_session=False)
+            wrapper.session.query(File).filter(
+                File.device == device, File.uuid.in_(uuids[i : i + DELETE_CHUNK_SIZE])
+            ).delete(synchronize_session=False)
+
+
+class FileContent(wrapper.Base):
+    """
+    This is the content of a file which is no directory.
+    """
+
+    __tablename__: str = "device_file_content"
+
+    file_uuid: Union[Column, str] = Column(String(36), primary_key=True, unique=True)
+    device: Union[Column, str] = Column(String(36), nullable=False, index=True)
+    content: Union[Column, str] = Column(String(CONTENT_LENGTH), nullable=False)
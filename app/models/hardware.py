@@ -1,4 +1,4 @@
-from typing import Union, Dict, Any
+from typing import Union, Dict, Any, List, Tuple
 from uuid import uuid4
 
 from sqlalchemy import Column, String
@@ -14,7 +14,7 @@ class Hardware(wrapper.Base):
     __tablename__: str = "device_hardware"
 
     uuid: Union[str, Column] = Column(String(36), primary_key=True, unique=True)
-    device_uuid: Union[str, Column] = Column(String(36), nullable=False)
+    device_uuid: Union[str, Column] = Column(String(36), nullable=False, index=True)
     hardware_element: Union[str, Column] = Column(String(40), nullable=False)
     hardware_type: Union[str, Column] = Column(String(36), nullable=False)
 
@@ -28,12 +28,24 @@ class Hardware(wrapper.Base):
         return d
 
     @staticmethod
-    def create(device: str, hardware: str, hardware_type: str) -> "Hardware":
-        hardware_element: Hardware = Hardware(
-            uuid=str(uuid4()), device_uuid=device, hardware_element=hardware, hardware_type=hardware_type
+    def create_many(devices: List[str], elements: List[Tuple[str, str]]) -> None:
+        """
+        Inserts the same hardware elements for each of the given devices with one multi-row insert.
+        The session is not committed.
+        :param devices: The uuids of the devices
+        :param elements: The name and type of each hardware element
+        """
+
+        wrapper.session.bulk_insert_mappings(
+            Hardware,
+            [
+                {
+                    "uuid": str(uuid4()),
+                    "device_uuid": device,
+                    "hardware_element": hardware,
+                    "hardware_type": hardware_type,
+                }
+                for device in devices
+                for hardware, hardware_type in elements
+            ],
         )
-
-        wrapper.session.add(hardware_element)
-        wrapper.session.commit()
-
-        return hardware_element
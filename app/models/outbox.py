@@ -0,0 +1,21 @@
+from typing import Union, Optional
+
+from sqlalchemy import Column, Integer, String, Text, Float
+
+from app import wrapper
+
+
+class OutboxMessage(wrapper.Base):
+    """
+    This is the outbox-model for messages to other microservices and users which are sent after commit
+    """
+
+    __tablename__: str = "device_outbox"
+
+    id: Union[int, Column] = Column(Integer, primary_key=True, autoincrement=True)
+    microservice: Union[Optional[str], Column] = Column(String(64))
+    user: Union[Optional[str], Column] = Column(String(36))
+    endpoint: Union[Optional[str], Column] = Column(Text)
+    data: Union[str, Column] = Column(Text, nullable=False)
+    attempts: Union[int, Column] = Column(Integer, nullable=False, default=0)
+    next_attempt: Union[float, Column] = Column(Float(precision=53), nullable=False)
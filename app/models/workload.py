@@ -1,8 +1,9 @@
-from typing import Dict, Any, Union, Tuple
+from typing import Dict, Any, Union
 
 from sqlalchemy import Column, String, Float
 
 from app import wrapper
+from resource_vector import ResourceVector
 
 
 class Workload(wrapper.Base):
@@ -36,14 +37,14 @@ class Workload(wrapper.Base):
         return d
 
     @staticmethod
-    def create(device: str, attributes: Tuple[float, float, float, float, float]) -> "Workload":
+    def create(device: str, attributes: ResourceVector, commit: bool = True) -> "Workload":
         work: Workload = Workload(
             uuid=device,
-            performance_cpu=attributes[0],
-            performance_ram=attributes[1],
-            performance_gpu=attributes[2],
-            performance_disk=attributes[3],
-            performance_network=attributes[4],
+            performance_cpu=attributes.cpu,
+            performance_ram=attributes.ram,
+            performance_gpu=attributes.gpu,
+            performance_disk=attributes.disk,
+            performance_network=attributes.network,
             usage_cpu=0,
             usage_gpu=0,
             usage_ram=0,
@@ -52,26 +53,54 @@ class Workload(wrapper.Base):
         )
 
         wrapper.session.add(work)
-        wrapper.session.commit()
+        if commit:
+            wrapper.session.commit()
 
         return work
 
-    def service(self, new_service: Tuple[float, float, float, float, float]):
-        self.usage_cpu += new_service[0]
-        self.usage_ram += new_service[1]
-        self.usage_gpu += new_service[2]
-        self.usage_disk += new_service[3]
-        self.usage_network += new_service[4]
-        wrapper.session.commit()
+    @property
+    def performance(self) -> ResourceVector:
+        return ResourceVector(
+            self.performance_cpu,
+            self.performance_ram,
+            self.performance_gpu,
+            self.performance_disk,
+            self.performance_network,
+        )
+
+    @property
+    def usage(self) -> ResourceVector:
+        return ResourceVector(self.usage_cpu, self.usage_ram, self.usage_gpu, self.usage_disk, self.usage_network)
+
+    @usage.setter
+    def usage(self, usage: ResourceVector) -> None:
+        self.usage_cpu = usage.cpu
+        self.usage_ram = usage.ram
+        self.usage_gpu = usage.gpu
+        self.usage_disk = usage.disk
+        self.usage_network = usage.network
+
+    def service(self, new_service: ResourceVector):
+        """
+        Adds the given usage to the workload with one atomic UPDATE, so concurrent changes of the same device
+        are not lost. The usage is reloaded when it is read next. The session is not committed.
+        :param new_service: The usage of cpu, ram, gpu, disk and network to add
+        """
+
+        wrapper.session.query(Workload).filter_by(uuid=self.uuid).update(
+            {
+                Workload.usage_cpu: Workload.usage_cpu + new_service.cpu,
+                Workload.usage_ram: Workload.usage_ram + new_service.ram,
+                Workload.usage_gpu: Workload.usage_gpu + new_service.gpu,
+                Workload.usage_disk: Workload.usage_disk + new_service.disk,
+                Workload.usage_network: Workload.usage_network + new_service.network,
+            },
+            synchronize_session=False,
+        )
+        wrapper.session.expire(self, ["usage_cpu", "usage_ram", "usage_gpu", "usage_disk", "usage_network"])
 
     def workload_notification(self, origin: str) -> dict:
         return {"notify-id": "resource-usage", "origin": origin, "device_uuid": self.uuid, "data": self.display()}
 
     def display(self) -> dict:
-        return {
-            "cpu": min(self.usage_cpu / self.performance_cpu, 1),
-            "ram": min(self.usage_ram / self.performance_ram, 1),
-            "gpu": min(self.usage_gpu / self.performance_gpu, 1),
-            "disk": min(self.usage_disk / self.performance_disk, 1),
-            "network": min(self.usage_network / self.performance_network, 1),
-        }
+        return (self.usage / self.performance).clamp(1).to_dict()
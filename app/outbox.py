@@ -0,0 +1,193 @@
+import json
+import time
+from functools import partial
+from threading import Event, Thread
+from typing import List, Optional, Dict, Tuple
+
+from sqlalchemy import event, and_, or_, exists
+from sqlalchemy.orm import Session, aliased
+
+import stats
+from app import m, wrapper
+from fan_out import fan_out
+from models.outbox import OutboxMessage
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 10
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 300.0
+POLL_INTERVAL = 5.0
+
+# (id, microservice, user, endpoint, data) of a message, detached from the database session
+Payload = Tuple[int, Optional[str], Optional[str], Optional[list], dict]
+
+_wakeup: Event = Event()
+
+
+def enqueue_microservice(name: str, endpoint: List[str], data: dict) -> None:
+    """
+    Queues a request to another microservice. It is sent once the current transaction has been committed.
+    :param name: The name of the microservice
+    :param endpoint: The endpoint of the microservice
+    :param data: The data of the request
+    """
+
+    _enqueue(OutboxMessage(microservice=name, endpoint=json.dumps(endpoint), data=json.dumps(data)))
+
+
+def enqueue_user(user: str, data: dict) -> None:
+    """
+    Queues a notification to a user. It is sent once the current transaction has been committed.
+    :param user: The user uuid
+    :param data: The notification
+    """
+
+    _enqueue(OutboxMessage(user=user, data=json.dumps(data)))
+
+
+def _enqueue(message: OutboxMessage) -> None:
+    message.attempts = 0
+    message.next_attempt = time.time()
+
+    wrapper.session.add(message)
+    wrapper.session.info["outbox"] = True
+
+
+def _after_commit(session: Session) -> None:
+    if session.info.pop("outbox", False):
+        _wakeup.set()
+
+
+def _deliver(payloads: List[Payload]) -> Tuple[List[int], Optional[int]]:
+    """
+    Sends the messages of one recipient in order and stops at the first one which fails.
+    :param payloads: The messages
+    :return: The ids of the delivered messages and the id of the failed one
+    """
+
+    delivered: List[int] = []
+    for message_id, microservice, user, endpoint, data in payloads:
+        try:
+            if microservice is not None:
+                m.contact_microservice(microservice, endpoint, data)
+            else:
+                m.contact_user(user, data)
+        except Exception as e:
+            m.debug.capture_exception(e, outbox_message=message_id)
+            return delivered, message_id
+
+        delivered.append(message_id)
+
+    return delivered, None
+
+
+def dispatch() -> int:
+    """
+    Sends the oldest due messages. Messages to different recipients are sent concurrently,
+    messages to the same recipient in the order they were queued.
+    Recipients with a message waiting for its retry are skipped entirely, so a recipient which is down
+    neither blocks the others nor gets its messages out of order.
+    Messages which have failed MAX_ATTEMPTS times are dropped and logged.
+    :return: The number of delivered messages
+    """
+
+    now: float = time.time()
+    waiting = aliased(OutboxMessage)
+    messages: List[OutboxMessage] = (
+        wrapper.session.query(OutboxMessage)
+        .filter(
+            OutboxMessage.next_attempt <= now,
+            ~exists().where(
+                and_(
+                    waiting.next_attempt > now,
+                    # NULL never equals NULL, so only recipients of the same kind are matched
+                    or_(waiting.microservice == OutboxMessage.microservice, waiting.user == OutboxMessage.user),
+                )
+            ),
+        )
+        .order_by(OutboxMessage.id)
+        .limit(BATCH_SIZE)
+        .all()
+    )
+
+    queues: Dict[Tuple[Optional[str], Optional[str]], List[OutboxMessage]] = {}
+    for message in messages:
+        queues.setdefault((message.microservice, message.user), []).append(message)
+
+    batches: List[List[Payload]] = [
+        [
+            (
+                message.id,
+                message.microservice,
+                message.user,
+                json.loads(message.endpoint) if message.endpoint is not None else None,
+                json.loads(message.data),
+            )
+            for message in queue
+        ]
+        for queue in queues.values()
+    ]
+
+    delivered: List[int] = []
+    failed: List[int] = []
+    for sent, failure in fan_out(*[partial(_deliver, batch) for batch in batches]):
+        delivered += sent
+        if failure is not None:
+            failed.append(failure)
+
+    if delivered:
+        wrapper.session.query(OutboxMessage).filter(OutboxMessage.id.in_(delivered)).delete(synchronize_session=False)
+        stats.increment("outbox_delivered", len(delivered))
+
+    for message in messages:
+        if message.id not in failed:
+            continue
+
+        message.attempts += 1
+        stats.increment("outbox_failed")
+        if message.attempts < MAX_ATTEMPTS:
+            message.next_attempt = now + min(RETRY_DELAY * 2 ** (message.attempts - 1), MAX_RETRY_DELAY)
+            continue
+
+        m.debug.warning(
+            "dropping outbox message %s to %s after %s attempts: %s %s",
+            message.id,
+            message.microservice or message.user,
+            message.attempts,
+            message.endpoint,
+            message.data,
+        )
+        wrapper.session.delete(message)
+        stats.increment("outbox_dropped")
+
+    wrapper.session.commit()
+
+    return len(delivered)
+
+
+def _run() -> None:
+    while True:
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+        try:
+            while dispatch() >= BATCH_SIZE:
+                pass
+        except Exception as e:
+            m.debug.capture_exception(e)
+        finally:
+            wrapper.Session.remove()
+
+
+def start_dispatcher() -> Thread:
+    """
+    Starts the background thread which sends queued messages after every commit and retries failed ones.
+    :return: The dispatcher thread
+    """
+
+    event.listen(wrapper.Session, "after_commit", _after_commit)
+
+    thread: Thread = Thread(target=_run, name="outbox", daemon=True)
+    thread.start()
+
+    return thread
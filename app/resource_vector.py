@@ -0,0 +1,128 @@
+from typing import Dict, Iterator, Union
+
+
+class ResourceVector:
+    """
+    An amount of cpu, ram, gpu, disk and network, e.g. the performance of a device or the allocation of a service
+    """
+
+    __slots__ = ("cpu", "ram", "gpu", "disk", "network")
+
+    def __init__(self, cpu: float = 0.0, ram: float = 0.0, gpu: float = 0.0, disk: float = 0.0, network: float = 0.0):
+        self.cpu: float = cpu
+        self.ram: float = ram
+        self.gpu: float = gpu
+        self.disk: float = disk
+        self.network: float = network
+
+    @staticmethod
+    def from_dict(data: dict) -> "ResourceVector":
+        return ResourceVector(data["cpu"], data["ram"], data["gpu"], data["disk"], data["network"])
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"cpu": self.cpu, "ram": self.ram, "gpu": self.gpu, "disk": self.disk, "network": self.network}
+
+    def __iter__(self) -> Iterator[float]:
+        return iter((self.cpu, self.ram, self.gpu, self.disk, self.network))
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ResourceVector):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"ResourceVector({self.cpu}, {self.ram}, {self.gpu}, {self.disk}, {self.network})"
+
+    def __add__(self, other: "ResourceVector") -> "ResourceVector":
+        return ResourceVector(
+            self.cpu + other.cpu,
+            self.ram + other.ram,
+            self.gpu + other.gpu,
+            self.disk + other.disk,
+            self.network + other.network,
+        )
+
+    def __sub__(self, other: "ResourceVector") -> "ResourceVector":
+        return ResourceVector(
+            self.cpu - other.cpu,
+            self.ram - other.ram,
+            self.gpu - other.gpu,
+            self.disk - other.disk,
+            self.network - other.network,
+        )
+
+    def __neg__(self) -> "ResourceVector":
+        return ResourceVector(-self.cpu, -self.ram, -self.gpu, -self.disk, -self.network)
+
+    def __mul__(self, other: Union["ResourceVector", float]) -> "ResourceVector":
+        if isinstance(other, ResourceVector):
+            return ResourceVector(
+                self.cpu * other.cpu,
+                self.ram * other.ram,
+                self.gpu * other.gpu,
+                self.disk * other.disk,
+                self.network * other.network,
+            )
+
+        return ResourceVector(
+            self.cpu * other, self.ram * other, self.gpu * other, self.disk * other, self.network * other
+        )
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other: "ResourceVector") -> "ResourceVector":
+        return ResourceVector(
+            self.cpu / other.cpu,
+            self.ram / other.ram,
+            self.gpu / other.gpu,
+            self.disk / other.disk,
+            self.network / other.network,
+        )
+
+    def clamp(self, upper: float) -> "ResourceVector":
+        """
+        Limits every resource to an upper bound.
+        :param upper: The upper bound
+        :return: The clamped vector
+        """
+
+        return ResourceVector(
+            min(self.cpu, upper),
+            min(self.ram, upper),
+            min(self.gpu, upper),
+            min(self.disk, upper),
+            min(self.network, upper),
+        )
+
+    def scale_down_to(self, capacity: "ResourceVector") -> "ResourceVector":
+        """
+        Calculates the factors which scale this usage down to the capacity where it exceeds it.
+        :param capacity: The available resources
+        :return: capacity / usage for every exceeded resource, 1 for all others
+        """
+
+        return ResourceVector(
+            capacity.cpu / self.cpu if self.cpu > capacity.cpu else 1.0,
+            capacity.ram / self.ram if self.ram > capacity.ram else 1.0,
+            capacity.gpu / self.gpu if self.gpu > capacity.gpu else 1.0,
+            capacity.disk / self.disk if self.disk > capacity.disk else 1.0,
+            capacity.network / self.network if self.network > capacity.network else 1.0,
+        )
+
+    def is_close(self, other: "ResourceVector", epsilon: float) -> bool:
+        """
+        Checks whether no resource differs by more than epsilon.
+        :param other: The other vector
+        :param epsilon: The allowed difference
+        :return: True if the vectors are close
+        """
+
+        return (
+            abs(self.cpu - other.cpu) <= epsilon
+            and abs(self.ram - other.ram) <= epsilon
+            and abs(self.gpu - other.gpu) <= epsilon
+            and abs(self.disk - other.disk) <= epsilon
+            and abs(self.network - other.network) <= epsilon
+        )
@@ -1,25 +1,33 @@
-from typing import List, Optional
+from typing import List, Optional, Dict, Any, Set
 
 from cryptic import register_errors
-from sqlalchemy import func
+from sqlalchemy import func, Column
+from sqlalchemy.orm import joinedload, selectinload
 
+import stats
 from app import m, wrapper
-from models.device import Device
-from models.file import File
+from config import MAX_BATCH_SIZE
+from ledger import DeviceWorkload
+from models.device import Device, access_cache, device_cache
 from models.hardware import Hardware
-from models.service import Service
-from models.workload import Workload
+from outbox import enqueue_microservice
 from resources.errors import device_exists, can_access_device, device_powered_on, is_owner_of_device
 from resources.game_content import (
     check_compatible,
-    calculate_power,
-    create_hardware,
     check_exists,
     delete_items,
+    return_items,
+    get_item_names,
+    compile_build,
+    provision_device,
+    provision_devices,
+    STARTER_TEMPLATE,
     stop_all_service,
     stop_services,
     delete_services,
     delete_files,
+    purge_devices,
+    workloads,
 )
 from schemes import (
     success,
@@ -31,8 +39,10 @@ from schemes import (
     maximum_devices_reached,
     device_not_found,
     device_is_starter_device,
+    items_not_in_inventory,
+    batch_too_large,
+    invalid_user_uuids,
 )
-from vars import hardware
 
 
 @m.user_endpoint(path=["device", "info"], requires=requirement_device)
@@ -79,6 +89,41 @@ def list_devices(data: dict, user: str) -> dict:
     return {"devices": [d.serialize for d in devices]}
 
 
+@m.user_endpoint(path=["device", "dashboard"], requires={})
+def dashboard(data: dict, user: str) -> dict:
+    """
+    Get all devices of a user with their hardware and workload.
+    The workloads are joined and the hardware of all devices is loaded with a single IN query.
+    Workloads which are held in memory may not have been written yet, so they are used instead.
+    :param data: The given data.
+    :param user: The user uuid.
+    :return: The response
+    """
+
+    devices: List[Device] = (
+        wrapper.session.query(Device)
+        .filter_by(owner=user)
+        .options(joinedload(Device.workload), selectinload(Device.hardware))
+        .all()
+    )
+
+    return {
+        "devices": [
+            {**d.serialize, "hardware": [h.serialize for h in d.hardware], "workload": current_workload(d)}
+            for d in devices
+        ]
+    }
+
+
+def current_workload(device: Device) -> Optional[dict]:
+    held: Optional[DeviceWorkload] = workloads.cached(device.uuid)
+    if held is not None:
+        with held.lock:
+            return held.workload.serialize
+
+    return device.workload.serialize if device.workload is not None else None
+
+
 @m.user_endpoint(path=["device", "create"], requires=requirement_build)
 def create_device(data: dict, user: str) -> dict:
     """
@@ -101,17 +146,15 @@ def create_device(data: dict, user: str) -> dict:
     if not comp:
         return message
 
-    performance: tuple = calculate_power(data)
-
-    device: Device = Device.create(user, True)
-
-    Workload.create(device.uuid, performance)
-
-    create_hardware(data, device.uuid)
+    if not delete_items(user, data):
+        return items_not_in_inventory
 
-    delete_items(user, data)
-
-    m.contact_microservice("service", ["device_init"], {"device_uuid": device.uuid, "user": device.owner})
+    try:
+        device: Device = provision_device(user, compile_build(data))
+    except Exception:
+        return_items(user, get_item_names(data))
+        wrapper.session.commit()
+        raise
 
     return device.serialize
 
@@ -130,15 +173,7 @@ def starter_device(data: dict, user: str) -> dict:
     if count > 0:
         return already_own_a_device
 
-    performance: tuple = calculate_power(hardware["start_pc"])
-
-    device: Device = Device.create_starter_device(user, True)
-
-    Workload.create(device.uuid, performance)
-
-    create_hardware(hardware["start_pc"], device.uuid)
-
-    m.contact_microservice("service", ["device_init"], {"device_uuid": device.uuid, "user": device.owner})
+    device: Device = provision_device(user, STARTER_TEMPLATE, True)
 
     return device.serialize
 
@@ -157,13 +192,16 @@ def power(data: dict, user: str, device: Device) -> dict:
     device_uuid: str = data["device_uuid"]
 
     device.powered_on = not device.powered_on
-    wrapper.session.commit()
 
     if not device.powered_on:
-        stop_all_service(device_uuid)
         stop_services(device_uuid)
+        stop_all_service(device_uuid)
+        Device.invalidate_access([device_uuid])
     else:
-        m.contact_microservice("service", ["device_restart"], {"device_uuid": device_uuid, "user": device.owner})
+        enqueue_microservice("service", ["device_restart"], {"device_uuid": device_uuid, "user": device.owner})
+        wrapper.session.commit()
+
+    Device.invalidate_cache([device_uuid])
 
     return device.serialize
 
@@ -185,6 +223,8 @@ def change_name(data: dict, user: str, device: Device) -> dict:
 
     wrapper.session.commit()
 
+    Device.invalidate_cache([device.uuid])
+
     return device.serialize
 
 
@@ -206,21 +246,24 @@ def delete_device(data: dict, user: str, device: Device) -> dict:
         return device_is_starter_device
 
     stop_all_service(device.uuid, delete=True)
-    delete_services(device.uuid)  # Removes all Services in MS_Service
     delete_files(device.uuid)  # remove all files
 
-    for hw in wrapper.session.query(Hardware).filter_by(device_uuid=device.uuid):
-        m.contact_microservice(
-            "inventory",
-            ["inventory", "create"],
-            {"item_name": hw.hardware_element, "owner": device.owner, "related_ms": "device"},
-        )
+    device_uuid: str = device.uuid
+    owner: str = device.owner
+    hardware_elements: List[Hardware] = list(wrapper.session.query(Hardware).filter_by(device_uuid=device_uuid))
+    item_names: List[str] = [hw.hardware_element for hw in hardware_elements]
+    delete_services(device_uuid)  # Removes all Services in MS_Service
+    return_items(owner, item_names)
+    for hw in hardware_elements:
         wrapper.session.delete(hw)
 
     device: Device = wrapper.session.query(Device).get(device.uuid)
     wrapper.session.delete(device)
     wrapper.session.commit()
 
+    Device.invalidate_cache([device_uuid])
+    Device.invalidate_access([device_uuid])
+
     return success
 
 
@@ -241,7 +284,7 @@ def exist(data: dict, microservice: str) -> dict:
     :param microservice: The microservice..
     :return: True or False
     """
-    device: Optional[Device] = wrapper.session.query(Device).get(data["device_uuid"])
+    device: Optional[Device] = Device.get(data["device_uuid"])
 
     return {"exist": device is not None}
 
@@ -258,39 +301,153 @@ def owner(data: dict, microservice: str, device: Device) -> dict:
     return {"owner": device.owner}
 
 
+@m.microservice_endpoint(path=["exist_many"])
+def exist_many(data: dict, microservice: str) -> dict:
+    """
+    Which of the given devices exist?
+    :param data: The given data (device_uuids, at most MAX_BATCH_SIZE).
+    :param microservice: The microservice.
+    :return: True or False by device uuid
+    """
+
+    device_uuids: List[str] = data["device_uuids"]
+    if len(device_uuids) > MAX_BATCH_SIZE:
+        return batch_too_large
+
+    found: Dict[str, Any] = query_many(device_uuids, Device.uuid)
+
+    return {"exist": {device_uuid: device_uuid in found for device_uuid in device_uuids}}
+
+
+@m.microservice_endpoint(path=["ping_many"])
+def ping_many(data: dict, microservice: str) -> dict:
+    """
+    Ping many devices at once. Devices which don't exist are left out.
+    :param data: The given data (device_uuids, at most MAX_BATCH_SIZE).
+    :param microservice: The microservice.
+    :return: Whether the device is online by device uuid
+    """
+
+    if len(data["device_uuids"]) > MAX_BATCH_SIZE:
+        return batch_too_large
+
+    return {"online": query_many(data["device_uuids"], Device.powered_on)}
+
+
+@m.microservice_endpoint(path=["owner_many"])
+def owner_many(data: dict, microservice: str) -> dict:
+    """
+    Get the owners of many devices at once. Devices which don't exist are left out.
+    :param data: The given data (device_uuids, at most MAX_BATCH_SIZE).
+    :param microservice: The microservice.
+    :return: The owner by device uuid
+    """
+
+    if len(data["device_uuids"]) > MAX_BATCH_SIZE:
+        return batch_too_large
+
+    return {"owner": query_many(data["device_uuids"], Device.owner)}
+
+
+def query_many(device_uuids: List[str], column: Column) -> Dict[str, Any]:
+    """
+    Reads one column of many devices with a single query.
+    :param device_uuids: The uuids of the devices
+    :param column: The column to read
+    :return: The value of the column by device uuid
+    """
+
+    device_uuids = [device_uuid for device_uuid in device_uuids if Device.might_exist(device_uuid)]
+    if not device_uuids:
+        return {}
+
+    return {
+        uuid: value for uuid, value in wrapper.session.query(Device.uuid, column).filter(Device.uuid.in_(device_uuids))
+    }
+
+
+@m.microservice_endpoint(path=["starter_device_many"])
+def starter_device_many(data: dict, microservice: str) -> dict:
+    """
+    Create the starter devices of many users at once, e.g. for a wave of new players.
+    Users who already own a device are left out.
+    :param data: The given data (user_uuids, at most MAX_BATCH_SIZE).
+    :param microservice: The microservice.
+    :return: The new device by user uuid
+    """
+
+    user_uuids: List[str] = list(dict.fromkeys(data["user_uuids"]))
+    if len(user_uuids) > MAX_BATCH_SIZE:
+        return batch_too_large
+
+    owners: Set[str] = {
+        owner for owner, in wrapper.session.query(Device.owner).filter(Device.owner.in_(user_uuids)).distinct()
+    }
+    user_uuids = [user_uuid for user_uuid in user_uuids if user_uuid not in owners]
+    if not user_uuids:
+        return {"devices": {}}
+
+    provision_devices(user_uuids, STARTER_TEMPLATE, True)
+
+    # The commit has expired the new devices, so they are reloaded with one query instead of one per device.
+    devices: List[Device] = wrapper.session.query(Device).filter(Device.owner.in_(user_uuids)).all()
+
+    return {"devices": {d.owner: d.serialize for d in devices}}
+
+
 @m.microservice_endpoint(path=["delete_user"])
 def delete_user(data: dict, microservice: str) -> dict:
     """
-    Delete all devices of a user.
+    Delete all devices of one or more users.
 
-    :param data: The given data.
+    :param data: The given data (either user_uuid or user_uuids, at most MAX_BATCH_SIZE).
     :param microservice: The microservice.
     :return: Success or not
     """
 
-    user_uuid: str = data["user_uuid"]
+    user_uuids: List[str] = data["user_uuids"] if "user_uuids" in data else [data["user_uuid"]]
+    if not isinstance(user_uuids, list) or not all(isinstance(user_uuid, str) for user_uuid in user_uuids):
+        return invalid_user_uuids
 
-    for device in wrapper.session.query(Device).filter_by(owner=user_uuid):
+    user_uuids = list(dict.fromkeys(user_uuids))
+    if len(user_uuids) > MAX_BATCH_SIZE:
+        return batch_too_large
 
-        # delete all files stored on the device
-        for file in wrapper.session.query(File).filter_by(device=device.uuid):
-            wrapper.session.delete(file)
+    device_uuids: List[str] = [
+        device_uuid for device_uuid, in wrapper.session.query(Device.uuid).filter(Device.owner.in_(user_uuids))
+    ]
 
-        # delete all hardware used in the device
-        for hardware_element in wrapper.session.query(Hardware).filter_by(device_uuid=device.uuid):
-            wrapper.session.delete(hardware_element)
+    purge_devices(device_uuids)
 
-        # delete all workload entries used for the device
-        for workload_entry in wrapper.session.query(Workload).filter_by(uuid=device.uuid):
-            wrapper.session.delete(workload_entry)
+    wrapper.session.commit()
 
-        # delete all services running on the device
-        for service in wrapper.session.query(Service).filter_by(device_uuid=device.uuid):
-            wrapper.session.delete(service)
+    Device.invalidate_cache(device_uuids)
+    Device.invalidate_access(device_uuids)
 
-        # delete the device itself
-        wrapper.session.delete(device)
+    return success
 
-    wrapper.session.commit()
+
+@m.microservice_endpoint(path=["stats"])
+def get_stats(data: dict, microservice: str) -> dict:
+    """
+    Get the internal counters and cache statistics of this microservice.
+    :param data: The given data.
+    :param microservice: The microservice.
+    :return: The counters and the size and hit rate of each cache
+    """
+
+    return {"stats": stats.snapshot(), "caches": {"access": access_cache.info(), "device": device_cache.info()}}
+
+
+@m.microservice_endpoint(path=["access", "invalidate"])
+def invalidate_access(data: dict, microservice: str) -> dict:
+    """
+    Drop the cached access decisions for a device, e.g. after the part owners of it have changed.
+    :param data: The given data (device_uuid and optionally user_uuid).
+    :param microservice: The microservice.
+    :return: Success
+    """
+
+    Device.invalidate_access([data["device_uuid"]], data.get("user_uuid"))
 
     return success
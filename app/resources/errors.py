@@ -8,7 +8,7 @@ from schemes import device_not_found, permission_denied, device_powered_off, fil
 
 
 def device_exists(data: dict, user: str) -> Device:
-    device: Optional[Device] = wrapper.session.query(Device).get(data["device_uuid"])
+    device: Optional[Device] = Device.get(data["device_uuid"])
 
     if device is None:
         raise MicroserviceException(device_not_found)
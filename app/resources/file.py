@@ -1,11 +1,11 @@
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 
 from cryptic import register_errors
 from sqlalchemy import func
 
 from app import m, wrapper
 from models.device import Device
-from models.file import File
+from models.file import File, TREE_PAGE_SIZE, LIST_PAGE_SIZE, FIELDS
 from resources.errors import device_exists, can_access_device, device_powered_on, file_exists, is_owner_of_device
 from schemes import (
     file_already_exists,
@@ -19,7 +19,12 @@ from schemes import (
     directory_can_not_have_textcontent,
     parent_directory_not_found,
     can_not_move_dir_into_itself,
+    directory_too_deep,
     basic_file_requirement,
+    requirement_file_resolve,
+    requirement_file_tree,
+    requirement_file_page,
+    file_not_found,
 )
 
 
@@ -36,14 +41,70 @@ def list_files(data: dict, user: str, device: Device) -> dict:
 
     parent_dir_uuid = data["parent_dir_uuid"]
 
+    files: List[File] = wrapper.session.query(File).filter_by(device=device.uuid, parent_dir_uuid=parent_dir_uuid).all()
+    File.load_contents(files)
+
+    return {"files": [f.serialize for f in files]}
+
+
+@m.user_endpoint(path=["file", "page"], requires=requirement_file_page)
+@register_errors(device_exists, can_access_device, device_powered_on)
+def list_files_page(data: dict, user: str, device: Device) -> dict:
+    """
+    Get one page of the files in a directory, optionally with only some of their fields.
+    :param data: The given data.
+    :param user: The user uuid.
+    :param device: The device of the files.
+    :return: The response
+    """
+
+    limit: int = data["limit"] if data["limit"] is not None else LIST_PAGE_SIZE
+    fields: List[str] = data["fields"] if data["fields"] is not None else list(FIELDS)
+
+    files: List[File] = File.page(device.uuid, data["parent_dir_uuid"], data["cursor"], limit + 1, fields)
+
+    cursor: Optional[str] = None
+    if len(files) > limit:
+        files: List[File] = files[:limit]
+        cursor: Optional[str] = files[-1].filename
+
     return {
-        "files": [
-            f.serialize
-            for f in wrapper.session.query(File).filter_by(device=device.uuid, parent_dir_uuid=parent_dir_uuid).all()
-        ]
+        "files": [{key: value for key, value in f.serialize.items() if key in fields} for f in files],
+        "cursor": cursor,
     }
 
 
+@m.user_endpoint(path=["file", "tree"], requires=requirement_file_tree)
+@register_errors(device_exists, can_access_device, device_powered_on)
+def tree(data: dict, user: str, device: Device) -> dict:
+    """
+    Get one page of all files below a directory without their content.
+    :param data: The given data.
+    :param user: The user uuid.
+    :param device: The device of the files.
+    :return: The response
+    """
+
+    parent_dir_uuid: Optional[str] = data["parent_dir_uuid"]
+
+    parent_dir: Optional[File] = None
+    if parent_dir_uuid is not None:
+        parent_dir: Optional[File] = (
+            wrapper.session.query(File).filter_by(device=device.uuid, uuid=parent_dir_uuid, is_directory=True).first()
+        )
+        if parent_dir is None:
+            return parent_directory_not_found
+
+    files: List[File] = File.tree(device.uuid, parent_dir, data["cursor"], TREE_PAGE_SIZE + 1)
+
+    cursor: Optional[str] = None
+    if len(files) > TREE_PAGE_SIZE:
+        files: List[File] = files[:TREE_PAGE_SIZE]
+        cursor: Optional[str] = files[-1].lineage
+
+    return {"files": [f.serialize for f in files], "cursor": cursor}
+
+
 @m.user_endpoint(path=["file", "info"], requires=requirement_file)
 @register_errors(device_exists, can_access_device, device_powered_on, file_exists)
 def file_info(data: dict, user: str, device: Device, file: File) -> dict:
@@ -56,6 +117,33 @@ def file_info(data: dict, user: str, device: Device, file: File) -> dict:
     :return: The response
     """
 
+    file.load_content()
+
+    return file.serialize
+
+
+@m.user_endpoint(path=["file", "resolve"], requires=requirement_file_resolve)
+@register_errors(device_exists, can_access_device, device_powered_on)
+def resolve(data: dict, user: str, device: Device) -> dict:
+    """
+    Find a file by its absolute path.
+    :param data: The given data.
+    :param user: The user uuid.
+    :param device: The device of the file.
+    :return: The response
+    """
+
+    path: List[str] = []
+    for segment in data["path"].split("/"):
+        if segment == "..":
+            path: List[str] = path[:-1]
+        elif segment not in ("", "."):
+            path.append(segment)
+
+    file: Optional[File] = File.resolve(device.uuid, path)
+    if file is None:
+        return file_not_found
+
     return file.serialize
 
 
@@ -79,22 +167,13 @@ def move(data: dict, user: str, device: Device, file: File) -> dict:
     if target_dir is None and new_parent_dir_uuid is not None:
         return parent_directory_not_found
 
-    if file.is_directory:
-        parent_to_check: Optional[File] = (
-            wrapper.session.query(File).filter_by(device=device.uuid, uuid=new_parent_dir_uuid).first()
-        )
-        if parent_to_check is not None:
-            while parent_to_check is not None:
-                if parent_to_check.uuid == file.uuid:
-                    return can_not_move_dir_into_itself
-                parent_to_check: Optional[File] = (
-                    wrapper.session.query(File)
-                    .filter_by(device=device.uuid, uuid=parent_to_check.parent_dir_uuid)
-                    .first()
-                )
-
-    file.filename = new_filename
-    file.parent_dir_uuid = new_parent_dir_uuid
+    if file.is_directory and target_dir is not None and file.is_ancestor_of(target_dir):
+        return can_not_move_dir_into_itself
+
+    if not File.fits_into(target_dir, file.height()):
+        return directory_too_deep
+
+    file.move(target_dir, new_filename)
     wrapper.session.commit()
 
     m.contact_user(
@@ -107,6 +186,8 @@ def move(data: dict, user: str, device: Device, file: File) -> dict:
         },
     )
 
+    file.load_content()
+
     return file.serialize
 
 
@@ -126,7 +207,7 @@ def update(data: dict, user: str, device: Device, file: File) -> dict:
     if file.is_directory:
         return directories_can_not_be_updated
 
-    file.content = data["content"]
+    file.set_content(data["content"])
     wrapper.session.commit()
 
     m.contact_user(
@@ -155,28 +236,26 @@ def delete_file(data: dict, user: str, device: Device, file: File) -> dict:
     """
 
     if file.is_directory:
-        stack_to_delete = []
-        dirs = [file]
+        children: Dict[Optional[str], List[Tuple[str, bool]]] = {}
+        for uuid, parent_dir_uuid, is_directory in file.subtree():
+            children.setdefault(parent_dir_uuid, []).append((uuid, is_directory))
+
+        stack_to_delete: List[str] = []
+        dirs: List[str] = [file.uuid]
         while len(dirs) > 0:
             dir_to_check = dirs.pop()
             stack_to_delete.append(dir_to_check)
-            files_in_dir: list = (
-                wrapper.session.query(File).filter_by(device=device.uuid, parent_dir_uuid=dir_to_check.uuid).all()
-            )
-            for child_file in files_in_dir:
-                if child_file.is_directory:
-                    dirs.append(child_file)
+            for child_uuid, child_is_directory in children.get(dir_to_check, []):
+                if child_is_directory:
+                    dirs.append(child_uuid)
                 else:
-                    stack_to_delete.append(child_file)
-    else:
-        stack_to_delete = [file]
+                    stack_to_delete.append(child_uuid)
 
-    deleted_files: List[str] = []
-    while stack_to_delete:
-        file_to_delete = stack_to_delete.pop()
-        wrapper.session.delete(file_to_delete)
-        deleted_files.append(file_to_delete.uuid)
+        deleted_files: List[str] = stack_to_delete[::-1]
+    else:
+        deleted_files: List[str] = [file.uuid]
 
+    File.delete_many(device.uuid, deleted_files)
     wrapper.session.commit()
 
     m.contact_user(
@@ -217,16 +296,19 @@ def create_file(data: dict, user: str, device: Device) -> dict:
     if file_count > 0:
         return file_already_exists
 
-    parent_dir: File = (
+    parent_dir: Optional[File] = (
         wrapper.session.query(File).filter_by(device=device.uuid, uuid=parent_dir_uuid, is_directory=True).first()
     )
     if not parent_dir and parent_dir_uuid is not None:
         return parent_directory_not_found
 
+    if not File.fits_into(parent_dir):
+        return directory_too_deep
+
     if is_directory and content != "":
         return directory_can_not_have_textcontent
 
-    file: File = File.create(device.uuid, filename, content, parent_dir_uuid, is_directory)
+    file: File = File.create(device.uuid, filename, content, parent_dir, is_directory)
 
     m.contact_user(
         user,
@@ -1,13 +1,29 @@
 import math
-from typing import Tuple, List
+from threading import Lock
+from typing import Tuple, List, Dict, Optional, NamedTuple
 
+from sqlalchemy import event
+from sqlalchemy.orm.session import Session, SessionTransaction
+
+import stats
 from app import m, wrapper
+from config import SCALE_EPSILON, WORKLOAD_LEDGER_STRICT, WORKLOAD_FLUSH_INTERVAL, WORKLOAD_IDLE_TIMEOUT
+from ledger import WorkloadLedger
+from models.device import Device
 from models.hardware import Hardware
 from models.service import Service
 from models.workload import Workload
-from models.file import File
+from models.file import File, FileContent
+from outbox import enqueue_microservice
+from resource_vector import ResourceVector
 from vars import hardware
 
+# The allocation each running service has been told last, by service uuid.
+sent_allocations: Dict[str, ResourceVector] = {}
+sent_allocations_lock: Lock = Lock()
+
+workloads: WorkloadLedger = WorkloadLedger(WORKLOAD_LEDGER_STRICT, WORKLOAD_FLUSH_INTERVAL, WORKLOAD_IDLE_TIMEOUT)
+
 
 def check_exists(user: str, elements: dict) -> Tuple[bool, dict]:
     inventory: dict = m.contact_microservice("inventory", ["inventory", "summary"], {"owner": user})["elements"]
@@ -29,14 +45,43 @@ def check_exists(user: str, elements: dict) -> Tuple[bool, dict]:
     return True, {}
 
 
-def delete_items(user: str, elements: dict):
-    for element_type in ("mainboard", "powerPack", "case"):
-        m.contact_microservice(
-            "inventory", ["inventory", "delete_by_name"], {"owner": user, "item_name": elements[element_type]}
-        )
+def get_item_names(elements: dict) -> List[str]:
+    item_names: List[str] = [elements[element_type] for element_type in ("mainboard", "powerPack", "case")]
     for element_type in ("cpu", "gpu", "processorCooler", "disk", "ram"):
-        for element in elements[element_type]:
-            m.contact_microservice("inventory", ["inventory", "delete_by_name"], {"owner": user, "item_name": element})
+        item_names += elements[element_type]
+
+    return item_names
+
+
+def delete_items(user: str, elements: dict) -> bool:
+    """
+    Removes all parts of a build from the inventory of a user with one request.
+    The inventory removes either all of them or none.
+    :param user: The owner of the items
+    :param elements: The build
+    :return: True if the items have been removed
+    """
+
+    response: dict = m.contact_microservice(
+        "inventory", ["inventory", "delete_many_by_name"], {"owner": user, "item_names": get_item_names(elements)}
+    )
+
+    return "error" not in response
+
+
+def return_items(user: str, item_names: List[str]) -> None:
+    """
+    Queues one request which puts hardware back into the inventory of a user.
+    :param user: The owner of the items
+    :param item_names: The names of the items
+    """
+
+    if not item_names:
+        return
+
+    enqueue_microservice(
+        "inventory", ["inventory", "create_many"], {"item_names": item_names, "owner": user, "related_ms": "device"}
+    )
 
 
 def check_element_existence(elements: dict) -> Tuple[bool, dict]:
@@ -150,7 +195,7 @@ def check_compatible(elements: dict) -> Tuple[bool, dict]:
     return True, {}
 
 
-def calculate_power(elements: dict) -> Tuple[float, float, float, float, float]:
+def calculate_power(elements: dict) -> ResourceVector:
     cpu_units: List[str] = elements["cpu"]
     mainboard: str = elements["mainboard"]
     gpu_units: List[str] = elements["gpu"]
@@ -193,102 +238,206 @@ def calculate_power(elements: dict) -> Tuple[float, float, float, float, float]:
 
     network: float = hardware["mainboard"][mainboard]["networkPort"]["speed"]
 
-    return performance_cpu, performance_ram, performance_gpu, disk_speed, network
+    return ResourceVector(performance_cpu, performance_ram, performance_gpu, disk_speed, network)
 
 
-def create_hardware(elements: dict, device_uuid: str) -> None:
-    for element_type in ("mainboard", "powerPack", "case"):
-        Hardware.create(device_uuid, elements[element_type], element_type)
+def list_hardware(elements: dict) -> List[Tuple[str, str]]:
+    hardware_elements: List[Tuple[str, str]] = [
+        (elements[element_type], element_type) for element_type in ("mainboard", "powerPack", "case")
+    ]
     for element_type in ("cpu", "gpu", "processorCooler", "disk", "ram"):
-        for element in elements[element_type]:
-            Hardware.create(device_uuid, element, element_type)
+        hardware_elements += [(element, element_type) for element in elements[element_type]]
+
+    return hardware_elements
+
+
+class BuildTemplate(NamedTuple):
+    """
+    A build compiled into everything which is needed to insert devices with it
+    """
+
+    performance: ResourceVector
+    hardware_elements: List[Tuple[str, str]]
+
+
+def compile_build(elements: dict) -> BuildTemplate:
+    return BuildTemplate(calculate_power(elements), list_hardware(elements))
+
+
+# The start pc never changes at runtime, so it is only compiled once.
+STARTER_TEMPLATE: BuildTemplate = compile_build(hardware["start_pc"])
+
+
+def provision_device(user: str, template: BuildTemplate, starter_device: bool = False) -> Device:
+    """
+    Creates a device with its workload and hardware and queues its initialization in one transaction.
+    If anything fails, the transaction is rolled back and nothing is stored.
+    :param user: The owner of the device
+    :param template: The compiled build
+    :param starter_device: Is it the starter device of the user?
+    :return: The new device
+    """
+
+    return provision_devices([user], template, starter_device)[0]
 
 
-def scale_resources(s: List[Service], scale: Tuple[float, float, float, float, float]):
+def provision_devices(users: List[str], template: BuildTemplate, starter_device: bool = False) -> List[Device]:
+    """
+    Creates one device with the same build for each user in one transaction.
+    The hardware of all devices is inserted with a single multi-row insert.
+    :param users: The owners of the devices
+    :param template: The compiled build
+    :param starter_device: Are they the starter devices of the users?
+    :return: The new devices in the order of the users
+    """
+
+    try:
+        devices: List[Device] = [Device.create(user, True, starter_device, commit=False) for user in users]
+        for device in devices:
+            Workload.create(device.uuid, template.performance, commit=False)
+            enqueue_microservice("service", ["device_init"], {"device_uuid": device.uuid, "user": device.owner})
+        Hardware.create_many([device.uuid for device in devices], template.hardware_elements)
+        wrapper.session.commit()
+    except Exception:
+        wrapper.session.rollback()
+        raise
+
+    return devices
+
+
+def scale_resources(device_uuid: str, s: List[Service], scale: ResourceVector):
+    """
+    Queues one message with the new allocations of all given services of a device to the service microservice.
+    :param device_uuid: The uuid of the device
+    :param s: The services to scale
+    :param scale: The scale factors for cpu, ram, gpu, disk and network
+    """
+
+    services: List[dict] = []
     for service in s:
-        send: dict = {
-            "service_uuid": service.service_uuid,
-            "cpu": scale[0] * service.allocated_cpu,
-            "ram": scale[1] * service.allocated_ram,
-            "gpu": scale[2] * service.allocated_gpu,
-            "disk": scale[3] * service.allocated_disk,
-            "network": scale[4] * service.allocated_network,
-        }
-
-        m.contact_microservice("service", ["hardware", "scale"], send)
-
-
-def generate_scale(
-    data: Tuple[float, float, float, float, float], wl: Workload
-) -> Tuple[float, float, float, float, float]:
-    return (
-        wl.performance_cpu / (wl.usage_cpu + data[0]) if wl.usage_cpu + data[0] > wl.performance_cpu else 1.0,
-        wl.performance_ram / (wl.usage_ram + data[1]) if wl.usage_ram + data[1] > wl.performance_ram else 1.0,
-        wl.performance_gpu / (wl.usage_gpu + data[2]) if wl.usage_gpu + data[2] > wl.performance_gpu else 1.0,
-        wl.performance_disk / (wl.usage_disk + data[3]) if wl.usage_disk + data[3] > wl.performance_disk else 1.0,
-        wl.performance_network / (wl.usage_network + data[4])
-        if wl.usage_network + data[4] > wl.performance_network
-        else 1.0,
-    )
+        allocation: ResourceVector = scale * service.export()
+        if not remember_allocation(service.service_uuid, allocation):
+            continue
+
+        services.append({"service_uuid": service.service_uuid, **allocation.to_dict()})
+
+    if len(services) < len(s):
+        stats.increment("suppressed_scale_updates", len(s) - len(services))
+    if not services:
+        if s:
+            stats.increment("suppressed_scale_messages")
+        return
+
+    enqueue_microservice("service", ["hardware", "scale_many"], {"device_uuid": device_uuid, "services": services})
+
+
+def remember_allocation(service_uuid: str, allocation: ResourceVector) -> bool:
+    """
+    Stores the allocation a service is told about unless it is within SCALE_EPSILON of the last one.
+    The allocation only counts as sent once the current transaction, which queues the message, has been committed.
+    :param service_uuid: The uuid of the service
+    :param allocation: The effective cpu, ram, gpu, disk and network allocation
+    :return: True if the allocation has changed and has to be sent
+    """
+
+    pending: Dict[str, ResourceVector] = wrapper.session.info.setdefault("allocations", {})
+    previous: Optional[ResourceVector] = pending.get(service_uuid)
+    if previous is None:
+        with sent_allocations_lock:
+            previous = sent_allocations.get(service_uuid)
+
+    if previous is not None and previous.is_close(allocation, SCALE_EPSILON):
+        return False
 
+    pending[service_uuid] = allocation
+    return True
 
-def dict2tuple(data: dict) -> Tuple[float, float, float, float, float]:
-    return data["cpu"], data["ram"], data["gpu"], data["disk"], data["network"]
 
+def forget_allocations(service_uuids: List[str]) -> None:
+    """
+    Drops the stored allocations of services which are no longer running.
+    :param service_uuids: The uuids of the services
+    """
 
-def turn(data: Tuple[float, float, float, float, float]) -> Tuple[float, float, float, float, float]:
-    return -1 * data[0], -1 * data[1], -1 * data[2], -1 * data[3], -1 * data[4]
+    pending: Dict[str, ResourceVector] = wrapper.session.info.get("allocations", {})
+    with sent_allocations_lock:
+        for service_uuid in service_uuids:
+            pending.pop(service_uuid, None)
+            sent_allocations.pop(service_uuid, None)
+
+
+def _after_commit(session: Session) -> None:
+    allocations: Dict[str, ResourceVector] = session.info.pop("allocations", {})
+    with sent_allocations_lock:
+        sent_allocations.update(allocations)
+
+
+def _after_transaction_end(session: Session, transaction: SessionTransaction) -> None:
+    # The allocations of a transaction which has been rolled back were never sent.
+    if transaction.parent is None:
+        session.info.pop("allocations", None)
+
+
+def track_allocations() -> None:
+    """
+    Starts recording the allocations of committed transactions as sent.
+    """
+
+    event.listen(wrapper.Session, "after_commit", _after_commit)
+    event.listen(wrapper.Session, "after_transaction_end", _after_transaction_end)
+
+
+def generate_scale(data: ResourceVector, wl: Workload) -> ResourceVector:
+    return (wl.usage + data).scale_down_to(wl.performance)
 
 
 def stop_all_service(device_uuid: str, delete: bool = False) -> None:
-    for obj in wrapper.session.query(Service).filter_by(device_uuid=device_uuid).all():
+    forget_allocations(workloads.evict([device_uuid]))
+    services: List[Service] = wrapper.session.query(Service).filter_by(device_uuid=device_uuid).all()
+    forget_allocations([obj.service_uuid for obj in services])
+    for obj in services:
         wrapper.session.delete(obj)
     wl: Workload = wrapper.session.query(Workload).get(device_uuid)
-    wl.usage_cpu = 0
-    wl.usage_ram = 0
-    wl.usage_gpu = 0
-    wl.usage_disk = 0
-    wl.usage_network = 0
+    wl.usage = ResourceVector()
     if delete:
         wrapper.session.delete(wl)
     wrapper.session.commit()
 
 
 def stop_services(device_uuid: str) -> None:
-    m.contact_microservice("service", ["hardware", "stop"], {"device_uuid": device_uuid})
+    enqueue_microservice("service", ["hardware", "stop"], {"device_uuid": device_uuid})
 
 
 def delete_services(device_uuid: str) -> None:
-    m.contact_microservice("service", ["hardware", "delete"], {"device_uuid": device_uuid})
+    enqueue_microservice("service", ["hardware", "delete"], {"device_uuid": device_uuid})
 
 
 def delete_files(device_uuid: str) -> None:
-    files: list = wrapper.session.query(File).filter_by(device=device_uuid)
-    for file in files:
-        wrapper.session.delete(file)
-
-
-def generate_scale_with_no_new(wl: Workload) -> Tuple[float, float, float, float, float]:
-    return (
-        wl.performance_cpu / wl.usage_cpu if wl.usage_cpu > wl.performance_cpu else 1.0,
-        wl.performance_ram / wl.usage_ram if wl.usage_ram > wl.performance_ram else 1.0,
-        wl.performance_gpu / wl.usage_gpu if wl.usage_gpu > wl.performance_gpu else 1.0,
-        wl.performance_disk / wl.usage_disk if wl.usage_disk > wl.performance_disk else 1.0,
-        wl.performance_network / wl.usage_network if wl.usage_network > wl.performance_network else 1.0,
-    )
+    wrapper.session.query(FileContent).filter_by(device=device_uuid).delete(synchronize_session=False)
+    wrapper.session.query(File).filter_by(device=device_uuid).delete(synchronize_session=False)
 
 
-def calculate_real_use(service_uuid: str) -> dict:
-    service: Service = wrapper.session.query(Service).get(service_uuid)
+def purge_devices(device_uuids: List[str]) -> None:
+    """
+    Deletes the given devices and everything stored on them with one set-based statement per table.
+    :param device_uuids: The uuids of the devices to delete
+    """
 
-    wl: Workload = wrapper.session.query(Workload).get(service.device_uuid)
+    if not device_uuids:
+        return
 
-    scales: Tuple[float, float, float, float, float] = generate_scale_with_no_new(wl)
+    forget_allocations(workloads.evict(device_uuids))
+    wrapper.session.query(FileContent).filter(FileContent.device.in_(device_uuids)).delete(synchronize_session=False)
+    wrapper.session.query(File).filter(File.device.in_(device_uuids)).delete(synchronize_session=False)
+    wrapper.session.query(Hardware).filter(Hardware.device_uuid.in_(device_uuids)).delete(synchronize_session=False)
+    wrapper.session.query(Workload).filter(Workload.uuid.in_(device_uuids)).delete(synchronize_session=False)
+    wrapper.session.query(Service).filter(Service.device_uuid.in_(device_uuids)).delete(synchronize_session=False)
+    wrapper.session.query(Device).filter(Device.uuid.in_(device_uuids)).delete(synchronize_session=False)
 
-    return {
-        "cpu": scales[0] * service.allocated_cpu,
-        "ram": scales[1] * service.allocated_gpu,
-        "gpu": scales[2] * service.allocated_ram,
-        "disk": scales[3] * service.allocated_disk,
-        "network": scales[4] * service.allocated_network,
-    }
+
+def generate_scale_with_no_new(wl: Workload) -> ResourceVector:
+    return wl.usage.scale_down_to(wl.performance)
+
+
+def calculate_real_use(service: Service, wl: Workload) -> dict:
+    return (generate_scale_with_no_new(wl) * service.export()).to_dict()
@@ -1,16 +1,20 @@
-from typing import List, Tuple
+from typing import List, Optional
 
 from app import wrapper, m
+from ledger import DeviceWorkload
+from models.device import Device
 from models.service import Service
-from models.workload import Workload
+from outbox import enqueue_user
+from resource_vector import ResourceVector
 from resources.game_content import (
     check_compatible,
     calculate_power,
     scale_resources,
     generate_scale,
-    dict2tuple,
-    turn,
     calculate_real_use,
+    remember_allocation,
+    forget_allocations,
+    workloads,
 )
 from schemes import (
     requirement_build,
@@ -34,31 +38,36 @@ def build(data: dict, user: str) -> dict:
     if not comp:
         return message
 
-    performance: tuple = calculate_power(data)
+    performance: ResourceVector = calculate_power(data)
 
-    return_message: dict = {"success": True, "performance": performance}
+    return_message: dict = {"success": True, "performance": tuple(performance)}
 
     return return_message
 
 
 @m.user_endpoint(path=["hardware", "resources"], requires=requirement_device)
 def hardware_resources(data: dict, user: str) -> dict:
-    wl: Workload = wrapper.session.query(Workload).get(data["device_uuid"])
+    device: Optional[DeviceWorkload] = workloads.device(data["device_uuid"])
 
-    if wl is None:
+    if device is None:
         return device_not_found
 
-    return wl.serialize
+    return device.workload.serialize
 
 
 @m.user_endpoint(path=["hardware", "process"], requires=requirement_service)
 def hardware_process(data: dict, user: str) -> dict:
     service_uuid: str = data["service_uuid"]
 
-    if wrapper.session.query(Service).get(service_uuid) is None:
+    device: Optional[DeviceWorkload] = workloads.find_service(service_uuid)
+    if device is None:
         return service_not_found
 
-    return calculate_real_use(service_uuid)
+    with device.lock:
+        if service_uuid not in device.services:
+            return service_not_found
+
+        return calculate_real_use(device.services[service_uuid], device.workload)
 
 
 @m.user_endpoint(path=["hardware", "list"], requires={})
@@ -70,97 +79,88 @@ def hardware_list(data: dict, user: str) -> dict:
 def hardware_register(data: dict, microservice: str) -> dict:
     # cpu_requirements, ram_req, gpu_req, disk_req, network_req
 
-    wl: Workload = wrapper.session.query(Workload).get(data["device_uuid"])
+    device: Optional[DeviceWorkload] = workloads.device(data["device_uuid"])
 
-    if wl is None:
+    if device is None:
         return device_not_found
 
-    ser: Service = wrapper.session.query(Service).get(data["service_uuid"])
-
-    if ser is not None:
-        return service_already_running
+    with device.lock:
+        if workloads.find_service(data["service_uuid"]) is not None:
+            return service_already_running
 
-    other: List[Service] = wrapper.session.query(Service).filter_by(device_uuid=data["device_uuid"]).all()
+        other: List[Service] = list(device.services.values())
 
-    new: Tuple[float, float, float, float, float] = dict2tuple(data)
+        new: ResourceVector = ResourceVector.from_dict(data)
 
-    scales: Tuple[float, float, float, float, float] = generate_scale(new, wl)
+        scales: ResourceVector = generate_scale(new, device.workload)
 
-    scale_resources(other, scales)
+        scale_resources(data["device_uuid"], other, scales)
 
-    wl.service(new)
+        ser: Service = workloads.add_service(device, data["service_uuid"], new)
 
-    ser: Service = Service.create(data["device_uuid"], data["service_uuid"], new)
+        allocation: ResourceVector = ser.export() * scales
+        return_value: dict = {"service_uuid": ser.service_uuid, **allocation.to_dict()}
+        remember_allocation(ser.service_uuid, allocation)
 
-    return_value: dict = {
-        "service_uuid": ser.service_uuid,
-        "cpu": ser.allocated_cpu * scales[0],
-        "ram": ser.allocated_ram * scales[1],
-        "gpu": ser.allocated_gpu * scales[2],
-        "disk": ser.allocated_disk * scales[3],
-        "network": ser.allocated_network * scales[4],
-    }
+        enqueue_user(data["user"], device.workload.workload_notification("device-hardware-register"))
+        wrapper.session.commit()
 
-    m.contact_user(data["user"], wl.workload_notification("device-hardware-register"))
+    # Running a service on the device makes its user a part owner, so a cached denial is outdated.
+    Device.invalidate_access([data["device_uuid"]], data["user"])
 
     return return_value
 
 
 @m.microservice_endpoint(path=["hardware", "stop"])
 def hardware_stop(data: dict, microservice: str) -> dict:
-    ser: Service = wrapper.session.query(Service).get(data["service_uuid"])
-    if ser is None:
-        return service_not_running
-
-    wl: Workload = wrapper.session.query(Workload).get(data["device_uuid"])
-    if wl is None:
+    device: Optional[DeviceWorkload] = workloads.device(data["device_uuid"])
+    if device is None:
         return device_not_found
 
-    attributes: Tuple[float, float, float, float, float] = turn(ser.export())
+    with device.lock:
+        if data["service_uuid"] not in device.services:
+            return service_not_running
 
-    wrapper.session.delete(ser)
-    wrapper.session.commit()
+        ser: Service = workloads.remove_service(device, data["service_uuid"])
+        forget_allocations([ser.service_uuid])
 
-    wl.service(attributes)
-    new_scales: Tuple[float, float, float, float, float] = generate_scale(attributes, wl)
+        new_scales: ResourceVector = generate_scale(-ser.export(), device.workload)
 
-    other: List[Service] = wrapper.session.query(Service).filter_by(device_uuid=data["device_uuid"]).all()
-    scale_resources(other, new_scales)
+        other: List[Service] = list(device.services.values())
+        scale_resources(data["device_uuid"], other, new_scales)
 
-    m.contact_user(data["user"], wl.workload_notification("device-hardware-stop"))
+        enqueue_user(data["user"], device.workload.workload_notification("device-hardware-stop"))
+        wrapper.session.commit()
+
+    # The stopped service may have been what made its owner a part owner of the device.
+    Device.invalidate_access([data["device_uuid"]])
 
     return success
 
 
 @m.microservice_endpoint(path=["hardware", "scale"])
 def hardware_scale(data: dict, user: str) -> dict:
-    ser: Service = wrapper.session.query(Service).get(data["service_uuid"])
-    if ser is None:
+    device: Optional[DeviceWorkload] = workloads.device(data["device_uuid"])
+    if device is None:
         return service_not_found
 
-    wl: Workload = wrapper.session.query(Workload).get(data["device_uuid"])
-    other: List[Service] = wrapper.session.query(Service).filter_by(device_uuid=data["device_uuid"]).all()
-
-    wl.service(turn(ser.export()))
+    with device.lock:
+        if data["service_uuid"] not in device.services:
+            return service_not_found
 
-    new: Tuple[float, float, float, float, float] = dict2tuple(data)
+        new: ResourceVector = ResourceVector.from_dict(data)
+        old: ResourceVector = device.services[data["service_uuid"]].export()
 
-    scales: Tuple[float, float, float, float, float] = generate_scale(new, wl)
+        # the usage without the old allocation of the service plus its new one
+        scales: ResourceVector = generate_scale(new - old, device.workload)
 
-    wl.service(new)
-    ser.overwrite(new)
+        ser: Service = workloads.scale_service(device, data["service_uuid"], new)
 
-    scale_resources(other, scales)
+        scale_resources(data["device_uuid"], list(device.services.values()), scales)
 
-    return_value: dict = {
-        "service_uuid": ser.service_uuid,
-        "cpu": ser.allocated_cpu * scales[0],
-        "ram": ser.allocated_ram * scales[1],
-        "gpu": ser.allocated_gpu * scales[2],
-        "disk": ser.allocated_disk * scales[3],
-        "network": ser.allocated_network * scales[4],
-    }
+        return_value: dict = {"service_uuid": ser.service_uuid, **(ser.export() * scales).to_dict()}
 
-    m.contact_user(data["user"], wl.workload_notification("device-hardware-scale"))
+        enqueue_user(data["user"], device.workload.workload_notification("device-hardware-scale"))
+        wrapper.session.commit()
 
     return return_value
@@ -1,6 +1,6 @@
-from scheme import Text, Sequence, UUID, Boolean
+from scheme import Text, Sequence, UUID, Boolean, Integer, Enumeration
 
-from models.file import CONTENT_LENGTH
+from models.file import CONTENT_LENGTH, FIELDS, LIST_PAGE_SIZE
 
 
 def make_error(*args: str, origin: str, sep: str = "") -> dict:
@@ -29,6 +29,8 @@ parent_directory_not_found: dict = make_error("parent_directory_not_found", orig
 
 can_not_move_dir_into_itself: dict = make_error("can_not_move_dir_into_itself", origin="user")
 
+directory_too_deep: dict = make_error("directory_too_deep", origin="user")
+
 service_not_found: dict = make_error("service_not_found", origin="service")
 
 service_already_running: dict = make_error("service_already_running", origin="service")
@@ -37,6 +39,12 @@ service_not_running: dict = make_error("service_not_running", origin="service")
 
 device_is_starter_device: dict = make_error("device_is_starter_device", origin="service")
 
+items_not_in_inventory: dict = make_error("items_not_in_inventory", origin="user")
+
+batch_too_large: dict = make_error("batch_too_large", origin="service")
+
+invalid_user_uuids: dict = make_error("invalid_user_uuids", origin="service")
+
 success: dict = {"ok": True}
 
 requirement_device: dict = {"device_uuid": UUID()}
@@ -77,4 +85,19 @@ requirement_file_create: dict = {
     "parent_dir_uuid": UUID(),
 }
 
+requirement_file_resolve: dict = {
+    "device_uuid": UUID(),
+    "path": Text(pattern=r"^/?([a-zA-Z0-9\-_.]{1,64}/)*[a-zA-Z0-9\-_.]{0,64}$", max_length=1024, strip=False),
+}
+
+requirement_file_page: dict = {
+    "device_uuid": UUID(),
+    "parent_dir_uuid": UUID(),
+    "cursor": Text(max_length=255, strip=False),
+    "limit": Integer(minimum=1, maximum=LIST_PAGE_SIZE),
+    "fields": Sequence(Enumeration(" ".join(FIELDS)), unique=True),
+}
+
+requirement_file_tree: dict = {"device_uuid": UUID(), "parent_dir_uuid": UUID(), "cursor": Text(max_length=65535)}
+
 requirement_service: dict = {"service_uuid": UUID()}
@@ -0,0 +1,36 @@
+from collections import Counter
+from threading import Lock
+from typing import Dict
+
+_lock: Lock = Lock()
+_counters: Counter = Counter()
+
+
+def increment(name: str, amount: int = 1) -> None:
+    """
+    Increases a counter.
+    :param name: The name of the counter
+    :param amount: The amount to add
+    """
+
+    with _lock:
+        _counters[name] += amount
+
+
+def snapshot() -> Dict[str, int]:
+    """
+    Returns the current values of all counters.
+    :return: The counters
+    """
+
+    with _lock:
+        return dict(_counters)
+
+
+def reset() -> None:
+    """
+    Sets all counters back to zero.
+    """
+
+    with _lock:
+        _counters.clear()
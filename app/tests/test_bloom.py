@@ -0,0 +1,37 @@
+from unittest import TestCase
+from uuid import uuid4
+
+from bloom import BloomFilter
+
+
+class TestBloomFilter(TestCase):
+    def test__sizing(self):
+        bloom = BloomFilter(1000, 0.01)
+
+        self.assertEqual(9586, bloom.size)
+        self.assertEqual(7, bloom.hashes)
+
+    def test__no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        elements = [str(uuid4()) for _ in range(1000)]
+
+        for element in elements:
+            bloom.add(element)
+
+        self.assertTrue(all(element in bloom for element in elements))
+
+    def test__false_positive_rate(self):
+        bloom = BloomFilter(1000, 0.01)
+        for _ in range(1000):
+            bloom.add(str(uuid4()))
+
+        false_positives = sum(str(uuid4()) in bloom for _ in range(10000))
+
+        self.assertLess(false_positives, 300)
+
+    def test__empty(self):
+        bloom = BloomFilter(0, 0.01)
+
+        self.assertNotIn("foo", bloom)
+        bloom.add("foo")
+        self.assertIn("foo", bloom)
@@ -0,0 +1,129 @@
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from cache import TTLCache
+
+
+class TestTTLCache(TestCase):
+    def setUp(self):
+        time_patcher = patch("cache.time")
+        self.time_patch = time_patcher.start()
+        self.time_patch.monotonic.return_value = 100
+        self.addCleanup(time_patcher.stop)
+
+        self.cache = TTLCache(10, 3)
+
+    def test__get_or_load__miss_and_hit(self):
+        load = MagicMock(return_value="value")
+
+        self.assertEqual("value", self.cache.get_or_load("key", load))
+        self.assertEqual("value", self.cache.get_or_load("key", load))
+
+        load.assert_called_once_with()
+        self.assertEqual({"size": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}, self.cache.info())
+
+    def test__get_or_load__caches_falsy_values(self):
+        load = MagicMock(return_value=False)
+
+        self.assertFalse(self.cache.get_or_load("key", load))
+        self.assertFalse(self.cache.get_or_load("key", load))
+
+        load.assert_called_once_with()
+
+    def test__get_or_load__expired(self):
+        self.cache.get_or_load("key", lambda: "old")
+
+        self.time_patch.monotonic.return_value = 110
+
+        self.assertEqual("new", self.cache.get_or_load("key", lambda: "new"))
+        self.assertEqual({"size": 1, "hits": 0, "misses": 2, "hit_rate": 0.0}, self.cache.info())
+
+    def test__get_or_load__error_is_not_cached(self):
+        with self.assertRaises(TimeoutError):
+            self.cache.get_or_load("key", MagicMock(side_effect=TimeoutError))
+
+        self.assertEqual("value", self.cache.get_or_load("key", lambda: "value"))
+
+    def test__get_or_load__invalidated_while_loading(self):
+        def load():
+            self.cache.invalidate("key")
+            return "stale"
+
+        self.assertEqual("stale", self.cache.get_or_load("key", load))
+        self.assertEqual("fresh", self.cache.get_or_load("key", lambda: "fresh"))
+
+    def test__get_or_load__other_key_invalidated_while_loading(self):
+        def load():
+            self.cache.invalidate("other")
+            return "value"
+
+        self.cache.get_or_load("key", load)
+
+        self.assertEqual("value", self.cache.get_or_load("key", MagicMock()))
+
+    def test__get_or_load__group_invalidated_while_loading(self):
+        cache = TTLCache(10, 3, group=lambda key: key[1])
+
+        def load():
+            cache.invalidate_group("device-1")
+            return "stale"
+
+        cache.get_or_load(("user", "device-1"), load)
+        cache.get_or_load(("user", "device-2"), lambda: cache.invalidate_group("device-1"))
+
+        self.assertEqual({"size": 1, "hits": 0, "misses": 2, "hit_rate": 0.0}, cache.info())
+
+    def test__put__evicts_least_recently_used(self):
+        for key in ("a", "b", "c"):
+            self.cache.get_or_load(key, lambda: key)
+        self.cache.get_or_load("a", MagicMock())
+
+        self.cache.get_or_load("d", lambda: "d")
+
+        self.assertEqual(3, self.cache.info()["size"])
+        self.assertEqual("a", self.cache.get_or_load("a", MagicMock()))
+        self.assertEqual("new b", self.cache.get_or_load("b", lambda: "new b"))
+
+    def test__invalidate(self):
+        self.cache.get_or_load("a", lambda: 1)
+        self.cache.get_or_load("b", lambda: 2)
+
+        self.cache.invalidate("a")
+        self.cache.invalidate("missing")
+
+        self.assertEqual(1, self.cache.info()["size"])
+        self.assertEqual(3, self.cache.get_or_load("a", lambda: 3))
+
+    def test__invalidate_group(self):
+        cache = TTLCache(10, 3, group=lambda key: key[1])
+        cache.get_or_load(("user", "device-1"), lambda: True)
+        cache.get_or_load(("user", "device-2"), lambda: True)
+        cache.get_or_load(("other", "device-1"), lambda: True)
+
+        cache.invalidate_group("device-1")
+        cache.invalidate_group("missing")
+
+        self.assertEqual(1, cache.info()["size"])
+        self.assertEqual({"device-2": {("user", "device-2")}}, cache._groups)
+
+    def test__invalidate_group__evicted_entries(self):
+        cache = TTLCache(10, 2, group=lambda key: key[1])
+        cache.get_or_load(("user", "device-1"), lambda: True)
+        cache.get_or_load(("user", "device-2"), lambda: True)
+        cache.get_or_load(("other", "device-2"), lambda: True)
+
+        self.assertEqual({"device-2": {("user", "device-2"), ("other", "device-2")}}, cache._groups)
+
+        cache.invalidate(("user", "device-2"))
+        cache.invalidate_group("device-2")
+
+        self.assertEqual({}, cache._groups)
+        self.assertEqual(0, cache.info()["size"])
+
+    def test__clear(self):
+        self.cache.get_or_load("a", lambda: 1)
+        self.cache.get_or_load("a", lambda: 1)
+
+        self.cache.clear()
+
+        self.assertEqual({"size": 0, "hits": 0, "misses": 0, "hit_rate": 0.0}, self.cache.info())
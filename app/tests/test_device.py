@@ -1,13 +1,15 @@
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock, call
 
 from mock.mock_loader import mock
-from models.device import Device
-from models.file import File
+from ledger import DeviceWorkload
+from models.device import Device, access_cache, device_cache
+from models.file import File, FileContent
 from models.hardware import Hardware
 from models.service import Service
 from models.workload import Workload
 from resources import device
+from resources.game_content import STARTER_TEMPLATE
 from schemes import (
     permission_denied,
     success,
@@ -15,17 +17,22 @@ from schemes import (
     maximum_devices_reached,
     device_not_found,
     device_is_starter_device,
+    items_not_in_inventory,
+    batch_too_large,
+    invalid_user_uuids,
 )
-from vars import hardware
 
 
 class TestDevice(TestCase):
     def setUp(self):
         mock.reset_mocks()
+        access_cache.clear()
+        device_cache.clear()
 
         self.query_device = mock.MagicMock()
         self.query_hardware = mock.MagicMock()
         self.query_file = mock.MagicMock()
+        self.query_file_content = mock.MagicMock()
         self.query_workload = mock.MagicMock()
         self.query_service = mock.MagicMock()
         device.func = self.sqlalchemy_func = mock.MagicMock()
@@ -34,11 +41,16 @@ class TestDevice(TestCase):
             Device: self.query_device,
             Hardware: self.query_hardware,
             File: self.query_file,
+            FileContent: self.query_file_content,
             Workload: self.query_workload,
             Service: self.query_service,
             self.sqlalchemy_func.count(): self.query_func_count,
         }.__getitem__
 
+        enqueue_patcher = patch("resources.device.enqueue_microservice")
+        self.enqueue_patch = enqueue_patcher.start()
+        self.addCleanup(enqueue_patcher.stop)
+
     def test__user_endpoint__device_info(self):
         hardware = [mock.MagicMock() for _ in range(5)]
         mock_device = mock.MagicMock()
@@ -70,6 +82,42 @@ class TestDevice(TestCase):
         self.assertEqual(expected_result, actual_result)
         self.query_device.filter_by.assert_called_with(owner="user")
 
+    @patch("resources.device.workloads")
+    @patch("resources.device.selectinload")
+    @patch("resources.device.joinedload")
+    def test__user_endpoint__device_dashboard(self, joinedload_patch, selectinload_patch, workloads_patch):
+        devices = [mock.MagicMock() for _ in range(3)]
+        for d in devices:
+            d.hardware = [mock.MagicMock() for _ in range(2)]
+        devices[2].workload = None
+        self.query_device.filter_by().options().all.return_value = devices
+        held = DeviceWorkload(mock.MagicMock(), [])
+        workloads_patch.cached.side_effect = lambda uuid: held if uuid == devices[1].uuid else None
+
+        expected_result = {
+            "devices": [
+                {
+                    **devices[0].serialize,
+                    "hardware": [h.serialize for h in devices[0].hardware],
+                    "workload": devices[0].workload.serialize,
+                },
+                {
+                    **devices[1].serialize,
+                    "hardware": [h.serialize for h in devices[1].hardware],
+                    "workload": held.workload.serialize,
+                },
+                {**devices[2].serialize, "hardware": [h.serialize for h in devices[2].hardware], "workload": None},
+            ]
+        }
+        actual_result = device.dashboard({}, "user")
+
+        self.assertEqual(expected_result, actual_result)
+        self.assertEqual([call(d.uuid) for d in devices], workloads_patch.cached.call_args_list)
+        self.query_device.filter_by.assert_called_with(owner="user")
+        joinedload_patch.assert_called_with(Device.workload)
+        selectinload_patch.assert_called_with(Device.hardware)
+        self.query_device.filter_by().options.assert_called_with(joinedload_patch(), selectinload_patch())
+
     def test__user_endpoint__device_create__maximum_devices_reached(self):
         self.query_func_count.filter_by().scalar.return_value = 3
 
@@ -109,47 +157,73 @@ class TestDevice(TestCase):
         compatible_patch.assert_called_with(data)
         exists_patch.assert_called_with("user", data)
 
-    @patch("resources.device.File")
+    @patch("resources.device.compile_build")
     @patch("resources.device.delete_items")
-    @patch("resources.device.create_hardware")
-    @patch("resources.device.calculate_power")
-    @patch("resources.device.Workload")
-    @patch("resources.device.Device")
+    @patch("resources.device.provision_device")
     @patch("resources.device.check_exists")
     @patch("resources.device.check_compatible")
     def test__user_endpoint__device_create__successful(
-        self,
-        compatible_patch,
-        exists_patch,
-        device_patch,
-        workload_patch,
-        calculate_patch,
-        create_patch,
-        delete_patch,
-        file_patch,
+        self, compatible_patch, exists_patch, provision_patch, delete_patch, compile_patch
     ):
         self.query_func_count.filter_by().scalar.return_value = 2
         compatible_patch.return_value = True, {}
         exists_patch.return_value = True, {}
+        delete_patch.return_value = True
         data = mock.MagicMock()
 
-        mock_device = device_patch.create()
-
-        expected_result = mock_device.serialize
+        expected_result = provision_patch().serialize
         actual_result = device.create_device(data, "user")
 
         self.assertEqual(expected_result, actual_result)
         self.query_func_count.filter_by.assert_called_with(owner="user")
         compatible_patch.assert_called_with(data)
         exists_patch.assert_called_with("user", data)
-        calculate_patch.assert_called_with(data)
-        device_patch.create.assert_called_with("user", True)
-        workload_patch.create.assert_called_with(mock_device.uuid, calculate_patch())
-        create_patch.assert_called_with(data, mock_device.uuid)
         delete_patch.assert_called_with("user", data)
-        mock.m.contact_microservice.assert_called_with(
-            "service", ["device_init"], {"device_uuid": mock_device.uuid, "user": mock_device.owner}
-        )
+        compile_patch.assert_called_with(data)
+        provision_patch.assert_called_with("user", compile_patch())
+
+    @patch("resources.device.compile_build", MagicMock())
+    @patch("resources.device.return_items")
+    @patch("resources.device.delete_items")
+    @patch("resources.device.provision_device")
+    @patch("resources.device.check_exists")
+    @patch("resources.device.check_compatible")
+    def test__user_endpoint__device_create__provisioning_failed(
+        self, compatible_patch, exists_patch, provision_patch, delete_patch, return_patch
+    ):
+        self.query_func_count.filter_by().scalar.return_value = 2
+        compatible_patch.return_value = True, {}
+        exists_patch.return_value = True, {}
+        delete_patch.return_value = True
+        provision_patch.side_effect = RuntimeError
+        data = {"mainboard": "m", "powerPack": "p", "case": "c", "cpu": ["cpu"], "gpu": [], "processorCooler": ["pc"]}
+        data.update({"disk": ["d"], "ram": ["r1", "r2"]})
+
+        with self.assertRaises(RuntimeError):
+            device.create_device(data, "user")
+
+        return_patch.assert_called_with("user", ["m", "p", "c", "cpu", "pc", "d", "r1", "r2"])
+        mock.wrapper.session.commit.assert_called_with()
+
+    @patch("resources.device.delete_items")
+    @patch("resources.device.provision_device")
+    @patch("resources.device.check_exists")
+    @patch("resources.device.check_compatible")
+    def test__user_endpoint__device_create__items_not_in_inventory(
+        self, compatible_patch, exists_patch, provision_patch, delete_patch
+    ):
+        self.query_func_count.filter_by().scalar.return_value = 2
+        compatible_patch.return_value = True, {}
+        exists_patch.return_value = True, {}
+        delete_patch.return_value = False
+        data = mock.MagicMock()
+
+        expected_result = items_not_in_inventory
+        actual_result = device.create_device(data, "user")
+
+        self.assertEqual(expected_result, actual_result)
+        delete_patch.assert_called_with("user", data)
+        provision_patch.assert_not_called()
 
     def test__user_endpoint__device_starter_device__already_own_a_device(self):
         self.query_func_count.filter_by().scalar.return_value = 1
@@ -161,50 +235,41 @@ class TestDevice(TestCase):
         self.sqlalchemy_func.count.assert_called_with(Device.uuid)
         self.query_func_count.filter_by.assert_called_with(owner="user")
 
-    @patch("resources.device.File")
-    @patch("resources.device.create_hardware")
-    @patch("resources.device.calculate_power")
-    @patch("resources.device.Workload")
-    @patch("resources.device.Device.create")
-    def test__user_endpoint__device_starter_device__successful(
-        self, device_create_patch, workload_patch, calculate_patch, create_patch, file_patch
-    ):
+    @patch("resources.device.provision_device")
+    def test__user_endpoint__device_starter_device__successful(self, provision_patch):
         self.query_func_count.filter_by().scalar.return_value = 0
 
-        mock_device = device_create_patch()
-
-        expected_result = mock_device.serialize
+        expected_result = provision_patch().serialize
         actual_result = device.starter_device({}, "user")
 
         self.assertEqual(expected_result, actual_result)
         self.sqlalchemy_func.count.assert_called_with(Device.uuid)
         self.query_func_count.filter_by.assert_called_with(owner="user")
-        calculate_patch.assert_called_with(hardware["start_pc"])
-        device_create_patch.assert_called_with("user", True, True)
-        workload_patch.create.assert_called_with(mock_device.uuid, calculate_patch())
-        create_patch.assert_called_with(hardware["start_pc"], mock_device.uuid)
-        mock.m.contact_microservice.assert_called_with(
-            "service", ["device_init"], {"device_uuid": mock_device.uuid, "user": mock_device.owner}
-        )
+        provision_patch.assert_called_with("user", STARTER_TEMPLATE, True)
 
     def test__user_endpoint__device_power__turn_on(self):
         mock_device = self.query_device.get()
         mock_device.powered_on = False
+        device_cache.get_or_load("my-device", lambda: {"uuid": "my-device"})
 
         expected_result = mock_device.serialize
         actual_result = device.power({"device_uuid": "my-device"}, "user", mock_device)
 
         self.assertEqual(expected_result, actual_result)
         self.assertTrue(mock_device.powered_on)
-        mock.m.contact_microservice.assert_called_with(
+        self.enqueue_patch.assert_called_with(
             "service", ["device_restart"], {"device_uuid": "my-device", "user": mock_device.owner}
         )
+        mock.wrapper.session.commit.assert_called_with()
+        self.assertEqual(0, device_cache.info()["size"])
 
     @patch("resources.device.stop_services")
     @patch("resources.device.stop_all_service")
     def test__user_endpoint__device_power__turn_off(self, stop_all_patch, stop_services_patch):
         mock_device = self.query_device.get()
         mock_device.powered_on = True
+        access_cache.get_or_load(("other-user", "my device"), lambda: True)
+        device_cache.get_or_load("my device", lambda: {"uuid": "my device"})
 
         expected_result = mock_device.serialize
         actual_result = device.power({"device_uuid": "my device"}, "user", mock_device)
@@ -213,9 +278,13 @@ class TestDevice(TestCase):
         self.assertFalse(mock_device.powered_on)
         stop_all_patch.assert_called_with("my device")
         stop_services_patch.assert_called_with("my device")
+        self.assertEqual(0, access_cache.info()["size"])
+        self.assertEqual(0, device_cache.info()["size"])
 
     def test__user_endpoint__device_change_name(self):
         mock_device = mock.MagicMock()
+        mock_device.uuid = "the-device"
+        device_cache.get_or_load("the-device", lambda: {"uuid": "the-device"})
 
         expected_result = mock_device.serialize
         actual_result = device.change_name({"device_uuid": "the-device", "name": "new-name"}, "user", mock_device)
@@ -223,6 +292,7 @@ class TestDevice(TestCase):
         self.assertEqual(expected_result, actual_result)
         self.assertEqual("new-name", mock_device.name)
         mock.wrapper.session.commit.assert_called_with()
+        self.assertEqual(0, device_cache.info()["size"])
 
     def test__user_endpoint__device_delete__permission_denied(self):
         mock_device = mock.MagicMock()
@@ -243,35 +313,23 @@ class TestDevice(TestCase):
 
         self.assertEqual(expected_result, actual_result)
 
+    @patch("resources.device.return_items")
     @patch("resources.device.delete_services")
     @patch("resources.device.stop_all_service")
-    def test__user_endpoint__device_delete__successful(self, sas_patch, ds_patch):
+    def test__user_endpoint__device_delete__successful(self, sas_patch, ds_patch, return_patch):
         mock_device = mock.MagicMock()
         mock_device.owner = "user"
         mock_device.starter_device = False
-        files = []
-        for i in range(5):
-            files.append([mock.MagicMock() for _ in range(5)])
 
-        self.query_file.filter_by.return_value = files
         self.query_device.get.return_value = mock_device
-        files = self.query_file.filter_by.return_value = [mock.MagicMock() for _ in range(5)]
+        access_cache.get_or_load(("other-user", mock_device.uuid), lambda: True)
+        access_cache.get_or_load(("other-user", "other-device"), lambda: True)
+        device_cache.get_or_load(mock_device.uuid, lambda: {"uuid": "the-device"})
         hw = self.query_hardware.filter_by.return_value = [mock.MagicMock() for _ in range(5)]
         hw_names = [h.hardware_element for h in hw]
-        to_delete = files + hw + [mock_device]
-        restored_hardware = []
+        to_delete = hw + [mock_device]
         mock.wrapper.session.delete.side_effect = to_delete.remove
 
-        def contact_microservice_handler(ms, path, data):
-            self.assertEqual("inventory", ms)
-            self.assertEqual(["inventory", "create"], path)
-            restored_hardware.append(data.pop("item_name"))
-            self.assertEqual(mock_device.owner, data.pop("owner"))
-            self.assertEqual("device", data.pop("related_ms"))
-            self.assertFalse(data)
-
-        mock.m.contact_microservice.side_effect = contact_microservice_handler
-
         expected_result = success
         actual_result = device.delete_device({}, "user", mock_device)
 
@@ -279,9 +337,15 @@ class TestDevice(TestCase):
         self.query_device.get.assert_called_with(mock_device.uuid)
         sas_patch.assert_called_with(mock_device.uuid, delete=True)
         ds_patch.assert_called_with(mock_device.uuid)
+        self.query_file_content.filter_by.assert_called_with(device=mock_device.uuid)
+        self.query_file_content.filter_by().delete.assert_called_with(synchronize_session=False)
+        self.query_file.filter_by.assert_called_with(device=mock_device.uuid)
+        self.query_file.filter_by().delete.assert_called_with(synchronize_session=False)
         self.assertFalse(to_delete)
-        self.assertEqual(hw_names, restored_hardware)
+        return_patch.assert_called_with("user", hw_names)
         mock.wrapper.session.commit.assert_called_with()
+        self.assertEqual(1, access_cache.info()["size"])
+        self.assertEqual(0, device_cache.info()["size"])
 
     @patch("resources.device.Device")
     def test__user_endpoint__device_spot__not_found(self, device_patch):
@@ -300,23 +364,25 @@ class TestDevice(TestCase):
         self.assertEqual(expected_result, actual_result)
         device_patch.random.assert_called_with("user")
 
-    def test__ms_endpoint__exist__not_found(self):
-        self.query_device.get.return_value = None
+    @patch("resources.device.Device.get")
+    def test__ms_endpoint__exist__not_found(self, get_patch):
+        get_patch.return_value = None
 
         expected_result = {"exist": False}
         actual_result = device.exist({"device_uuid": "my device"}, "")
 
         self.assertEqual(expected_result, actual_result)
-        self.query_device.get.assert_called_with("my device")
+        get_patch.assert_called_with("my device")
 
-    def test__ms_endpoint__exist__exists(self):
-        self.query_device.get.return_value = "device"
+    @patch("resources.device.Device.get")
+    def test__ms_endpoint__exist__exists(self, get_patch):
+        get_patch.return_value = "device"
 
         expected_result = {"exist": True}
         actual_result = device.exist({"device_uuid": "my device"}, "")
 
         self.assertEqual(expected_result, actual_result)
-        self.query_device.get.assert_called_with("my device")
+        get_patch.assert_called_with("my device")
 
     def test__ms_endpoint__ping(self):
         mock_device = mock.MagicMock()
@@ -334,29 +400,182 @@ class TestDevice(TestCase):
 
         self.assertEqual(expected_result, actual_result)
 
-    def test__ms_endpoint__delete_user(self):
-        devices = [mock.MagicMock() for _ in range(5)]
-        files = {}
-        hardware_elements = {}
-        workloads = {}
-        services = {}
-        to_delete = devices.copy()
-        for i in range(5):
-            uuid = devices[i].uuid
-            files[uuid] = [mock.MagicMock() for _ in range(5)]
-            hardware_elements[uuid] = [mock.MagicMock() for _ in range(5)]
-            workloads[uuid] = [mock.MagicMock() for _ in range(5)]
-            services[uuid] = [mock.MagicMock() for _ in range(5)]
-            to_delete += files[uuid] + hardware_elements[uuid] + workloads[uuid] + services[uuid]
-
-        self.query_device.filter_by.return_value = devices.copy()
-        mock.wrapper.session.delete.side_effect = to_delete.remove
-        self.query_file.filter_by.side_effect = lambda device: files[device]
-        self.query_hardware.filter_by.side_effect = lambda device_uuid: hardware_elements[device_uuid]
-        self.query_workload.filter_by.side_effect = lambda uuid: workloads[uuid]
-        self.query_service.filter_by.side_effect = lambda device_uuid: services[device_uuid]
+    @patch("resources.device.Device.uuid")
+    def test__ms_endpoint__exist_many(self, uuid_patch):
+        mock.wrapper.session.query.side_effect = None
+        query = mock.wrapper.session.query.return_value = mock.MagicMock()
+        query.filter.return_value = [("device-1", "device-1"), ("device-3", "device-3")]
+
+        expected_result = {"exist": {"device-1": True, "device-2": False, "device-3": True}}
+        actual_result = device.exist_many({"device_uuids": ["device-1", "device-2", "device-3"]}, "ms")
+
+        self.assertEqual(expected_result, actual_result)
+        mock.wrapper.session.query.assert_called_once_with(uuid_patch, uuid_patch)
+        uuid_patch.in_.assert_called_with(["device-1", "device-2", "device-3"])
+        query.filter.assert_called_once_with(uuid_patch.in_())
+
+    @patch("resources.device.Device.powered_on")
+    @patch("resources.device.Device.uuid")
+    def test__ms_endpoint__ping_many(self, uuid_patch, powered_on_patch):
+        mock.wrapper.session.query.side_effect = None
+        query = mock.wrapper.session.query.return_value = mock.MagicMock()
+        query.filter.return_value = [("device-1", True), ("device-2", False)]
+
+        expected_result = {"online": {"device-1": True, "device-2": False}}
+        actual_result = device.ping_many({"device_uuids": ["device-1", "device-2", "device-3"]}, "ms")
+
+        self.assertEqual(expected_result, actual_result)
+        mock.wrapper.session.query.assert_called_once_with(uuid_patch, powered_on_patch)
+        uuid_patch.in_.assert_called_with(["device-1", "device-2", "device-3"])
+        query.filter.assert_called_once_with(uuid_patch.in_())
+
+    @patch("resources.device.Device.owner")
+    @patch("resources.device.Device.uuid")
+    def test__ms_endpoint__owner_many(self, uuid_patch, owner_patch):
+        mock.wrapper.session.query.side_effect = None
+        query = mock.wrapper.session.query.return_value = mock.MagicMock()
+        query.filter.return_value = [("device-1", "user-1"), ("device-2", "user-2")]
+
+        expected_result = {"owner": {"device-1": "user-1", "device-2": "user-2"}}
+        actual_result = device.owner_many({"device_uuids": ["device-1", "device-2"]}, "ms")
+
+        self.assertEqual(expected_result, actual_result)
+        mock.wrapper.session.query.assert_called_once_with(uuid_patch, owner_patch)
+
+    @patch("resources.device.Device.might_exist")
+    def test__ms_endpoint__many__not_in_filter(self, might_exist_patch):
+        might_exist_patch.return_value = False
+
+        expected_result = {"exist": {"device-1": False}}
+        actual_result = device.exist_many({"device_uuids": ["device-1"]}, "ms")
+
+        self.assertEqual(expected_result, actual_result)
+        might_exist_patch.assert_called_with("device-1")
+        mock.wrapper.session.query.assert_not_called()
+
+    def test__ms_endpoint__many__empty(self):
+        self.assertEqual({"exist": {}}, device.exist_many({"device_uuids": []}, "ms"))
+        self.assertEqual({"online": {}}, device.ping_many({"device_uuids": []}, "ms"))
+        self.assertEqual({"owner": {}}, device.owner_many({"device_uuids": []}, "ms"))
+
+        mock.wrapper.session.query.assert_not_called()
+
+    @patch("resources.device.MAX_BATCH_SIZE", 2)
+    def test__ms_endpoint__many__batch_too_large(self):
+        device_uuids = ["device-1", "device-2", "device-3"]
+
+        self.assertEqual(batch_too_large, device.exist_many({"device_uuids": device_uuids}, "ms"))
+        self.assertEqual(batch_too_large, device.ping_many({"device_uuids": device_uuids}, "ms"))
+        self.assertEqual(batch_too_large, device.owner_many({"device_uuids": device_uuids}, "ms"))
+
+        mock.wrapper.session.query.assert_not_called()
+
+    @patch("resources.device.MAX_BATCH_SIZE", 2)
+    @patch("resources.device.provision_devices")
+    def test__ms_endpoint__starter_device_many__batch_too_large(self, provision_patch):
+        data = {"user_uuids": ["user-1", "user-2", "user-1", "user-3"]}
+
+        self.assertEqual(batch_too_large, device.starter_device_many(data, "auth"))
+        mock.wrapper.session.query.assert_not_called()
+        provision_patch.assert_not_called()
+
+    @patch("resources.device.provision_devices")
+    @patch("resources.device.Device.owner")
+    def test__ms_endpoint__starter_device_many(self, owner_patch, provision_patch):
+        query_owner = mock.MagicMock()
+        query_device = mock.MagicMock()
+        mock.wrapper.session.query.side_effect = {owner_patch: query_owner, Device: query_device}.__getitem__
+        query_owner.filter().distinct.return_value = [("user-2",)]
+        devices = [mock.MagicMock(owner="user-1"), mock.MagicMock(owner="user-3")]
+        query_device.filter().all.return_value = devices
+
+        expected_result = {"devices": {"user-1": devices[0].serialize, "user-3": devices[1].serialize}}
+        actual_result = device.starter_device_many({"user_uuids": ["user-1", "user-2", "user-3", "user-1"]}, "auth")
+
+        self.assertEqual(expected_result, actual_result)
+        owner_patch.in_.assert_any_call(["user-1", "user-2", "user-3"])
+        owner_patch.in_.assert_called_with(["user-1", "user-3"])
+        provision_patch.assert_called_once_with(["user-1", "user-3"], STARTER_TEMPLATE, True)
+
+    @patch("resources.device.provision_devices")
+    def test__ms_endpoint__starter_device_many__all_own_a_device(self, provision_patch):
+        mock.wrapper.session.query.side_effect = None
+        query = mock.wrapper.session.query.return_value = mock.MagicMock()
+        query.filter().distinct.return_value = [("user-1",)]
+
+        self.assertEqual({"devices": {}}, device.starter_device_many({"user_uuids": ["user-1"]}, "auth"))
+        provision_patch.assert_not_called()
+
+    @patch("resources.device.purge_devices")
+    def test__ms_endpoint__delete_user(self, purge_patch):
+        query_device_uuid = mock.MagicMock()
+        mock.wrapper.session.query.side_effect = {Device.uuid: query_device_uuid}.__getitem__
+        query_device_uuid.filter.return_value = [("device-1",), ("device-2",)]
 
         self.assertEqual(success, device.delete_user({"user_uuid": "the-user"}, "server"))
-        self.assertFalse(to_delete)
-        self.query_device.filter_by.assert_called_with(owner="the-user")
+        purge_patch.assert_called_with(["device-1", "device-2"])
+        mock.wrapper.session.commit.assert_called_with()
+
+    @patch("resources.device.Device.owner")
+    @patch("resources.device.purge_devices")
+    def test__ms_endpoint__delete_user__multiple_users(self, purge_patch, owner_patch):
+        query_device_uuid = mock.MagicMock()
+        mock.wrapper.session.query.side_effect = {Device.uuid: query_device_uuid}.__getitem__
+        query_device_uuid.filter.return_value = [("device-1",), ("device-2",), ("device-3",)]
+        access_cache.get_or_load(("hacker", "device-2"), lambda: True)
+        device_cache.get_or_load("device-3", lambda: {"uuid": "device-3"})
+        device_cache.get_or_load("device-4", lambda: {"uuid": "device-4"})
+
+        self.assertEqual(success, device.delete_user({"user_uuids": ["user-1", "user-2", "user-1"]}, "server"))
+        owner_patch.in_.assert_called_with(["user-1", "user-2"])
+        query_device_uuid.filter.assert_called_with(owner_patch.in_())
+        purge_patch.assert_called_with(["device-1", "device-2", "device-3"])
         mock.wrapper.session.commit.assert_called_with()
+        self.assertEqual(0, access_cache.info()["size"])
+        self.assertEqual(1, device_cache.info()["size"])
+
+    @patch("resources.device.MAX_BATCH_SIZE", 2)
+    @patch("resources.device.purge_devices")
+    def test__ms_endpoint__delete_user__batch_too_large(self, purge_patch):
+        data = {"user_uuids": ["user-1", "user-2", "user-1", "user-3"]}
+
+        self.assertEqual(batch_too_large, device.delete_user(data, "server"))
+        mock.wrapper.session.query.assert_not_called()
+        purge_patch.assert_not_called()
+
+    @patch("resources.device.purge_devices")
+    def test__ms_endpoint__delete_user__invalid_user_uuids(self, purge_patch):
+        for data in [{"user_uuids": "user-1"}, {"user_uuids": ["user-1", 2]}, {"user_uuid": None}]:
+            self.assertEqual(invalid_user_uuids, device.delete_user(data, "server"))
+
+        mock.wrapper.session.query.assert_not_called()
+        purge_patch.assert_not_called()
+
+    @patch("resources.device.stats")
+    def test__ms_endpoint__stats(self, stats_patch):
+        stats_patch.snapshot.return_value = {"suppressed_scale_updates": 3}
+
+        access_cache.get_or_load(("user", "device"), lambda: True)
+        access_cache.get_or_load(("user", "device"), mock.MagicMock())
+
+        self.assertEqual(
+            {
+                "stats": {"suppressed_scale_updates": 3},
+                "caches": {
+                    "access": {"size": 1, "hits": 1, "misses": 1, "hit_rate": 0.5},
+                    "device": {"size": 0, "hits": 0, "misses": 0, "hit_rate": 0.0},
+                },
+            },
+            device.get_stats({}, "server"),
+        )
+
+    def test__ms_endpoint__invalidate_access(self):
+        access_cache.get_or_load(("user-1", "device-1"), lambda: True)
+        access_cache.get_or_load(("user-2", "device-1"), lambda: False)
+        access_cache.get_or_load(("user-1", "device-2"), lambda: True)
+
+        self.assertEqual(success, device.invalidate_access({"device_uuid": "device-1", "user_uuid": "user-1"}, "ms"))
+        self.assertEqual(2, access_cache.info()["size"])
+
+        self.assertEqual(success, device.invalidate_access({"device_uuid": "device-1"}, "ms"))
+        self.assertEqual(1, access_cache.info()["size"])
@@ -1,13 +1,20 @@
 from unittest import TestCase
 from unittest.mock import patch
 
+from bloom import BloomFilter
 from mock.mock_loader import mock
-from models.device import Device
+import stats
+from models import device as device_model
+from models.device import Device, access_cache, device_cache
 
 
 class TestDeviceModel(TestCase):
     def setUp(self):
         mock.reset_mocks()
+        access_cache.clear()
+        device_cache.clear()
+        stats.reset()
+        device_model.device_filter = None
 
         self.query_device = mock.MagicMock()
         mock.wrapper.session.query.side_effect = {Device: self.query_device}.__getitem__
@@ -34,6 +41,11 @@ class TestDeviceModel(TestCase):
         serialized["name"] = "other name"
         self.assertEqual(expected_result, device.serialize)
 
+    def test__model__device__serialize__without_relationships(self):
+        device = Device(uuid="my-device", hardware=[mock.MagicMock()], workload=mock.MagicMock())
+
+        self.assertEqual({"uuid": "my-device"}, device.serialize)
+
     def test__model__device__create(self):
         actual_result = Device.create("the user", False)
 
@@ -44,6 +56,90 @@ class TestDeviceModel(TestCase):
         mock.wrapper.session.add.assert_called_with(actual_result)
         mock.wrapper.session.commit.assert_called_with()
 
+    @patch("models.device.make_transient_to_detached")
+    def test__model__device__get(self, detach_patch):
+        columns = {"uuid": "my-device", "name": "io", "owner": "user", "powered_on": True, "starter_device": False}
+        self.query_device.get.return_value.serialize = columns
+
+        for _ in range(2):
+            self.assertEqual(mock.wrapper.session.merge.return_value, Device.get("my-device"))
+
+            device = mock.wrapper.session.merge.call_args[0][0]
+            self.assertIsInstance(device, Device)
+            self.assertEqual(columns, {key: getattr(device, key) for key in columns})
+            detach_patch.assert_called_with(device)
+            mock.wrapper.session.merge.assert_called_with(device, load=False)
+
+        self.query_device.get.assert_called_once_with("my-device")
+        self.assertEqual(1, device_cache.info()["hits"])
+
+    def test__model__device__get__not_found(self):
+        self.query_device.get.return_value = None
+
+        self.assertIsNone(Device.get("my-device"))
+        self.assertIsNone(Device.get("my-device"))
+
+        self.query_device.get.assert_called_once_with("my-device")
+        mock.wrapper.session.merge.assert_not_called()
+
+    @patch("models.device.make_transient_to_detached")
+    def test__model__device__invalidate_cache(self, detach_patch):
+        self.query_device.get.return_value.serialize = {"uuid": "my-device"}
+        Device.get("my-device")
+
+        Device.invalidate_cache(["my-device", "other-device"])
+        Device.get("my-device")
+
+        self.assertEqual(2, self.query_device.get.call_count)
+
+    def test__model__device__create__adds_to_filter(self):
+        device_model.device_filter = BloomFilter(100, 0.01)
+
+        device = Device.create("user", True)
+
+        self.assertIn(device.uuid, device_model.device_filter)
+
+    @patch("models.device.func")
+    def test__model__device__build_filter(self, func_patch):
+        query_count = mock.MagicMock()
+        query_uuid = mock.MagicMock()
+        mock.wrapper.session.query.side_effect = {func_patch.count(): query_count, Device.uuid: query_uuid}.__getitem__
+        query_count.scalar.return_value = 2
+        query_uuid.yield_per.return_value = [("device-1",), ("device-2",)]
+
+        Device.build_filter()
+
+        func_patch.count.assert_called_with(Device.uuid)
+        query_uuid.yield_per.assert_called_with(10000)
+        self.assertIn("device-1", device_model.device_filter)
+        self.assertIn("device-2", device_model.device_filter)
+        self.assertNotIn("device-3", device_model.device_filter)
+
+    def test__model__device__might_exist(self):
+        self.assertTrue(Device.might_exist("device-1"))
+
+        device_model.device_filter = BloomFilter(100, 0.01)
+        device_model.device_filter.add("device-1")
+
+        self.assertTrue(Device.might_exist("device-1"))
+        self.assertFalse(Device.might_exist("device-2"))
+        self.assertEqual({"device_filter_rejections": 1}, stats.snapshot())
+
+    def test__model__device__get__not_in_filter(self):
+        device_model.device_filter = BloomFilter(100, 0.01)
+
+        self.assertIsNone(Device.get("my-device"))
+
+        self.query_device.get.assert_not_called()
+        self.assertEqual(0, device_cache.info()["misses"])
+
+    def test__model__device__create__without_commit(self):
+        actual_result = Device.create("the user", True, True, commit=False)
+
+        self.assertTrue(actual_result.starter_device)
+        mock.wrapper.session.add.assert_called_with(actual_result)
+        mock.wrapper.session.commit.assert_not_called()
+
     def test__model__device__create__different_uuid(self):
         first_element = Device.create("user", True).uuid
         second_element = Device.create("user", True).uuid
@@ -68,13 +164,42 @@ class TestDeviceModel(TestCase):
             "service", ["check_part_owner"], {"user_uuid": "other-user", "device_uuid": device.uuid}
         )
 
+    def test__model__device__check_access__part_owner__cached(self):
+        device = Device.create("the-user", True)
+        mock.m.contact_microservice.return_value = {"ok": False}
+
+        self.assertFalse(device.check_access("other-user"))
+        self.assertFalse(device.check_access("other-user"))
+        mock.m.contact_microservice.assert_called_once()
+
+        mock.m.contact_microservice.return_value = {"ok": True}
+        Device.invalidate_access([device.uuid])
+
+        self.assertTrue(device.check_access("other-user"))
+        self.assertEqual(2, mock.m.contact_microservice.call_count)
+        self.assertEqual({"size": 1, "hits": 1, "misses": 2, "hit_rate": 1 / 3}, access_cache.info())
+
+    def test__model__device__invalidate_access__user(self):
+        access_cache.get_or_load(("user-1", "device-1"), lambda: True)
+        access_cache.get_or_load(("user-2", "device-1"), lambda: True)
+        access_cache.get_or_load(("user-1", "device-2"), lambda: True)
+
+        Device.invalidate_access(["device-1", "device-2"], "user-1")
+
+        self.assertEqual(1, access_cache.info()["size"])
+        self.assertTrue(access_cache.get_or_load(("user-2", "device-1"), mock.MagicMock()))
+
+    @patch("models.device.uuid4")
     @patch("models.device.and_")
+    @patch("models.device.Device.uuid")
     @patch("models.device.Device.powered_on")
     @patch("models.device.Device.owner")
-    @patch("models.device.func.random")
-    def test__model__device__random__multiple_devices(self, random_patch, owner_patch, power_patch, and_patch):
-        self.query_device.filter().order_by().first.return_value = "random device"
+    def test__model__device__random__after_pivot(self, owner_patch, power_patch, uuid_patch, and_patch, uuid4_patch):
+        uuid4_patch.return_value = "pivot"
         owner_patch.__ne__.return_value = "owner-ne"
+        uuid_patch.__ge__.return_value = "uuid-ge"
+        devices = self.query_device.filter()
+        devices.filter().order_by().first.return_value = "random device"
 
         expected_result = "random device"
         actual_result = Device.random("some user")
@@ -82,6 +207,39 @@ class TestDeviceModel(TestCase):
         self.assertEqual(expected_result, actual_result)
         owner_patch.__ne__.assert_called_with("some user")
         and_patch.assert_called_with("owner-ne", power_patch)
-        random_patch.assert_called_with()
         self.query_device.filter.assert_called_with(and_patch())
-        self.query_device.filter().order_by.assert_called_with(random_patch())
+        uuid_patch.__ge__.assert_called_with("pivot")
+        devices.filter.assert_called_with("uuid-ge")
+        devices.filter().order_by.assert_called_with(uuid_patch)
+        devices.order_by.assert_not_called()
+
+    @patch("models.device.uuid4")
+    @patch("models.device.and_")
+    @patch("models.device.Device.uuid")
+    @patch("models.device.Device.powered_on")
+    @patch("models.device.Device.owner")
+    def test__model__device__random__wrap_around(self, owner_patch, power_patch, uuid_patch, and_patch, uuid4_patch):
+        uuid4_patch.return_value = "pivot"
+        uuid_patch.__ge__.return_value = "uuid-ge"
+        devices = self.query_device.filter()
+        devices.filter().order_by().first.return_value = None
+        devices.order_by().first.return_value = "first device"
+
+        expected_result = "first device"
+        actual_result = Device.random("some user")
+
+        self.assertEqual(expected_result, actual_result)
+        devices.filter.assert_called_with("uuid-ge")
+        devices.order_by.assert_called_with(uuid_patch)
+
+    @patch("models.device.and_")
+    @patch("models.device.Device.uuid")
+    @patch("models.device.Device.powered_on")
+    @patch("models.device.Device.owner")
+    def test__model__device__random__no_devices(self, owner_patch, power_patch, uuid_patch, and_patch):
+        uuid_patch.__ge__.return_value = "uuid-ge"
+        devices = self.query_device.filter()
+        devices.filter().order_by().first.return_value = None
+        devices.order_by().first.return_value = None
+
+        self.assertIsNone(Device.random("some user"))
@@ -1,4 +1,5 @@
 from unittest import TestCase
+from unittest.mock import patch
 
 from mock.mock_loader import mock
 from models.device import Device
@@ -16,20 +17,22 @@ class TestErrors(TestCase):
         self.query_file = mock.MagicMock()
         mock.wrapper.session.query.side_effect = {Device: self.query_device, File: self.query_file}.__getitem__
 
-    def test__device_exists__device_not_found(self):
-        self.query_device.get.return_value = None
+    @patch("resources.errors.Device.get")
+    def test__device_exists__device_not_found(self, get_patch):
+        get_patch.return_value = None
 
         with self.assertRaises(MicroserviceException) as context:
             errors.device_exists({"device_uuid": "my-device"}, "")
 
         self.assertEqual(device_not_found, context.exception.error)
-        self.query_device.get.assert_called_with("my-device")
+        get_patch.assert_called_with("my-device")
 
-    def test__device_exists__successful(self):
-        mock_device = self.query_device.get.return_value = mock.MagicMock()
+    @patch("resources.errors.Device.get")
+    def test__device_exists__successful(self, get_patch):
+        mock_device = get_patch.return_value = mock.MagicMock()
 
         self.assertEqual(mock_device, errors.device_exists({"device_uuid": "my-device"}, ""))
-        self.query_device.get.assert_called_with("my-device")
+        get_patch.assert_called_with("my-device")
 
     def test__can_access_device__permission_denied(self):
         mock_device = mock.MagicMock()
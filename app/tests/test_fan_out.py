@@ -0,0 +1,42 @@
+from functools import partial
+from threading import Barrier, current_thread
+from unittest import TestCase
+
+from fan_out import fan_out
+
+
+class TestFanOut(TestCase):
+    def test__fan_out__results_in_order(self):
+        self.assertEqual([1, 2, 3], fan_out(lambda: 1, lambda: 2, lambda: 3))
+
+    def test__fan_out__concurrent(self):
+        barrier = Barrier(3, timeout=5)
+
+        def call(i):
+            barrier.wait()
+            return i
+
+        self.assertEqual([0, 1, 2], fan_out(*[partial(call, i) for i in range(3)]))
+
+    def test__fan_out__error_after_all_calls(self):
+        finished = []
+
+        def fail():
+            raise ValueError("nope")
+
+        def slow():
+            barrier.wait()
+            finished.append(True)
+
+        barrier = Barrier(2, timeout=5)
+
+        with self.assertRaises(ValueError):
+            fan_out(fail, slow, lambda: barrier.wait())
+
+        self.assertEqual([True], finished)
+
+    def test__fan_out__single_call_inline(self):
+        self.assertEqual([current_thread()], fan_out(current_thread))
+
+    def test__fan_out__nothing(self):
+        self.assertEqual([], fan_out())
@@ -12,6 +12,8 @@ from schemes import (
     parent_directory_not_found,
     can_not_move_dir_into_itself,
     directory_can_not_have_textcontent,
+    directory_too_deep,
+    file_not_found,
 )
 
 
@@ -29,7 +31,8 @@ class TestFile(TestCase):
             self.sqlalchemy_func.count(): self.query_func_count,
         }.__getitem__
 
-    def test__user_endpoint__file_all(self):
+    @patch("resources.file.File.load_contents")
+    def test__user_endpoint__file_all(self, load_contents_patch):
         mock_device = mock.MagicMock()
         files = [mock.MagicMock() for _ in range(5)]
 
@@ -40,10 +43,131 @@ class TestFile(TestCase):
 
         self.assertEqual(expected_result, actual_result)
         self.query_file.filter_by.assert_called_with(device=mock_device.uuid, parent_dir_uuid="0")
+        load_contents_patch.assert_called_with(files)
+
+    @patch("resources.file.LIST_PAGE_SIZE", 3)
+    @patch("resources.file.File.page")
+    def test__user_endpoint__file_page__defaults(self, page_patch):
+        mock_device = mock.MagicMock()
+        files = [File(uuid=str(i), filename=f"file{i}", content="hello") for i in range(3)]
+        page_patch.return_value = files
+
+        expected_result = {"files": [f.serialize for f in files], "cursor": None}
+        actual_result = file.list_files_page(
+            {"device_uuid": mock_device.uuid, "parent_dir_uuid": None, "cursor": None, "limit": None, "fields": None},
+            "user",
+            mock_device,
+        )
+
+        self.assertEqual(expected_result, actual_result)
+        page_patch.assert_called_with(
+            mock_device.uuid,
+            None,
+            None,
+            4,
+            ["uuid", "device", "filename", "content", "is_directory", "parent_dir_uuid"],
+        )
+
+    @patch("resources.file.File.page")
+    def test__user_endpoint__file_page__next_page(self, page_patch):
+        mock_device = mock.MagicMock()
+        files = [
+            File(uuid=str(i), filename=f"file{i}", content="secret", is_directory=False, parent_dir_uuid="dir")
+            for i in range(3)
+        ]
+        page_patch.return_value = files
+
+        expected_result = {
+            "files": [{"uuid": "0", "filename": "file0"}, {"uuid": "1", "filename": "file1"}],
+            "cursor": "file1",
+        }
+        actual_result = file.list_files_page(
+            {
+                "device_uuid": mock_device.uuid,
+                "parent_dir_uuid": "dir",
+                "cursor": "abc",
+                "limit": 2,
+                "fields": ["uuid", "filename"],
+            },
+            "user",
+            mock_device,
+        )
+
+        self.assertEqual(expected_result, actual_result)
+        page_patch.assert_called_with(mock_device.uuid, "dir", "abc", 3, ["uuid", "filename"])
+
+    @patch("resources.file.TREE_PAGE_SIZE", 3)
+    @patch("resources.file.File.tree")
+    def test__user_endpoint__file_tree__whole_device(self, tree_patch):
+        mock_device = mock.MagicMock()
+        files = [mock.MagicMock() for _ in range(3)]
+        tree_patch.return_value = files
+
+        expected_result = {"files": [f.serialize for f in files], "cursor": None}
+        actual_result = file.tree(
+            {"device_uuid": mock_device.uuid, "parent_dir_uuid": None, "cursor": None}, "user", mock_device
+        )
+
+        self.assertEqual(expected_result, actual_result)
+        tree_patch.assert_called_with(mock_device.uuid, None, None, 4)
+        self.query_file.filter_by.assert_not_called()
+
+    @patch("resources.file.TREE_PAGE_SIZE", 3)
+    @patch("resources.file.File.tree")
+    def test__user_endpoint__file_tree__next_page(self, tree_patch):
+        mock_device = mock.MagicMock()
+        files = [mock.MagicMock() for _ in range(4)]
+        tree_patch.return_value = files
+
+        expected_result = {"files": [f.serialize for f in files[:3]], "cursor": files[2].lineage}
+        actual_result = file.tree(
+            {"device_uuid": mock_device.uuid, "parent_dir_uuid": "dir", "cursor": "a/b/"}, "user", mock_device
+        )
+
+        self.assertEqual(expected_result, actual_result)
+        self.query_file.filter_by.assert_called_with(device=mock_device.uuid, uuid="dir", is_directory=True)
+        tree_patch.assert_called_with(mock_device.uuid, self.query_file.filter_by().first(), "a/b/", 4)
+
+    @patch("resources.file.File.tree")
+    def test__user_endpoint__file_tree__parent_directory_not_found(self, tree_patch):
+        mock_device = mock.MagicMock()
+        self.query_file.filter_by().first.return_value = None
+
+        expected_result = parent_directory_not_found
+        actual_result = file.tree(
+            {"device_uuid": mock_device.uuid, "parent_dir_uuid": "dir", "cursor": None}, "user", mock_device
+        )
+
+        self.assertEqual(expected_result, actual_result)
+        tree_patch.assert_not_called()
 
     def test__user_endpoint__file_info__successful(self):
         mock_file = mock.MagicMock()
         self.assertEqual(mock_file.serialize, file.file_info({}, "", mock.MagicMock(), mock_file))
+        mock_file.load_content.assert_called_with()
+
+    @patch("resources.file.File.resolve")
+    def test__user_endpoint__file_resolve__successful(self, resolve_patch):
+        mock_device = mock.MagicMock()
+
+        expected_result = resolve_patch().serialize
+        actual_result = file.resolve(
+            {"device_uuid": mock_device.uuid, "path": "/home/./scripts/../bin//a.sh"}, "user", mock_device
+        )
+
+        self.assertEqual(expected_result, actual_result)
+        resolve_patch.assert_called_with(mock_device.uuid, ["home", "bin", "a.sh"])
+
+    @patch("resources.file.File.resolve")
+    def test__user_endpoint__file_resolve__file_not_found(self, resolve_patch):
+        mock_device = mock.MagicMock()
+        resolve_patch.return_value = None
+
+        expected_result = file_not_found
+        actual_result = file.resolve({"device_uuid": mock_device.uuid, "path": "../a/b"}, "user", mock_device)
+
+        self.assertEqual(expected_result, actual_result)
+        resolve_patch.assert_called_with(mock_device.uuid, ["a", "b"])
 
     def test__user_endpoint__file_move__file_already_exists(self):
         mock_device = mock.MagicMock()
@@ -102,27 +226,19 @@ class TestFile(TestCase):
         self.assertFalse(query_results)
 
     def test__user_endpoint__file_move__can_not_move_dir_into_itself(self):
-        def make_file(uuid, parent_dir_uuid):
-            out = mock.MagicMock()
-            out.uuid = str(uuid)
-            out.parent_dir_uuid = str(parent_dir_uuid)
-            return out
-
         mock_device = mock.MagicMock()
         mock_file = mock.MagicMock()
         mock_file.is_directory = True
         mock_file.uuid = "3"
-        filesystem = {str(i): make_file(i, i - 1) for i in range(0, 11)}
-        filesystem["0"].parent_dir_uuid = None
+        target_dir = mock.MagicMock()
+        target_dir.uuid = "10"
 
-        query_results = [None, mock.MagicMock()]
+        query_results = [None, target_dir]
         expected_query_params = [
             {"device": mock_device.uuid, "filename": "new-name", "parent_dir_uuid": "10"},
             {"device": mock_device.uuid, "uuid": "10", "is_directory": True},
         ]
-        for i in range(10, 2, -1):
-            query_results.append(make_file(i, i - 1))
-            expected_query_params.append({"device": mock_device.uuid, "uuid": str(i)})
+        mock_file.is_ancestor_of.return_value = True
 
         def handle_file_query(**kwargs):
             self.assertEqual(expected_query_params.pop(0), kwargs)
@@ -147,6 +263,9 @@ class TestFile(TestCase):
 
         self.assertEqual(expected_result, actual_result)
         self.assertFalse(query_results)
+        mock_file.is_ancestor_of.assert_called_once_with(target_dir)
+        mock_file.move.assert_not_called()
+        mock.wrapper.session.commit.assert_not_called()
 
     def test__user_endpoint__file_move__successful(self):
         mock_device = mock.MagicMock()
@@ -156,7 +275,10 @@ class TestFile(TestCase):
         dir_mock = mock.MagicMock()
         dir_mock.parent_dir_uuid = None
         dir_mock.uuid = "0"
+        dir_mock.depth = 22
         filesystem = {"0": dir_mock, None: None}
+        mock_file.is_ancestor_of.return_value = False
+        mock_file.height.return_value = 2
 
         self.query_device.get.return_value = mock_device
 
@@ -190,7 +312,9 @@ class TestFile(TestCase):
         )
 
         self.assertEqual(expected_result, actual_result)
-        self.assertEqual("new-name", mock_file.filename)
+        mock_file.is_ancestor_of.assert_called_once_with(dir_mock)
+        mock_file.move.assert_called_once_with(dir_mock, "new-name")
+        mock_file.load_content.assert_called_with()
         mock.wrapper.session.commit.assert_called_with()
         mock.m.contact_user.assert_called_with(
             "user",
@@ -202,6 +326,59 @@ class TestFile(TestCase):
             },
         )
 
+    def test__user_endpoint__file_move__directory_to_root(self):
+        mock_device = mock.MagicMock()
+        mock_file = mock.MagicMock()
+        mock_file.is_directory = True
+        mock_file.height.return_value = 24
+        self.query_file.filter_by().first.return_value = None
+
+        expected_result = mock_file.serialize
+        actual_result = file.move(
+            {
+                "device_uuid": mock_device.uuid,
+                "file_uuid": "my-file",
+                "new_filename": "new-name",
+                "new_parent_dir_uuid": None,
+            },
+            "user",
+            mock_device,
+            mock_file,
+        )
+
+        self.assertEqual(expected_result, actual_result)
+        mock_file.is_ancestor_of.assert_not_called()
+        mock_file.move.assert_called_once_with(None, "new-name")
+        mock.wrapper.session.commit.assert_called_with()
+
+    def test__user_endpoint__file_move__directory_too_deep(self):
+        mock_device = mock.MagicMock()
+        mock_file = mock.MagicMock()
+        mock_file.is_directory = True
+        mock_file.is_ancestor_of.return_value = False
+        mock_file.height.return_value = 3
+        target_dir = mock.MagicMock()
+        target_dir.depth = 22
+        self.query_file.filter_by().first.side_effect = [None, target_dir]
+
+        expected_result = directory_too_deep
+        actual_result = file.move(
+            {
+                "device_uuid": mock_device.uuid,
+                "file_uuid": "my-file",
+                "new_filename": "new-name",
+                "new_parent_dir_uuid": "10",
+            },
+            "user",
+            mock_device,
+            mock_file,
+        )
+
+        self.assertEqual(expected_result, actual_result)
+        mock_file.height.assert_called_once_with()
+        mock_file.move.assert_not_called()
+        mock.wrapper.session.commit.assert_not_called()
+
     def test__user_endpoint__file_update__directories_can_not_be_updated(self):
         mock_device = mock.MagicMock()
         mock_file = mock.MagicMock()
@@ -228,7 +405,7 @@ class TestFile(TestCase):
         )
 
         self.assertEqual(expected_result, actual_result)
-        self.assertEqual("test", mock_file.content)
+        mock_file.set_content.assert_called_with("test")
         mock.wrapper.session.commit.assert_called_with()
         mock.m.contact_user.assert_called_with(
             "user",
@@ -240,7 +417,8 @@ class TestFile(TestCase):
             },
         )
 
-    def test__user_endpoint__normal_file_delete__successful(self):
+    @patch("resources.file.File.delete_many")
+    def test__user_endpoint__normal_file_delete__successful(self, delete_many_patch):
         mock_device = mock.MagicMock()
         mock_file = mock.MagicMock()
         mock_file.is_directory = False
@@ -251,10 +429,11 @@ class TestFile(TestCase):
         )
 
         self.assertEqual(expected_result, actual_result)
-        mock.wrapper.session.delete.assert_called_with(mock_file)
+        delete_many_patch.assert_called_with(mock_device.uuid, [mock_file.uuid])
         mock.wrapper.session.commit.assert_called_with()
 
-    def test__user_endpoint__directory_file_delete__successful(self):
+    @patch("resources.file.File.delete_many")
+    def test__user_endpoint__directory_file_delete__successful(self, delete_many_patch):
         mock_device = mock.MagicMock()
         mock_file = mock.MagicMock()
         mock_file.is_directory = True
@@ -284,23 +463,20 @@ class TestFile(TestCase):
         create_file("AD", "A", False, True)
         create_file("AE", "0", False, True)
 
-        def handle_file_query(**kwargs):
-            out = mock.MagicMock()
-            if "uuid" in kwargs:
-                self.assertEqual({"device": mock_device.uuid, "uuid": "AC"}, kwargs)
-                out.first.return_value = mock_file
-            elif "parent_dir_uuid" in kwargs:
-                self.assertIn(kwargs["parent_dir_uuid"], filesystem)
-                out.all.return_value = [
-                    v for _, v in filesystem.items() if v.parent_dir_uuid == kwargs["parent_dir_uuid"]
-                ]
-            return out
+        def subtree():
+            uuids = {"AC"}
+            for f in filesystem.values():
+                if f.parent_dir_uuid in uuids:
+                    uuids.add(f.uuid)
+            return [(f.uuid, f.parent_dir_uuid, f.is_directory) for f in filesystem.values() if f.uuid in uuids]
 
-        def delete_file(file):
-            del filesystem[file.uuid]
+        def delete_many(device, uuids):
+            self.assertEqual(mock_device.uuid, device)
+            for uuid in uuids:
+                del filesystem[uuid]
 
-        self.query_file.filter_by.side_effect = handle_file_query
-        mock.wrapper.session.delete.side_effect = delete_file
+        mock_file.subtree.side_effect = subtree
+        delete_many_patch.side_effect = delete_many
 
         expected_result = success
         actual_result = file.delete_file(
@@ -309,6 +485,10 @@ class TestFile(TestCase):
 
         self.assertEqual(expected_result, actual_result)
         self.assertEqual(filesystem, filesystem_after_deletion)
+        mock_file.subtree.assert_called_once_with()
+        delete_many_patch.assert_called_once_with(mock_device.uuid, ["AAA", "AAD", "AAC", "AAB", "AC"])
+        mock.wrapper.session.delete.assert_not_called()
+        mock.wrapper.session.commit.assert_called_with()
         mock.m.contact_user.assert_called_with(
             "user",
             {
@@ -348,6 +528,7 @@ class TestFile(TestCase):
         mock_device = mock.MagicMock()
 
         self.query_func_count.filter_by().scalar.return_value = 0
+        self.query_file.filter_by().first.return_value.depth = 23
 
         expected_result = file_create_patch().serialize
         actual_result = file.create_file(
@@ -367,7 +548,10 @@ class TestFile(TestCase):
         self.query_func_count.filter_by.assert_called_with(
             device=mock_device.uuid, filename="test-file", parent_dir_uuid="0"
         )
-        file_create_patch.assert_called_with(mock_device.uuid, "test-file", "some random content here", "0", False)
+        self.query_file.filter_by.assert_called_with(device=mock_device.uuid, uuid="0", is_directory=True)
+        file_create_patch.assert_called_with(
+            mock_device.uuid, "test-file", "some random content here", self.query_file.filter_by().first(), False
+        )
         mock.m.contact_user.assert_called_with(
             "user",
             {
@@ -385,6 +569,7 @@ class TestFile(TestCase):
 
         self.query_device.get.return_value = mock_device
         self.query_func_count.filter_by().scalar.return_value = 0
+        self.query_file.filter_by().first.return_value.depth = 1
 
         expected_result = directory_can_not_have_textcontent
         actual_result = file.create_file(
@@ -405,6 +590,29 @@ class TestFile(TestCase):
             device=mock_device.uuid, filename="test-file", parent_dir_uuid="0"
         )
 
+    @patch("resources.file.File.create")
+    def test__user_endpoint__file_create__directory_too_deep(self, file_create_patch):
+        mock_device = mock.MagicMock()
+
+        self.query_func_count.filter_by().scalar.return_value = 0
+        self.query_file.filter_by().first.return_value.depth = 24
+
+        expected_result = directory_too_deep
+        actual_result = file.create_file(
+            {
+                "device_uuid": mock_device.uuid,
+                "filename": "test-file",
+                "content": "",
+                "is_directory": True,
+                "parent_dir_uuid": "0",
+            },
+            "user",
+            mock_device,
+        )
+
+        self.assertEqual(expected_result, actual_result)
+        file_create_patch.assert_not_called()
+
     @patch("resources.file.File.create")
     def test__user_endpoint__file_create__no_parent_dir(self, file_create_patch):
         mock_device = mock.MagicMock()
@@ -1,18 +1,30 @@
 from unittest import TestCase
+from unittest.mock import patch, call, ANY
+
+from sqlalchemy import String
 
 from mock.mock_loader import mock
-from models.file import File
+from models.file import File, FileContent, LINEAGE_DEPTH
 
 
 class TestFileModel(TestCase):
     def setUp(self):
         mock.reset_mocks()
 
+        mock.wrapper.session.query = mock.MagicMock()
+
     def test__model__file__structure(self):
         self.assertEqual("device_file", File.__tablename__)
         self.assertTrue(issubclass(File, mock.wrapper.Base))
-        for col in ["uuid", "device", "filename", "content", "is_directory", "parent_dir_uuid"]:
+        for col in ["uuid", "device", "filename", "is_directory", "parent_dir_uuid", "lineage"]:
             self.assertIn(col, dir(File))
+        self.assertNotIn("content", dir(File))
+
+    def test__model__file_content__structure(self):
+        self.assertEqual("device_file_content", FileContent.__tablename__)
+        self.assertTrue(issubclass(FileContent, mock.wrapper.Base))
+        for col in ["file_uuid", "device", "content"]:
+            self.assertIn(col, dir(FileContent))
 
     def test__model__file__serialize(self):
         file = File(
@@ -41,18 +53,349 @@ class TestFileModel(TestCase):
         serialized["content"] = "hi!"
         self.assertEqual(expected_result, file.serialize)
 
+    def test__model__file__serialize__without_lineage(self):
+        file = File(uuid="file identifier", device="the device", lineage="parent/file identifier/")
+
+        self.assertEqual({"uuid": "file identifier", "device": "the device"}, file.serialize)
+
     def test__model__file__create(self):
-        actual_result = File.create("my-device", "foo.bar", "super", "baz", False)
+        parent_dir = File(uuid="baz", lineage="bar/baz/")
+        actual_result = File.create("my-device", "foo.bar", "super", parent_dir, False)
 
         self.assertEqual("my-device", actual_result.device)
         self.assertEqual("foo.bar", actual_result.filename)
         self.assertEqual("baz", actual_result.parent_dir_uuid)
         self.assertEqual(False, actual_result.is_directory)
         self.assertRegex(actual_result.uuid, r"[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12}")
-        mock.wrapper.session.add.assert_called_with(actual_result)
+        self.assertEqual(f"bar/baz/{actual_result.uuid}/", actual_result.lineage)
+        self.assertEqual("super", actual_result.content)
+        self.assertEqual(2, mock.wrapper.session.add.call_count)
+        self.assertEqual(actual_result, mock.wrapper.session.add.call_args_list[0][0][0])
+        content = mock.wrapper.session.add.call_args_list[1][0][0]
+        self.assertIsInstance(content, FileContent)
+        self.assertEqual(
+            (actual_result.uuid, "my-device", "super"), (content.file_uuid, content.device, content.content)
+        )
         mock.wrapper.session.commit.assert_called_with()
 
+    def test__model__file__create__root_directory(self):
+        actual_result = File.create("my-device", "foo.bar", "", None, True)
+
+        self.assertIsNone(actual_result.parent_dir_uuid)
+        self.assertEqual(f"{actual_result.uuid}/", actual_result.lineage)
+        self.assertEqual("", actual_result.content)
+        mock.wrapper.session.add.assert_called_once_with(actual_result)
+
+    def test__model__file__set_content(self):
+        file = File(uuid="my-file", device="my-device", is_directory=False)
+
+        file.set_content("hello")
+
+        self.assertEqual("hello", file.content)
+        content = mock.wrapper.session.merge.call_args[0][0]
+        self.assertIsInstance(content, FileContent)
+        self.assertEqual(("my-file", "my-device", "hello"), (content.file_uuid, content.device, content.content))
+
+    def test__model__file__set_content__directory(self):
+        file = File(uuid="my-dir", device="my-device", is_directory=True)
+
+        file.set_content("")
+
+        self.assertEqual("", file.content)
+        mock.wrapper.session.merge.assert_not_called()
+
+    @patch("models.file.FileContent.file_uuid")
+    def test__model__file__load_contents(self, file_uuid_patch):
+        files = [
+            File(uuid="a", is_directory=False),
+            File(uuid="b", is_directory=True),
+            File(uuid="c", is_directory=False),
+        ]
+        mock.wrapper.session.query().filter.return_value = [("a", "hello")]
+
+        File.load_contents(files)
+
+        self.assertEqual(["hello", "", ""], [file.content for file in files])
+        mock.wrapper.session.query.assert_called_with(file_uuid_patch, FileContent.content)
+        file_uuid_patch.in_.assert_called_with(["a", "c"])
+        mock.wrapper.session.query().filter.assert_called_with(file_uuid_patch.in_())
+
+    def test__model__file__load_contents__only_directories(self):
+        files = [File(uuid="a", is_directory=True)]
+
+        File.load_contents(files)
+
+        self.assertEqual("", files[0].content)
+        mock.wrapper.session.query.assert_not_called()
+
+    @patch("models.file.File.load_contents")
+    def test__model__file__load_content(self, load_contents_patch):
+        file = File(uuid="a", is_directory=False)
+        load_contents_patch.side_effect = lambda files: setattr(files[0], "content", "hello")
+
+        self.assertEqual("hello", file.load_content())
+        load_contents_patch.assert_called_with([file])
+
     def test__model__device__create__different_uuid(self):
-        first_element = File.create("device", "foo.bar", "super", "baz", False).uuid
-        second_element = File.create("device", "foo.bar", "super", "baz", False).uuid
+        first_element = File.create("device", "foo.bar", "super", None, False).uuid
+        second_element = File.create("device", "foo.bar", "super", None, False).uuid
         self.assertNotEqual(first_element, second_element)
+
+    def test__model__file__resolve__empty_path(self):
+        self.assertIsNone(File.resolve("my-device", []))
+        mock.wrapper.session.query.assert_not_called()
+
+    @patch("models.file.aliased")
+    def test__model__file__resolve(self, aliased_patch):
+        aliases = [mock.MagicMock() for _ in range(3)]
+        aliased_patch.side_effect = aliases
+        query = mock.wrapper.session.query
+        query().filter.return_value = query()
+
+        expected_result = query().first()
+        actual_result = File.resolve("my-device", ["home", "bin", "a.sh"])
+
+        self.assertEqual(expected_result, actual_result)
+        self.assertEqual([call(File)] * 3, aliased_patch.call_args_list)
+        query.assert_called_with(aliases[2])
+        aliases[0].parent_dir_uuid.is_.assert_called_with(None)
+        filters = query().filter.call_args_list
+        self.assertIn(call(aliases[0].is_directory, aliases[1].parent_dir_uuid == aliases[0].uuid), filters)
+        self.assertIn(call(aliases[1].is_directory, aliases[2].parent_dir_uuid == aliases[1].uuid), filters)
+        self.assertNotIn(call(aliases[2].is_directory, ANY), filters)
+        for alias, filename in zip(aliases, ["home", "bin", "a.sh"]):
+            self.assertIn(call(alias.device == "my-device", alias.filename == filename), filters)
+
+    @patch("models.file.RESOLVE_DEPTH", 2)
+    @patch("models.file.aliased")
+    def test__model__file__resolve__long_path(self, aliased_patch):
+        aliases = [mock.MagicMock() for _ in range(5)]
+        aliased_patch.side_effect = aliases
+        directory = File(uuid="bin-uuid", is_directory=True)
+        query = mock.wrapper.session.query
+        query().filter.return_value = query()
+        query().first.side_effect = [directory, directory, "the-file"]
+
+        actual_result = File.resolve("my-device", ["home", "bin", "local", "bin", "a.sh"])
+
+        self.assertEqual("the-file", actual_result)
+        self.assertEqual(3, query().first.call_count)
+        query.assert_any_call(aliases[1])
+        query.assert_any_call(aliases[3])
+        query.assert_any_call(aliases[4])
+        aliases[0].parent_dir_uuid.is_.assert_called_with(None)
+        self.assertIn(call(aliases[2].parent_dir_uuid == "bin-uuid"), query().filter.call_args_list)
+        self.assertIn(call(aliases[4].parent_dir_uuid == "bin-uuid"), query().filter.call_args_list)
+
+    @patch("models.file.RESOLVE_DEPTH", 1)
+    @patch("models.file.aliased")
+    def test__model__file__resolve__file_in_path(self, aliased_patch):
+        query = mock.wrapper.session.query
+        query().filter.return_value = query()
+        query().first.return_value = File(uuid="a-uuid", is_directory=False)
+
+        self.assertIsNone(File.resolve("my-device", ["a.sh", "b.sh"]))
+        self.assertEqual(1, query().first.call_count)
+
+    @patch("models.file.load_only")
+    @patch("models.file.File.filename")
+    @patch("models.file.File.parent_dir_uuid")
+    @patch("models.file.File.device")
+    def test__model__file__page(self, device_patch, parent_dir_uuid_patch, filename_patch, load_only_patch):
+        query = mock.wrapper.session.query
+        files = query().options().filter()
+        device_patch.__eq__.return_value = "device-eq"
+        parent_dir_uuid_patch.__eq__.return_value = "parent-eq"
+        filename_patch.__gt__.return_value = "filename-gt"
+
+        expected_result = files.filter().order_by().limit().all()
+        actual_result = File.page("my-device", "dir", "abc", 10, ["is_directory", "uuid"])
+
+        self.assertEqual(expected_result, actual_result)
+        query.assert_called_with(File)
+        load_only_patch.assert_called_with("uuid", "filename", "is_directory")
+        query().options.assert_called_with(load_only_patch())
+        query().options().filter.assert_called_with("device-eq", "parent-eq")
+        device_patch.__eq__.assert_called_with("my-device")
+        parent_dir_uuid_patch.__eq__.assert_called_with("dir")
+        filename_patch.__gt__.assert_called_with("abc")
+        files.filter.assert_called_with("filename-gt")
+        files.filter().order_by.assert_called_with(filename_patch)
+        files.filter().order_by().limit.assert_called_with(10)
+
+    @patch("models.file.File.load_contents")
+    @patch("models.file.load_only")
+    def test__model__file__page__content(self, load_only_patch, load_contents_patch):
+        files = mock.wrapper.session.query().options().filter()
+
+        expected_result = files.order_by().limit().all()
+        actual_result = File.page("my-device", None, None, 10, ["content", "filename"])
+
+        self.assertEqual(expected_result, actual_result)
+        load_only_patch.assert_called_with("uuid", "filename", "is_directory")
+        load_contents_patch.assert_called_with(expected_result)
+
+    @patch("models.file.load_only")
+    @patch("models.file.File.filename")
+    def test__model__file__page__first_page(self, filename_patch, load_only_patch):
+        files = mock.wrapper.session.query().options().filter()
+
+        expected_result = files.order_by().limit().all()
+        actual_result = File.page("my-device", None, None, 10, [])
+
+        self.assertEqual(expected_result, actual_result)
+        load_only_patch.assert_called_with("uuid", "filename", "is_directory")
+        files.filter.assert_not_called()
+        files.order_by.assert_called_with(filename_patch)
+
+    @patch("models.file.File.lineage")
+    @patch("models.file.File.uuid")
+    @patch("models.file.File.device")
+    def test__model__file__tree__whole_device(self, device_patch, uuid_patch, lineage_patch):
+        query = mock.wrapper.session.query
+        device_patch.__eq__.return_value = "device-eq"
+
+        expected_result = query().filter().order_by().limit().all()
+        actual_result = File.tree("my-device", None, None, 10)
+
+        self.assertEqual(expected_result, actual_result)
+        query.assert_called_with(File)
+        query().filter.assert_called_with("device-eq")
+        query().filter().filter.assert_not_called()
+        query().filter().order_by.assert_called_with(lineage_patch)
+        query().filter().order_by().limit.assert_called_with(10)
+
+    @patch("models.file.File.in_lineage")
+    @patch("models.file.File.lineage")
+    @patch("models.file.File.uuid")
+    @patch("models.file.File.device")
+    def test__model__file__tree__subtree(self, device_patch, uuid_patch, lineage_patch, in_lineage_patch):
+        parent_dir = File(uuid="b", lineage="a/b/")
+        devices = mock.wrapper.session.query().filter()
+        lineage_patch.__gt__.return_value = "lineage-gt"
+        uuid_patch.__ne__.return_value = "uuid-ne"
+
+        expected_result = devices.filter().filter().order_by().limit().all()
+        actual_result = File.tree("my-device", parent_dir, "a/b/c/", 10)
+
+        self.assertEqual(expected_result, actual_result)
+        in_lineage_patch.assert_called_with("a/b/")
+        uuid_patch.__ne__.assert_called_with("b")
+        devices.filter.assert_called_with(in_lineage_patch(), "uuid-ne")
+        lineage_patch.__gt__.assert_called_with("a/b/c/")
+        devices.filter().filter.assert_called_with("lineage-gt")
+        devices.filter().filter().order_by().limit.assert_called_with(10)
+
+    def test__model__file__is_ancestor_of(self):
+        root = File(uuid="a", lineage="a/")
+        directory = File(uuid="b", lineage="a/b/")
+        file = File(uuid="c", lineage="a/b/c/")
+        other = File(uuid="d", lineage="a/d/")
+
+        self.assertTrue(root.is_ancestor_of(file))
+        self.assertTrue(directory.is_ancestor_of(file))
+        self.assertTrue(file.is_ancestor_of(file))
+        self.assertFalse(file.is_ancestor_of(directory))
+        self.assertFalse(other.is_ancestor_of(file))
+
+    def test__model__file__depth(self):
+        self.assertEqual(1, File(lineage="a" * 36 + "/").depth)
+        self.assertEqual(3, File(lineage=("a" * 36 + "/") * 3).depth)
+
+    def test__model__file__height__file(self):
+        file = File(uuid="c", is_directory=False, lineage=("a" * 36 + "/") * 3)
+
+        self.assertEqual(1, file.height())
+        mock.wrapper.session.query.assert_not_called()
+
+    @patch("models.file.func")
+    @patch("models.file.File.in_lineage")
+    @patch("models.file.File.device")
+    def test__model__file__height__directory(self, device_patch, in_lineage_patch, func_patch):
+        directory = File(uuid="b", device="my-device", is_directory=True, lineage=("a" * 36 + "/") * 2)
+        query = mock.wrapper.session.query
+        device_patch.__eq__.return_value = "device-eq"
+        query().filter().scalar.return_value = 37 * 5
+
+        self.assertEqual(4, directory.height())
+        func_patch.length.assert_called_with(File.lineage)
+        func_patch.max.assert_called_with(func_patch.length.return_value)
+        query.assert_called_with(func_patch.max.return_value)
+        in_lineage_patch.assert_called_with(directory.lineage)
+        query().filter.assert_called_with("device-eq", in_lineage_patch())
+
+    def test__model__file__fits_into(self):
+        parent_dir = File(lineage=("a" * 36 + "/") * (LINEAGE_DEPTH - 2))
+
+        self.assertTrue(File.fits_into(None))
+        self.assertTrue(File.fits_into(None, LINEAGE_DEPTH))
+        self.assertFalse(File.fits_into(None, LINEAGE_DEPTH + 1))
+        self.assertTrue(File.fits_into(parent_dir))
+        self.assertTrue(File.fits_into(parent_dir, 2))
+        self.assertFalse(File.fits_into(parent_dir, 3))
+
+    def test__model__file__in_lineage(self):
+        compiled = File.in_lineage("a/b/").compile()
+
+        self.assertRegex(str(compiled), r"^.+ >= :param_1 AND .+ < :param_2$")
+        self.assertEqual({"param_1": "a/b/", "param_2": "a/b0"}, compiled.params)
+
+    @patch("models.file.File.in_lineage")
+    @patch("models.file.File.device")
+    def test__model__file__subtree(self, device_patch, in_lineage_patch):
+        file = File(uuid="b", device="my-device", lineage="a/b/")
+        query = mock.wrapper.session.query
+        device_patch.__eq__.return_value = "device-eq"
+
+        expected_result = query().filter().all()
+        actual_result = file.subtree()
+
+        self.assertEqual(expected_result, actual_result)
+        query.assert_called_with(File.uuid, File.parent_dir_uuid, File.is_directory)
+        device_patch.__eq__.assert_called_with("my-device")
+        in_lineage_patch.assert_called_with("a/b/")
+        query().filter.assert_called_with("device-eq", in_lineage_patch())
+
+    @patch("models.file.func")
+    @patch("models.file.literal")
+    @patch("models.file.File.in_lineage")
+    @patch("models.file.File.lineage")
+    def test__model__file__move(self, lineage_patch, in_lineage_patch, literal_patch, func_patch):
+        file = File(uuid="c", device="my-device", filename="old", parent_dir_uuid="b", lineage="a/b/c/")
+        new_parent = File(uuid="d", lineage="d/")
+        query = mock.wrapper.session.query
+
+        file.move(new_parent, "new")
+
+        self.assertEqual("new", file.filename)
+        self.assertEqual("d", file.parent_dir_uuid)
+        self.assertEqual("d/c/", file.lineage)
+        query.assert_called_with(File)
+        in_lineage_patch.assert_called_with("a/b/c/")
+        func_patch.substr.assert_called_with(lineage_patch, 7, type_=String)
+        literal_patch.assert_called_with("d/c/", String)
+        query().filter().update.assert_called_with(
+            {lineage_patch: literal_patch() + func_patch.substr()}, synchronize_session=False
+        )
+
+    @patch("models.file.File.in_lineage")
+    @patch("models.file.File.lineage")
+    def test__model__file__move__root_directory(self, lineage_patch, in_lineage_patch):
+        file = File(uuid="c", device="my-device", filename="old", parent_dir_uuid="b", lineage="a/b/c/")
+
+        file.move(None, "new")
+
+        self.assertIsNone(file.parent_dir_uuid)
+        self.assertEqual("c/", file.lineage)
+
+    @patch("models.file.DELETE_CHUNK_SIZE", 2)
+    @patch("models.file.FileContent.file_uuid")
+    @patch("models.file.File.uuid")
+    def test__model__file__delete_many(self, uuid_patch, file_uuid_patch):
+        File.delete_many("my-device", ["a", "b", "c", "d", "e"])
+
+        self.assertEqual([call(["a", "b"]), call(["c", "d"]), call(["e"])], uuid_patch.in_.call_args_list)
+        self.assertEqual([call(["a", "b"]), call(["c", "d"]), call(["e"])], file_uuid_patch.in_.call_args_list)
+        self.assertEqual([call(FileContent), call(File)] * 3, mock.wrapper.session.query.call_args_list)
+        self.assertEqual(6, mock.wrapper.session.query().filter().delete.call_count)
+        mock.wrapper.session.query().filter().delete.assert_called_with(synchronize_session=False)
@@ -1,11 +1,18 @@
 import math
 from copy import deepcopy
+from types import SimpleNamespace
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import patch, call
 
+from mock.inventory import Inventory
 from mock.mock_loader import mock
+import stats
+from models.device import Device
+from models.file import File, FileContent
+from models.hardware import Hardware
 from models.service import Service
 from models.workload import Workload
+from resource_vector import ResourceVector
 from resources import game_content
 from vars import hardware
 
@@ -13,6 +20,18 @@ from vars import hardware
 class TestGameContent(TestCase):
     def setUp(self):
         mock.reset_mocks()
+        stats.reset()
+        game_content.sent_allocations.clear()
+        mock.wrapper.session.info = {}
+
+        enqueue_patcher = patch("resources.game_content.enqueue_microservice")
+        self.enqueue_patch = enqueue_patcher.start()
+        self.addCleanup(enqueue_patcher.stop)
+
+        workloads_patcher = patch("resources.game_content.workloads")
+        self.workloads_patch = workloads_patcher.start()
+        self.workloads_patch.evict.return_value = []
+        self.addCleanup(workloads_patcher.stop)
 
         self.query_service = mock.MagicMock()
         self.query_workload = mock.MagicMock()
@@ -95,28 +114,61 @@ class TestGameContent(TestCase):
             "case": "case",
             "processorCooler": ["cooler1"],
         }
-        inventory = [
-            *elements["cpu"],
-            *elements["gpu"],
-            elements["mainboard"],
-            *elements["ram"],
-            *elements["disk"],
-            elements["powerPack"],
-            elements["case"],
-            *elements["processorCooler"],
-        ]
+        inventory = mock.m.contact_microservice.side_effect = Inventory(
+            {
+                "super": [
+                    *elements["cpu"],
+                    *elements["gpu"],
+                    elements["mainboard"],
+                    *elements["ram"],
+                    *elements["disk"],
+                    elements["powerPack"],
+                    elements["case"],
+                    *elements["processorCooler"],
+                    "cpu1",
+                ],
+                "other": ["case"],
+            }
+        )
+
+        self.assertTrue(game_content.delete_items("super", elements))
+
+        self.assertEqual({"cpu1": 1}, inventory.items["super"])
+        self.assertEqual({"case": 1}, inventory.items["other"])
+        self.assertEqual([("inventory", "delete_many_by_name")], inventory.requests)
+
+    def test__delete_items__incomplete(self):
+        elements = {
+            "cpu": ["cpu1", "cpu2"],
+            "gpu": [],
+            "mainboard": "mainboard",
+            "ram": ["ram1"],
+            "disk": ["disk1"],
+            "powerPack": "powerPack",
+            "case": "case",
+            "processorCooler": ["cooler1", "cooler1"],
+        }
+        items = ["cpu1", "cpu2", "mainboard", "ram1", "disk1", "powerPack", "case", "cooler1"]
+        inventory = mock.m.contact_microservice.side_effect = Inventory({"super": items})
+
+        self.assertFalse(game_content.delete_items("super", elements))
 
-        def handle_delete_endpoint(ms, path, data):
-            self.assertEqual("inventory", ms)
-            self.assertEqual(["inventory", "delete_by_name"], path)
-            self.assertEqual("super", data["owner"])
-            inventory.remove(data["item_name"])
+        self.assertEqual(Inventory({"super": items}).items, inventory.items)
+        self.assertEqual([("inventory", "delete_many_by_name")], inventory.requests)
 
-        mock.m.contact_microservice.side_effect = handle_delete_endpoint
+    def test__return_items(self):
+        game_content.return_items("super", ["cpu1", "case", "ram1"])
 
-        game_content.delete_items("super", elements)
+        self.enqueue_patch.assert_called_once_with(
+            "inventory",
+            ["inventory", "create_many"],
+            {"item_names": ["cpu1", "case", "ram1"], "owner": "super", "related_ms": "device"},
+        )
+
+    def test__return_items__nothing(self):
+        game_content.return_items("super", [])
 
-        self.assertFalse(inventory)
+        self.enqueue_patch.assert_not_called()
 
     def test__check_element_existence(self):
         elements = {
@@ -144,7 +196,7 @@ class TestGameContent(TestCase):
         self.assertEqual(expected_result, actual_result)
 
     def test__generate_scale_with_no_new(self):
-        workload = mock.MagicMock()
+        workload = Workload()
         workload.performance_cpu = 29
         workload.performance_ram = 23
         workload.performance_gpu = 19
@@ -156,7 +208,7 @@ class TestGameContent(TestCase):
         workload.usage_disk = 0
         workload.usage_network = 50
 
-        expected_result = 1.0, 23 / 30, 19 / 40, 1, 0.26
+        expected_result = ResourceVector(1.0, 23 / 30, 19 / 40, 1, 0.26)
         actual_result = game_content.generate_scale_with_no_new(workload)
 
         self.assertEqual(expected_result, actual_result)
@@ -164,24 +216,15 @@ class TestGameContent(TestCase):
     @patch("resources.game_content.generate_scale_with_no_new")
     def test__calculate_real_use(self, gen_scal):
         workload = mock.MagicMock()
-        service = mock.MagicMock()
-        service.allocated_cpu = 1
-        service.allocated_ram = 1
-        service.allocated_gpu = 1
-        service.allocated_disk = 1
-        service.allocated_network = 1
+        service = Service()
+        service.overwrite(ResourceVector(1, 10, 100, 1000, 10000))
 
-        self.query_workload.get.return_value = workload
-        self.query_service.get.return_value = service
-
-        gen_scal.return_value = 1, 2, 3, 4, 5
+        gen_scal.return_value = ResourceVector(1, 2, 3, 4, 5)
 
-        expected_result = {"cpu": 1, "ram": 2, "gpu": 3, "disk": 4, "network": 5}
-        result = game_content.calculate_real_use("service-uuid")
+        expected_result = {"cpu": 1, "ram": 20, "gpu": 300, "disk": 4000, "network": 50000}
+        result = game_content.calculate_real_use(service, workload)
 
         self.assertEqual(expected_result, result)
-        self.query_service.get.assert_called_with("service-uuid")
-        self.query_workload.get.assert_called_with(service.device_uuid)
         gen_scal.assert_called_with(workload)
 
     @patch("resources.game_content.check_element_existence")
@@ -800,14 +843,13 @@ class TestGameContent(TestCase):
         expected_performance_network = mainboard["networkPort"]["speed"]
         actual_result = game_content.calculate_power(elements)
 
-        self.assertEqual(expected_performance_cpu, actual_result[0])
-        self.assertEqual(expected_performance_ram, actual_result[1])
-        self.assertEqual(expected_performance_gpu, actual_result[2])
-        self.assertEqual(expected_performance_disk, actual_result[3])
-        self.assertEqual(expected_performance_network, actual_result[4])
+        self.assertEqual(expected_performance_cpu, actual_result.cpu)
+        self.assertEqual(expected_performance_ram, actual_result.ram)
+        self.assertEqual(expected_performance_gpu, actual_result.gpu)
+        self.assertEqual(expected_performance_disk, actual_result.disk)
+        self.assertEqual(expected_performance_network, actual_result.network)
 
-    @patch("resources.game_content.Hardware")
-    def test__create_hardware(self, hardware_patch):
+    def test__list_hardware(self):
         elements = {
             "cpu": ["cpu1", "cpu2"],
             "gpu": ["gpu1", "gpu2"],
@@ -819,9 +861,7 @@ class TestGameContent(TestCase):
             "processorCooler": ["cooler1"],
         }
 
-        def create(device_uuid, element_name, element_type):
-            self.assertEqual("my-device", device_uuid)
-
+        for element_name, element_type in game_content.list_hardware(deepcopy(elements)):
             if element_type in ("cpu", "gpu", "processorCooler", "ram", "disk"):
                 self.assertIn(element_name, elements[element_type])
                 elements[element_type].remove(element_name)
@@ -831,37 +871,200 @@ class TestGameContent(TestCase):
                 self.assertEqual(element_name, elements[element_type])
                 del elements[element_type]
 
-        hardware_patch.create.side_effect = create
-
-        game_content.create_hardware(deepcopy(elements), "my-device")
         self.assertFalse(elements)
 
+    @patch("resources.game_content.list_hardware")
+    @patch("resources.game_content.calculate_power")
+    def test__compile_build(self, calculate_patch, list_patch):
+        template = game_content.compile_build({"some": "build"})
+
+        self.assertEqual(calculate_patch.return_value, template.performance)
+        self.assertEqual(list_patch.return_value, template.hardware_elements)
+        calculate_patch.assert_called_with({"some": "build"})
+        list_patch.assert_called_with({"some": "build"})
+
+    def test__starter_template(self):
+        self.assertEqual(game_content.calculate_power(hardware["start_pc"]), game_content.STARTER_TEMPLATE.performance)
+        self.assertEqual(
+            game_content.list_hardware(hardware["start_pc"]), game_content.STARTER_TEMPLATE.hardware_elements
+        )
+
+    @patch("resources.game_content.provision_devices")
+    def test__provision_device(self, provision_patch):
+        template = game_content.BuildTemplate((1, 2, 3, 4, 5), [("CoreOne", "cpu")])
+        provision_patch.return_value = ["the-device"]
+
+        self.assertEqual("the-device", game_content.provision_device("user", template, True))
+        provision_patch.assert_called_with(["user"], template, True)
+
+    @patch("resources.game_content.Hardware")
+    @patch("resources.game_content.Workload")
+    @patch("resources.game_content.Device")
+    def test__provision_devices(self, device_patch, workload_patch, hardware_patch):
+        template = game_content.BuildTemplate((1, 2, 3, 4, 5), [("CoreOne", "cpu")])
+        devices = [mock.MagicMock(uuid="device-1", owner="user-1"), mock.MagicMock(uuid="device-2", owner="user-2")]
+        device_patch.create.side_effect = devices
+
+        self.assertEqual(devices, game_content.provision_devices(["user-1", "user-2"], template, True))
+
+        device_patch.create.assert_has_calls(
+            [call("user-1", True, True, commit=False), call("user-2", True, True, commit=False)]
+        )
+        workload_patch.create.assert_has_calls(
+            [call("device-1", (1, 2, 3, 4, 5), commit=False), call("device-2", (1, 2, 3, 4, 5), commit=False)]
+        )
+        hardware_patch.create_many.assert_called_once_with(["device-1", "device-2"], [("CoreOne", "cpu")])
+        self.enqueue_patch.assert_has_calls(
+            [
+                call("service", ["device_init"], {"device_uuid": "device-1", "user": "user-1"}),
+                call("service", ["device_init"], {"device_uuid": "device-2", "user": "user-2"}),
+            ]
+        )
+        mock.wrapper.session.commit.assert_called_once_with()
+        mock.wrapper.session.rollback.assert_not_called()
+
+    @patch("resources.game_content.Hardware")
+    @patch("resources.game_content.Workload")
+    @patch("resources.game_content.Device")
+    def test__provision_devices__rollback(self, device_patch, workload_patch, hardware_patch):
+        hardware_patch.create_many.side_effect = RuntimeError
+        template = game_content.BuildTemplate((1, 2, 3, 4, 5), [("CoreOne", "cpu")])
+
+        with self.assertRaises(RuntimeError):
+            game_content.provision_devices(["user"], template)
+
+        device_patch.create.assert_called_with("user", True, False, commit=False)
+        mock.wrapper.session.rollback.assert_called_once_with()
+        mock.wrapper.session.commit.assert_not_called()
+
     def test__scale_resources(self):
-        service = mock.MagicMock()
-        service.allocated_cpu = 2
-        service.allocated_ram = 3
-        service.allocated_gpu = 5
-        service.allocated_disk = 7
-        service.allocated_network = 11
+        services = []
+        for i in range(1, 4):
+            service = Service(service_uuid=f"service-{i}")
+            service.overwrite(ResourceVector(2 * i, 3 * i, 5 * i, 7 * i, 11 * i))
+            services.append(service)
 
-        game_content.scale_resources([service], (0.9, 0.7, 0.5, 0.3, 0.1))
+        game_content.scale_resources("my-device", services, ResourceVector(0.9, 0.7, 0.5, 0.3, 0.1))
 
-        mock.m.contact_microservice.assert_called_with(
+        self.enqueue_patch.assert_called_once_with(
             "service",
-            ["hardware", "scale"],
+            ["hardware", "scale_many"],
             {
-                "service_uuid": service.service_uuid,
-                "cpu": 2 * 0.9,
-                "ram": 3 * 0.7,
-                "gpu": 5 * 0.5,
-                "disk": 7 * 0.3,
-                "network": 11 * 0.1,
+                "device_uuid": "my-device",
+                "services": [
+                    {
+                        "service_uuid": service.service_uuid,
+                        "cpu": 2 * i * 0.9,
+                        "ram": 3 * i * 0.7,
+                        "gpu": 5 * i * 0.5,
+                        "disk": 7 * i * 0.3,
+                        "network": 11 * i * 0.1,
+                    }
+                    for i, service in enumerate(services, 1)
+                ],
             },
         )
 
+    def test__scale_resources__no_services(self):
+        game_content.scale_resources("my-device", [], ResourceVector(0.9, 0.7, 0.5, 0.3, 0.1))
+
+        self.enqueue_patch.assert_not_called()
+        self.assertEqual({}, stats.snapshot())
+
+    @patch("resources.game_content.SCALE_EPSILON", 0.01)
+    def test__scale_resources__unchanged(self):
+        services = [Service(service_uuid=f"service-{i}") for i in range(3)]
+        for service in services:
+            service.overwrite(ResourceVector(2, 3, 1, 1, 1))
+        game_content.sent_allocations.update(
+            {
+                "service-0": ResourceVector(2.005, 3, 1, 1, 1),
+                "service-1": ResourceVector(2, 3, 1, 1.02, 1),
+            }
+        )
+
+        game_content.scale_resources("my-device", services, ResourceVector(1, 1, 1, 1, 1))
+
+        self.enqueue_patch.assert_called_once_with(
+            "service",
+            ["hardware", "scale_many"],
+            {
+                "device_uuid": "my-device",
+                "services": [
+                    {"service_uuid": "service-1", "cpu": 2, "ram": 3, "gpu": 1, "disk": 1, "network": 1},
+                    {"service_uuid": "service-2", "cpu": 2, "ram": 3, "gpu": 1, "disk": 1, "network": 1},
+                ],
+            },
+        )
+        self.assertEqual(
+            {"service-1": ResourceVector(2, 3, 1, 1, 1), "service-2": ResourceVector(2, 3, 1, 1, 1)},
+            mock.wrapper.session.info["allocations"],
+        )
+        self.assertEqual(ResourceVector(2, 3, 1, 1.02, 1), game_content.sent_allocations["service-1"])
+        self.assertEqual({"suppressed_scale_updates": 1}, stats.snapshot())
+
+        game_content._after_commit(mock.wrapper.session)
+        self.assertEqual(ResourceVector(2.005, 3, 1, 1, 1), game_content.sent_allocations["service-0"])
+        self.assertEqual(ResourceVector(2, 3, 1, 1, 1), game_content.sent_allocations["service-1"])
+        self.assertEqual(ResourceVector(2, 3, 1, 1, 1), game_content.sent_allocations["service-2"])
+
+        self.enqueue_patch.reset_mock()
+        game_content.scale_resources("my-device", services, ResourceVector(1, 1, 1, 1, 1))
+
+        self.enqueue_patch.assert_not_called()
+        self.assertEqual({"suppressed_scale_updates": 4, "suppressed_scale_messages": 1}, stats.snapshot())
+
+    def test__remember_allocation(self):
+        self.assertTrue(game_content.remember_allocation("my-service", ResourceVector(1, 2, 3, 4, 5)))
+        self.assertFalse(game_content.remember_allocation("my-service", ResourceVector(1, 2, 3, 4, 5)))
+        self.assertTrue(game_content.remember_allocation("my-service", ResourceVector(1, 2, 3, 4, 6)))
+        self.assertEqual({}, game_content.sent_allocations)
+
+        game_content._after_commit(mock.wrapper.session)
+
+        self.assertEqual({"my-service": ResourceVector(1, 2, 3, 4, 6)}, game_content.sent_allocations)
+        self.assertEqual({}, mock.wrapper.session.info)
+        self.assertFalse(game_content.remember_allocation("my-service", ResourceVector(1, 2, 3, 4, 6)))
+
+    def test__remember_allocation__rolled_back(self):
+        game_content.sent_allocations["my-service"] = ResourceVector(1, 2, 3, 4, 5)
+        self.assertTrue(game_content.remember_allocation("my-service", ResourceVector(1, 2, 3, 4, 6)))
+
+        game_content._after_transaction_end(mock.wrapper.session, SimpleNamespace(parent=SimpleNamespace(parent=None)))
+        self.assertIn("allocations", mock.wrapper.session.info)
+
+        game_content._after_transaction_end(mock.wrapper.session, SimpleNamespace(parent=None))
+
+        self.assertEqual({}, mock.wrapper.session.info)
+        self.assertEqual({"my-service": ResourceVector(1, 2, 3, 4, 5)}, game_content.sent_allocations)
+        self.assertTrue(game_content.remember_allocation("my-service", ResourceVector(1, 2, 3, 4, 6)))
+
+    def test__forget_allocations(self):
+        game_content.sent_allocations.update({"a": ResourceVector(1, 1, 1, 1, 1), "b": ResourceVector(2, 2, 2, 2, 2)})
+        mock.wrapper.session.info["allocations"] = {
+            "a": ResourceVector(3, 3, 3, 3, 3),
+            "d": ResourceVector(4, 4, 4, 4, 4),
+        }
+
+        game_content.forget_allocations(["a", "c"])
+
+        self.assertEqual({"b": ResourceVector(2, 2, 2, 2, 2)}, game_content.sent_allocations)
+        self.assertEqual({"d": ResourceVector(4, 4, 4, 4, 4)}, mock.wrapper.session.info["allocations"])
+
+    @patch("resources.game_content.event")
+    def test__track_allocations(self, event_patch):
+        game_content.track_allocations()
+
+        event_patch.listen.assert_has_calls(
+            [
+                call(mock.wrapper.Session, "after_commit", game_content._after_commit),
+                call(mock.wrapper.Session, "after_transaction_end", game_content._after_transaction_end),
+            ]
+        )
+
     def test__generate_scale(self):
-        data = 2, 3, 5, 7, 11
-        workload = mock.MagicMock()
+        data = ResourceVector(2, 3, 5, 7, 11)
+        workload = Workload()
         workload.performance_cpu = 29
         workload.performance_ram = 23
         workload.performance_gpu = 19
@@ -873,12 +1076,12 @@ class TestGameContent(TestCase):
         workload.usage_disk = 0
         workload.usage_network = 50
 
-        expected_result = 1, 23 / 33, 19 / 45, 1, 13 / 61
+        expected_result = ResourceVector(1, 23 / 33, 19 / 45, 1, 13 / 61)
         actual_result = game_content.generate_scale(data, workload)
 
         self.assertEqual(expected_result, actual_result)
 
-        workload = mock.MagicMock()
+        workload = Workload()
         workload.performance_cpu = 20
         workload.performance_ram = 30
         workload.performance_gpu = 40
@@ -890,35 +1093,17 @@ class TestGameContent(TestCase):
         workload.usage_disk = 17
         workload.usage_network = 13
 
-        expected_result = 20 / 31, 1, 1, 1 / 24, 1
+        expected_result = ResourceVector(20 / 31, 1, 1, 1 / 24, 1)
         actual_result = game_content.generate_scale(data, workload)
 
         self.assertEqual(expected_result, actual_result)
 
-    def test__dict2tuple(self):
-        data = {}
-        expected_result = []
-        for k in ["cpu", "ram", "gpu", "disk", "network"]:
-            data[k] = k + "_value"
-            expected_result.append(data[k])
-        expected_result = tuple(expected_result)
-
-        actual_result = game_content.dict2tuple(data)
-
-        self.assertEqual(expected_result, actual_result)
-
-    def test__turn(self):
-        data = 1, -2, 3, -4, 5
-
-        expected_result = -1, 2, -3, 4, -5
-        actual_result = game_content.turn(data)
-
-        self.assertEqual(expected_result, actual_result)
-
     def test__stop_all_services(self):
-        services = [1, 2, 3, 4]
+        services = [mock.MagicMock() for _ in range(4)]
         self.query_service.filter_by().all.return_value = services.copy()
-        workload = mock.MagicMock()
+        game_content.sent_allocations.update({s.service_uuid: ResourceVector(1, 1, 1, 1, 1) for s in services[:2]})
+        game_content.sent_allocations["other"] = ResourceVector(1, 1, 1, 1, 1)
+        workload = Workload()
         self.query_workload.get.return_value = workload
 
         def delete_handler(obj):
@@ -927,6 +1112,7 @@ class TestGameContent(TestCase):
         mock.wrapper.session.delete.side_effect = delete_handler
 
         game_content.stop_all_service("my-device")
+        self.workloads_patch.evict.assert_called_with(["my-device"])
         self.query_service.filter_by.assert_called_with(device_uuid="my-device")
         self.query_workload.get.assert_called_with("my-device")
         self.assertEqual(0, workload.usage_cpu)
@@ -935,12 +1121,22 @@ class TestGameContent(TestCase):
         self.assertEqual(0, workload.usage_disk)
         self.assertEqual(0, workload.usage_network)
         self.assertFalse(services)
+        self.assertEqual({"other": ResourceVector(1, 1, 1, 1, 1)}, game_content.sent_allocations)
         mock.wrapper.session.commit.assert_called_with()
 
+    def test__stop_all_services__forgets_evicted_services(self):
+        self.query_service.filter_by().all.return_value = []
+        self.workloads_patch.evict.return_value = ["not-written-yet"]
+        game_content.sent_allocations["not-written-yet"] = ResourceVector(1, 1, 1, 1, 1)
+
+        game_content.stop_all_service("my-device")
+
+        self.assertEqual({}, game_content.sent_allocations)
+
     def test__stop_all_services__delete(self):
-        services = [1, 2, 3, 4]
+        services = [mock.MagicMock() for _ in range(4)]
         self.query_service.filter_by().all.return_value = services.copy()
-        workload = mock.MagicMock()
+        workload = Workload()
         self.query_workload.get.return_value = workload
         services.append(workload)
 
@@ -960,12 +1156,44 @@ class TestGameContent(TestCase):
         self.assertEqual(0, workload.usage_disk)
         self.assertEqual(0, workload.usage_network)
 
+    @patch("models.device.Device.uuid")
+    @patch("models.service.Service.device_uuid")
+    @patch("models.workload.Workload.uuid")
+    @patch("models.hardware.Hardware.device_uuid")
+    @patch("models.file.File.device")
+    @patch("models.file.FileContent.device")
+    def test__purge_devices(
+        self, file_content_patch, file_patch, hardware_patch, workload_patch, service_patch, device_patch
+    ):
+        queries = {model: mock.MagicMock() for model in (FileContent, File, Hardware, Workload, Service, Device)}
+        mock.wrapper.session.query.side_effect = queries.__getitem__
+        columns = {
+            FileContent: file_content_patch,
+            File: file_patch,
+            Hardware: hardware_patch,
+            Workload: workload_patch,
+            Service: service_patch,
+            Device: device_patch,
+        }
+
+        game_content.purge_devices(["device-1", "device-2"])
+
+        self.workloads_patch.evict.assert_called_with(["device-1", "device-2"])
+        for model, column in columns.items():
+            column.in_.assert_called_with(["device-1", "device-2"])
+            queries[model].filter.assert_called_with(column.in_())
+            queries[model].filter().delete.assert_called_with(synchronize_session=False)
+
+    def test__purge_devices__no_devices(self):
+        game_content.purge_devices([])
+
+        mock.wrapper.session.query.assert_not_called()
+        self.workloads_patch.evict.assert_not_called()
+
     def test__stop_services(self):
         game_content.stop_services("some device")
-        mock.m.contact_microservice.assert_called_with("service", ["hardware", "stop"], {"device_uuid": "some device"})
+        self.enqueue_patch.assert_called_with("service", ["hardware", "stop"], {"device_uuid": "some device"})
 
     def test__delete_services(self):
         game_content.delete_services("some device")
-        mock.m.contact_microservice.assert_called_with(
-            "service", ["hardware", "delete"], {"device_uuid": "some device"}
-        )
+        self.enqueue_patch.assert_called_with("service", ["hardware", "delete"], {"device_uuid": "some device"})
@@ -2,23 +2,36 @@ from unittest import TestCase
 from unittest.mock import patch
 
 from mock.mock_loader import mock
+from models.device import access_cache
 from models.service import Service
-from models.workload import Workload
+from resource_vector import ResourceVector
 
 from resources import hardware
 from schemes import device_not_found, service_already_running, service_not_running, success, service_not_found
 
 
+def make_service(service_uuid: str, allocation: ResourceVector) -> Service:
+    service = Service(service_uuid=service_uuid)
+    service.overwrite(allocation)
+    return service
+
+
 class TestHardware(TestCase):
     def setUp(self):
         mock.reset_mocks()
+        access_cache.clear()
+
+        workloads_patcher = patch("resources.hardware.workloads")
+        self.workloads = workloads_patcher.start()
+        self.addCleanup(workloads_patcher.stop)
 
-        self.query_service = mock.MagicMock()
-        self.query_workload = mock.MagicMock()
-        mock.wrapper.session.query.side_effect = {
-            Service: self.query_service,
-            Workload: self.query_workload,
-        }.__getitem__
+        self.device = self.workloads.device.return_value
+        self.device.services = {}
+        self.workloads.find_service.return_value = None
+
+        enqueue_patcher = patch("resources.hardware.enqueue_user")
+        self.enqueue_patch = enqueue_patcher.start()
+        self.addCleanup(enqueue_patcher.stop)
 
     @patch("resources.hardware.check_compatible")
     def test__user_endpoint__hardware_build__not_compatible(self, check_compatible_patch):
@@ -37,7 +50,7 @@ class TestHardware(TestCase):
         check_compatible_patch.return_value = True, {}
         data = mock.MagicMock()
 
-        expected_result = {"success": True, "performance": calculate_power_patch()}
+        expected_result = {"success": True, "performance": tuple(calculate_power_patch())}
         actual_result = hardware.build(data, "user")
 
         self.assertEqual(expected_result, actual_result)
@@ -45,146 +58,144 @@ class TestHardware(TestCase):
         calculate_power_patch.assert_called_with(data)
 
     def test__user_endpoint__hardware_resources__device_not_found(self):
-        self.query_workload.get.return_value = None
+        self.workloads.device.return_value = None
 
         expected_result = device_not_found
         actual_result = hardware.hardware_resources({"device_uuid": "some-device"}, "user")
 
         self.assertEqual(expected_result, actual_result)
-        self.query_workload.get.assert_called_with("some-device")
+        self.workloads.device.assert_called_with("some-device")
 
     def test__user_endpoint__hardware_resources__successful(self):
-        mock_workload = mock.MagicMock()
-        self.query_workload.get.return_value = mock_workload
-
-        expected_result = mock_workload.serialize
+        expected_result = self.device.workload.serialize
         actual_result = hardware.hardware_resources({"device_uuid": "some-device"}, "user")
 
         self.assertEqual(expected_result, actual_result)
-        self.query_workload.get.assert_called_with("some-device")
+        self.workloads.device.assert_called_with("some-device")
 
     def test__user_enpoint__hardware_proccess__service_not_found(self):
-        self.query_service.get.return_value = None
         expected_result = service_not_found
         actual_result = hardware.hardware_process({"service_uuid": "the-service-uuid"}, "user")
 
         self.assertEqual(expected_result, actual_result)
-        self.query_service.get.assert_called_with("the-service-uuid")
+        self.workloads.find_service.assert_called_with("the-service-uuid")
+
+    def test__user_enpoint__hardware_proccess__stopped_meanwhile(self):
+        self.workloads.find_service.return_value = self.device
+
+        expected_result = service_not_found
+        actual_result = hardware.hardware_process({"service_uuid": "the-service-uuid"}, "user")
+
+        self.assertEqual(expected_result, actual_result)
 
     @patch("resources.hardware.calculate_real_use")
     def test__user_enpoint__hardware_proccess__successful(self, calculate_real_use):
-        self.query_service.get.return_value = "service"
+        self.workloads.find_service.return_value = self.device
+        self.device.services["the-service-uuid"] = service = mock.MagicMock()
+
         expected_result = calculate_real_use()
         actual_result = hardware.hardware_process({"service_uuid": "the-service-uuid"}, "user")
 
         self.assertEqual(expected_result, actual_result)
-        self.query_service.get.assert_called_with("the-service-uuid")
-        calculate_real_use.assert_called_with("the-service-uuid")
+        self.workloads.find_service.assert_called_with("the-service-uuid")
+        calculate_real_use.assert_called_with(service, self.device.workload)
 
     @patch("resources.hardware.hardware")
     def test__user_endpoint__hardware_list(self, hardware_patch):
         self.assertEqual(hardware_patch, hardware.hardware_list({}, ""))
 
     def test__ms_endpoint__hardware_register__device_not_found(self):
-        self.query_workload.get.return_value = None
+        self.workloads.device.return_value = None
 
         expected_result = device_not_found
         actual_result = hardware.hardware_register({"device_uuid": "the-device"}, "ms")
 
         self.assertEqual(expected_result, actual_result)
-        self.query_workload.get.assert_called_with("the-device")
+        self.workloads.device.assert_called_with("the-device")
 
     def test__ms_endpoint__hardware_register__service_already_running(self):
-        mock_workload = mock.MagicMock()
-        self.query_workload.get.return_value = mock_workload
-        self.query_service.get.return_value = mock.MagicMock()
+        self.workloads.find_service.return_value = mock.MagicMock()
 
         expected_result = service_already_running
         actual_result = hardware.hardware_register({"device_uuid": "the-device", "service_uuid": "my-service"}, "ms")
 
         self.assertEqual(expected_result, actual_result)
-        self.query_workload.get.assert_called_with("the-device")
-        self.query_service.get.assert_called_with("my-service")
+        self.workloads.device.assert_called_with("the-device")
+        self.workloads.find_service.assert_called_with("my-service")
+        self.workloads.add_service.assert_not_called()
 
-    @patch("resources.hardware.Service.create")
+    @patch("resources.hardware.remember_allocation")
     @patch("resources.hardware.scale_resources")
     @patch("resources.hardware.generate_scale")
-    @patch("resources.hardware.dict2tuple")
-    def test__ms_endpoint__hardware_register__successful(
-        self, dict_patch, generate_scale_patch, scale_patch, service_create_patch
-    ):
-        mock_workload = mock.MagicMock()
-        other_services = [mock.MagicMock() for _ in range(5)]
-        self.query_workload.get.return_value = mock_workload
-        self.query_service.get.return_value = None
-        self.query_service.filter_by().all.return_value = other_services
-        dict_patch.return_value = 1, 2, 3, 4, 5
-        scales = generate_scale_patch.return_value = 2, 3, 5, 7, 11
-
-        ser = mock.MagicMock()
-        ser.allocated_cpu = 21
-        ser.allocated_ram = 13
-        ser.allocated_gpu = 8
-        ser.allocated_disk = 5
-        ser.allocated_network = 3
-        service_create_patch.return_value = ser
+    def test__ms_endpoint__hardware_register__successful(self, generate_scale_patch, scale_patch, remember_patch):
+        other_services = [make_service(f"service-{i}", ResourceVector(1, 1, 1, 1, 1)) for i in range(5)]
+        self.device.services = {s.service_uuid: s for s in other_services}
+        scales = generate_scale_patch.return_value = ResourceVector(2, 3, 5, 7, 11)
+
+        ser = make_service("my-service", ResourceVector(21, 13, 8, 5, 3))
+        self.workloads.add_service.return_value = ser
+
+        access_cache.get_or_load(("user", "the-device"), lambda: False)
+        access_cache.get_or_load(("other-user", "the-device"), lambda: True)
 
         data = {"device_uuid": "the-device", "service_uuid": "my-service", "user": "user"}
+        data.update({"cpu": 1, "ram": 2, "gpu": 3, "disk": 4, "network": 5})
 
         expected_result = {
-            "service_uuid": ser.service_uuid,
-            "cpu": ser.allocated_cpu * scales[0],
-            "ram": ser.allocated_ram * scales[1],
-            "gpu": ser.allocated_gpu * scales[2],
-            "disk": ser.allocated_disk * scales[3],
-            "network": ser.allocated_network * scales[4],
+            "service_uuid": "my-service",
+            "cpu": 21 * 2,
+            "ram": 13 * 3,
+            "gpu": 8 * 5,
+            "disk": 5 * 7,
+            "network": 3 * 11,
         }
         actual_result = hardware.hardware_register(data, "ms")
 
         self.assertEqual(expected_result, actual_result)
-        self.query_service.filter_by.assert_called_with(device_uuid="the-device")
-        dict_patch.assert_called_with(data)
-        generate_scale_patch.assert_called_with(dict_patch(), mock_workload)
-        scale_patch.assert_called_with(other_services, generate_scale_patch())
-        mock_workload.service.assert_called_with(dict_patch())
-        service_create_patch.assert_called_with("the-device", "my-service", dict_patch())
-        mock_workload.workload_notification.assert_called_with("device-hardware-register")
-        mock.m.contact_user.assert_called_with("user", mock_workload.workload_notification())
+        generate_scale_patch.assert_called_with(ResourceVector(1, 2, 3, 4, 5), self.device.workload)
+        scale_patch.assert_called_with("the-device", other_services, scales)
+        self.workloads.add_service.assert_called_with(self.device, "my-service", ResourceVector(1, 2, 3, 4, 5))
+        remember_patch.assert_called_with("my-service", ResourceVector(42, 39, 40, 35, 33))
+        self.device.workload.workload_notification.assert_called_with("device-hardware-register")
+        self.enqueue_patch.assert_called_with("user", self.device.workload.workload_notification())
+        mock.wrapper.session.commit.assert_called_with()
+        self.assertEqual(1, access_cache.info()["size"])
+        self.assertTrue(access_cache.get_or_load(("other-user", "the-device"), mock.MagicMock()))
+
+    def test__ms_endpoint__hardware_stop__device_not_found(self):
+        self.workloads.device.return_value = None
 
-    def test__ms_endpoint__hardware_stop__service_not_running(self):
-        self.query_service.get.return_value = None
         data = {"device_uuid": "the-device", "service_uuid": "my-service", "user": "user"}
 
-        expected_result = service_not_running
+        expected_result = device_not_found
         actual_result = hardware.hardware_stop(data, "ms")
 
         self.assertEqual(expected_result, actual_result)
-        self.query_service.get.assert_called_with("my-service")
-
-    def test__ms_endpoint__hardware_stop__device_not_found(self):
-        mock_service = mock.MagicMock()
-        self.query_service.get.return_value = mock_service
-        self.query_workload.get.return_value = None
+        self.workloads.device.assert_called_with("the-device")
 
+    def test__ms_endpoint__hardware_stop__service_not_running(self):
         data = {"device_uuid": "the-device", "service_uuid": "my-service", "user": "user"}
 
-        expected_result = device_not_found
+        expected_result = service_not_running
         actual_result = hardware.hardware_stop(data, "ms")
 
         self.assertEqual(expected_result, actual_result)
-        self.query_service.get.assert_called_with("my-service")
-        self.query_workload.get.assert_called_with("the-device")
+        self.workloads.remove_service.assert_not_called()
 
+    @patch("resources.hardware.forget_allocations")
     @patch("resources.hardware.scale_resources")
     @patch("resources.hardware.generate_scale")
-    @patch("resources.hardware.turn")
-    def test__ms_endpoint__hardware_stop__successful(self, turn_patch, generate_patch, scale_patch):
-        mock_service = mock.MagicMock()
-        mock_workload = mock.MagicMock()
-        other_services = [mock.MagicMock() for _ in range(5)]
-        self.query_service.get.return_value = mock_service
-        self.query_workload.get.return_value = mock_workload
-        self.query_service.filter_by().all.return_value = other_services
+    def test__ms_endpoint__hardware_stop__successful(self, generate_patch, scale_patch, forget_patch):
+        mock_service = make_service("my-service", ResourceVector(1, 2, 3, 4, 5))
+        other_services = [make_service(f"service-{i}", ResourceVector(1, 1, 1, 1, 1)) for i in range(5)]
+        self.device.services = {s.service_uuid: s for s in [mock_service, *other_services]}
+
+        def remove_service(device, service_uuid):
+            return device.services.pop(service_uuid)
+
+        self.workloads.remove_service.side_effect = remove_service
+        access_cache.get_or_load(("user", "the-device"), lambda: True)
+        access_cache.get_or_load(("user", "other-device"), lambda: True)
 
         data = {"device_uuid": "the-device", "service_uuid": "my-service", "user": "user"}
 
@@ -192,72 +203,63 @@ class TestHardware(TestCase):
         actual_result = hardware.hardware_stop(data, "ms")
 
         self.assertEqual(expected_result, actual_result)
-        self.query_service.get.assert_called_with("my-service")
-        self.query_workload.get.assert_called_with("the-device")
-        mock_service.export.assert_called_with()
-        turn_patch.assert_called_with(mock_service.export())
-        mock.wrapper.session.delete.assert_called_with(mock_service)
-        mock.wrapper.session.commit.assert_called_with()
-        mock_workload.service.assert_called_with(turn_patch())
-        generate_patch.assert_called_with(turn_patch(), mock_workload)
-        self.query_service.filter_by.assert_called_with(device_uuid="the-device")
-        scale_patch.assert_called_with(other_services, generate_patch())
-        mock_workload.workload_notification.assert_called_with("device-hardware-stop")
-        mock.m.contact_user.assert_called_with("user", mock_workload.workload_notification())
+        self.workloads.device.assert_called_with("the-device")
+        self.workloads.remove_service.assert_called_with(self.device, "my-service")
+        forget_patch.assert_called_with(["my-service"])
+        generate_patch.assert_called_with(ResourceVector(-1, -2, -3, -4, -5), self.device.workload)
+        scale_patch.assert_called_with("the-device", other_services, generate_patch())
+        self.device.workload.workload_notification.assert_called_with("device-hardware-stop")
+        self.enqueue_patch.assert_called_with("user", self.device.workload.workload_notification())
+        mock.wrapper.session.commit.assert_called_once_with()
+        self.assertEqual(1, access_cache.info()["size"])
+
+    def test__ms_endpoint__hardware_scale__device_not_found(self):
+        self.workloads.device.return_value = None
+        data = {"device_uuid": "the-device", "service_uuid": "my-service", "user": "user"}
+
+        expected_result = service_not_found
+        actual_result = hardware.hardware_scale(data, "ms")
+
+        self.assertEqual(expected_result, actual_result)
+        self.workloads.device.assert_called_with("the-device")
 
     def test__ms_endpoint__hardware_scale__service_not_found(self):
         data = {"device_uuid": "the-device", "service_uuid": "my-service", "user": "user"}
-        self.query_service.get.return_value = None
 
         expected_result = service_not_found
         actual_result = hardware.hardware_scale(data, "ms")
 
         self.assertEqual(expected_result, actual_result)
-        self.query_service.get.assert_called_with("my-service")
+        self.workloads.scale_service.assert_not_called()
 
     @patch("resources.hardware.scale_resources")
     @patch("resources.hardware.generate_scale")
-    @patch("resources.hardware.dict2tuple")
-    @patch("resources.hardware.turn")
-    def test__ms_endpoint__hardware_scale__successful(self, turn_patch, dict_patch, generate_patch, scale_patch):
+    def test__ms_endpoint__hardware_scale__successful(self, generate_patch, scale_patch):
         data = {"device_uuid": "the-device", "service_uuid": "my-service", "user": "user"}
+        data.update({"cpu": 21, "ram": 13, "gpu": 8, "disk": 5, "network": 3})
 
-        mock_service = mock.MagicMock()
-        mock_service.allocated_cpu = 21
-        mock_service.allocated_ram = 13
-        mock_service.allocated_gpu = 8
-        mock_service.allocated_disk = 5
-        mock_service.allocated_network = 3
-
-        mock_workload = mock.MagicMock()
-        other_services = [mock.MagicMock() for _ in range(5)]
-        self.query_service.get.return_value = mock_service
-        self.query_workload.get.return_value = mock_workload
-        self.query_service.filter_by().all.return_value = other_services
-        scales = generate_patch.return_value = 2, 3, 5, 7, 11
-
-        expected_calls = [turn_patch(), dict_patch()]
-        mock_workload.service.side_effect = lambda a: self.assertEqual(expected_calls.pop(0), a)
+        mock_service = make_service("my-service", ResourceVector(1, 2, 3, 4, 5))
+        other_services = [make_service(f"service-{i}", ResourceVector(1, 1, 1, 1, 1)) for i in range(5)]
+        self.device.services = {s.service_uuid: s for s in [mock_service, *other_services]}
+        scaled_service = make_service("my-service", ResourceVector(21, 13, 8, 5, 3))
+        self.workloads.scale_service.return_value = scaled_service
+        scales = generate_patch.return_value = ResourceVector(2, 3, 5, 7, 11)
 
         expected_result = {
-            "service_uuid": mock_service.service_uuid,
-            "cpu": mock_service.allocated_cpu * scales[0],
-            "ram": mock_service.allocated_ram * scales[1],
-            "gpu": mock_service.allocated_gpu * scales[2],
-            "disk": mock_service.allocated_disk * scales[3],
-            "network": mock_service.allocated_network * scales[4],
+            "service_uuid": "my-service",
+            "cpu": 21 * 2,
+            "ram": 13 * 3,
+            "gpu": 8 * 5,
+            "disk": 5 * 7,
+            "network": 3 * 11,
         }
         actual_result = hardware.hardware_scale(data, "ms")
 
         self.assertEqual(expected_result, actual_result)
-        self.query_service.get.assert_called_with("my-service")
-        self.query_workload.get.assert_called_with("the-device")
-        self.query_service.filter_by.assert_called_with(device_uuid="the-device")
-        mock_service.export.assert_called_with()
-        turn_patch.assert_called_with(mock_service.export())
-        dict_patch.assert_called_with(data)
-        generate_patch.assert_called_with(dict_patch(), mock_workload)
-        mock_service.overwrite.assert_called_with(dict_patch())
-        scale_patch.assert_called_with(other_services, generate_patch())
-        mock_workload.workload_notification.assert_called_with("device-hardware-scale")
-        mock.m.contact_user.assert_called_with("user", mock_workload.workload_notification())
+        self.workloads.device.assert_called_with("the-device")
+        generate_patch.assert_called_with(ResourceVector(20, 11, 5, 1, -2), self.device.workload)
+        self.workloads.scale_service.assert_called_with(self.device, "my-service", ResourceVector(21, 13, 8, 5, 3))
+        scale_patch.assert_called_with("the-device", [mock_service, *other_services], scales)
+        self.device.workload.workload_notification.assert_called_with("device-hardware-scale")
+        self.enqueue_patch.assert_called_with("user", self.device.workload.workload_notification())
+        mock.wrapper.session.commit.assert_called_once_with()
@@ -32,17 +32,21 @@ class TestHardwareModel(TestCase):
         serialized["hardware_type"] = "gpu"
         self.assertEqual(expected_result, hardware.serialize)
 
-    def test__model__hardware__create(self):
-        actual_result = Hardware.create("my-device", "Zero MX One", "mainboard")
-
-        self.assertEqual("my-device", actual_result.device_uuid)
-        self.assertEqual("Zero MX One", actual_result.hardware_element)
-        self.assertEqual("mainboard", actual_result.hardware_type)
-        self.assertRegex(actual_result.uuid, r"[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12}")
-        mock.wrapper.session.add.assert_called_with(actual_result)
-        mock.wrapper.session.commit.assert_called_with()
-
-    def test__model__hardware__create__different_uuid(self):
-        first_element = Hardware.create("my-device", "Zero MX One", "mainboard").uuid
-        second_element = Hardware.create("my-device", "Zero MX One", "mainboard").uuid
-        self.assertNotEqual(first_element, second_element)
+    def test__model__hardware__create_many(self):
+        Hardware.create_many(["device-1", "device-2"], [("Zero MX One", "mainboard"), ("CoreOne", "cpu")])
+
+        model, rows = mock.wrapper.session.bulk_insert_mappings.call_args[0]
+        self.assertEqual(Hardware, model)
+        self.assertEqual(
+            [
+                ("device-1", "Zero MX One", "mainboard"),
+                ("device-1", "CoreOne", "cpu"),
+                ("device-2", "Zero MX One", "mainboard"),
+                ("device-2", "CoreOne", "cpu"),
+            ],
+            [(row["device_uuid"], row["hardware_element"], row["hardware_type"]) for row in rows],
+        )
+        for row in rows:
+            self.assertRegex(row["uuid"], r"[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12}")
+        self.assertEqual(4, len({row["uuid"] for row in rows}))
+        mock.wrapper.session.commit.assert_not_called()
@@ -0,0 +1,229 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, event, MetaData, Table, Column, Index, select, func, and_
+from sqlalchemy.dialects import mysql
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.sql.visitors import replacement_traverse
+
+from mock.mock_loader import mock
+from models.device import Device
+from models.file import File, FileContent
+from models.hardware import Hardware
+from models.service import Service
+
+
+def build_table(metadata: MetaData, model) -> Table:
+    columns = []
+    for name, column in vars(model).items():
+        if isinstance(column, Column):
+            column = column.copy()
+            column.name = column.key = name
+            columns.append(column)
+
+    indexes = [
+        Index(index.name, *index.expressions, **index.dialect_kwargs) for index in getattr(model, "__table_args__", ())
+    ]
+
+    return Table(model.__tablename__, metadata, *columns, *indexes)
+
+
+class RecordedQuery:
+    """
+    Stands in for a query of the session and records which filters, order and limit it was executed with.
+    """
+
+    def __init__(self, executed: list, results, filters=(), order=(), limit_count=None):
+        self.executed = executed
+        self.results = results
+        self.filters = filters
+        self.order = order
+        self.limit_count = limit_count
+
+    def filter(self, *clauses):
+        return RecordedQuery(self.executed, self.results, self.filters + clauses, self.order, self.limit_count)
+
+    def order_by(self, *clauses):
+        return RecordedQuery(self.executed, self.results, self.filters, self.order + clauses, self.limit_count)
+
+    def limit(self, limit_count: int):
+        return RecordedQuery(self.executed, self.results, self.filters, self.order, limit_count)
+
+    def execute(self, *_, **__):
+        self.executed.append(self)
+        return next(self.results, None)
+
+    all = first = scalar = update = execute
+
+
+class TestIndexes(TestCase):
+    """
+    Checks the query plans on SQLite, which only shows that the indexes match the queries.
+    The plans of MySQL are not covered, only the DDL of its indexes is.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine("sqlite://")
+        event.listen(
+            cls.engine,
+            "connect",
+            lambda connection, _: connection.create_collation("utf8_bin", lambda a, b: (a > b) - (a < b)),
+        )
+        metadata = MetaData()
+        cls.device, cls.file, cls.file_content, cls.hardware, cls.service = [
+            build_table(metadata, model) for model in (Device, File, FileContent, Hardware, Service)
+        ]
+        metadata.create_all(cls.engine)
+
+    def setUp(self):
+        mock.reset_mocks()
+
+    def query_plan(self, query) -> str:
+        statement = str(query.compile(self.engine, compile_kwargs={"literal_binds": True}))
+        with self.engine.connect() as connection:
+            return "\n".join(row[-1] for row in connection.execute("EXPLAIN QUERY PLAN " + statement))
+
+    def assertUsesIndex(self, index: str, query, search: str = ""):
+        plan = self.query_plan(query)
+        self.assertRegex(plan, rf"^SEARCH \w+ USING (COVERING )?INDEX {index} \({search}")
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def model_query(self, table: Table, model, run, results=()) -> list:
+        """
+        Runs a method of a model against the session mock and rebuilds the queries it executed on the test table.
+        """
+
+        executed = []
+        with patch.object(mock.wrapper.session, "query", lambda *_: RecordedQuery(executed, iter(results))):
+            run()
+
+        columns = {id(column): name for name, column in vars(model).items() if isinstance(column, Column)}
+
+        def retarget(clause):
+            return replacement_traverse(
+                clause, {}, lambda element: table.c[columns[id(element)]] if id(element) in columns else None
+            )
+
+        statements = []
+        for query in executed:
+            statement = select([table]).where(and_(*map(retarget, query.filters)))
+            if query.order:
+                statement = statement.order_by(*map(retarget, query.order))
+            if query.limit_count is not None:
+                statement = statement.limit(query.limit_count)
+            statements.append(statement)
+
+        return statements
+
+    def file_query(self, run):
+        (statement,) = self.model_query(self.file, File, run)
+        return statement
+
+    def test__file__directory_listing(self):
+        file = self.file.c
+        self.assertUsesIndex(
+            "ix_device_file_device_parent_dir_uuid_filename",
+            select([self.file]).where(and_(file.device == "d", file.parent_dir_uuid == "p")).order_by(file.filename),
+        )
+
+    def test__file__filename_exists(self):
+        file = self.file.c
+        self.assertUsesIndex(
+            "ix_device_file_device_parent_dir_uuid_filename",
+            select([func.count(file.uuid)]).where(
+                and_(file.device == "d", file.filename == "f", file.parent_dir_uuid == "p")
+            ),
+        )
+
+    def test__file__tree(self):
+        self.assertUsesIndex(
+            "ix_device_file_device_lineage",
+            self.file_query(lambda: File.tree("d", None, "a/", 10)),
+            r"device=\? AND lineage>\?\)",
+        )
+
+    def test__file__tree__subtree(self):
+        parent_dir = File(uuid="b", lineage="a/b/")
+        self.assertUsesIndex(
+            "ix_device_file_device_lineage",
+            self.file_query(lambda: File.tree("d", parent_dir, None, 10)),
+            r"device=\? AND lineage>\? AND lineage<\?\)",
+        )
+        self.assertUsesIndex(
+            "ix_device_file_device_lineage",
+            self.file_query(lambda: File.tree("d", parent_dir, "a/b/c/", 10)),
+            r"device=\? AND lineage>\? AND lineage<\?\)",
+        )
+
+    def test__file__subtree(self):
+        self.assertUsesIndex(
+            "ix_device_file_device_lineage",
+            self.file_query(File(uuid="b", device="d", lineage="a/b/").subtree),
+            r"device=\? AND lineage>\? AND lineage<\?\)",
+        )
+
+    def test__file__move(self):
+        file = File(uuid="c", device="d", filename="f", parent_dir_uuid="b", lineage="a/b/c/")
+        self.assertUsesIndex(
+            "ix_device_file_device_lineage",
+            self.file_query(lambda: file.move(None, "f")),
+            r"device=\? AND lineage>\? AND lineage<\?\)",
+        )
+
+    def test__file_content__device(self):
+        self.assertUsesIndex(
+            "ix_device_file_content_device", select([self.file_content]).where(self.file_content.c.device == "d")
+        )
+
+    def test__hardware__device_uuid(self):
+        self.assertUsesIndex(
+            "ix_device_hardware_device_uuid", select([self.hardware]).where(self.hardware.c.device_uuid == "d")
+        )
+
+    def test__service__device_uuid(self):
+        self.assertUsesIndex(
+            "ix_device_service_req_device_uuid", select([self.service]).where(self.service.c.device_uuid == "d")
+        )
+
+    def test__device__owner(self):
+        device = self.device.c
+        self.assertUsesIndex(
+            "ix_device_device_owner_powered_on", select([func.count(device.uuid)]).where(device.owner == "u")
+        )
+
+    def test__device__owner_powered_on(self):
+        device = self.device.c
+        self.assertUsesIndex(
+            "ix_device_device_owner_powered_on",
+            select([self.device]).where(and_(device.owner == "u", device.powered_on)),
+        )
+
+    def test__device__random(self):
+        pivot, wrap_around = self.model_query(self.device, Device, lambda: Device.random("u"))
+
+        self.assertUsesIndex("ix_device_device_powered_on_uuid", pivot, r"powered_on=\? AND uuid>\?\)")
+        self.assertUsesIndex("ix_device_device_powered_on_uuid", wrap_around, r"powered_on=\?\)")
+
+    def test__device__random__found_after_pivot(self):
+        statements = self.model_query(self.device, Device, lambda: Device.random("u"), [Device(uuid="x")])
+
+        self.assertEqual(1, len(statements))
+
+    def test__mysql__ddl(self):
+        dialect = mysql.dialect()
+        indexes = {
+            index.name: str(CreateIndex(index).compile(dialect=dialect)).strip()
+            for table in (self.device, self.file, self.file_content, self.hardware, self.service)
+            for index in table.indexes
+        }
+
+        self.assertEqual(
+            "CREATE INDEX ix_device_file_device_lineage ON device_file (device, lineage)",
+            indexes["ix_device_file_device_lineage"],
+        )
+        self.assertEqual(
+            "CREATE INDEX ix_device_device_powered_on_uuid ON device_device (powered_on, uuid)",
+            indexes["ix_device_device_powered_on_uuid"],
+        )
+        self.assertIn("lineage VARCHAR(888) COLLATE utf8_bin", str(CreateTable(self.file).compile(dialect=dialect)))
@@ -0,0 +1,357 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from mock.mock_loader import mock
+import stats
+from ledger import WorkloadLedger, DeviceWorkload
+from models.service import Service
+from models.workload import Workload
+from resource_vector import ResourceVector
+
+
+def make_workload(device_uuid: str = "the-device") -> Workload:
+    return Workload(
+        uuid=device_uuid,
+        performance_cpu=10,
+        performance_ram=10,
+        performance_gpu=10,
+        performance_disk=10,
+        performance_network=10,
+        usage_cpu=1,
+        usage_ram=2,
+        usage_gpu=3,
+        usage_disk=4,
+        usage_network=5,
+    )
+
+
+def make_service(service_uuid: str, device_uuid: str = "the-device") -> Service:
+    service = Service(service_uuid=service_uuid, device_uuid=device_uuid)
+    service.overwrite(ResourceVector(1, 2, 3, 4, 5))
+    return service
+
+
+class TestWorkloadLedger(TestCase):
+    def setUp(self):
+        mock.reset_mocks()
+        stats.reset()
+
+        self.query_workload = mock.MagicMock()
+        self.query_service = mock.MagicMock()
+        mock.wrapper.session.query = mock.MagicMock()
+        mock.wrapper.session.query.side_effect = {
+            Workload: self.query_workload,
+            Service: self.query_service,
+        }.__getitem__
+
+        self.workload = make_workload()
+        self.service = make_service("my-service")
+        self.query_workload.get.return_value = self.workload
+        self.query_service.filter_by().all.return_value = [self.service]
+        self.query_service.get.return_value = None
+
+        time_patcher = patch("ledger.time")
+        self.time_patch = time_patcher.start()
+        self.time_patch.monotonic.return_value = 1000
+        self.addCleanup(time_patcher.stop)
+
+        self.ledger = WorkloadLedger(False, 1, 60)
+
+    def flushed(self):
+        inserted, updated = [], []
+        workloads = []
+        for call in mock.wrapper.session.bulk_insert_mappings.call_args_list:
+            inserted += call[0][1]
+        for call in mock.wrapper.session.bulk_update_mappings.call_args_list:
+            model, rows = call[0]
+            (updated if model is Service else workloads).extend(rows)
+        return inserted, updated, workloads
+
+    def test__device__loaded_once(self):
+        device = self.ledger.device("the-device")
+
+        self.assertIs(device, self.ledger.device("the-device"))
+        self.assertIs(self.workload, device.workload)
+        self.assertEqual({"my-service": self.service}, device.services)
+        self.query_workload.get.assert_called_once_with("the-device")
+        self.query_service.filter_by.assert_called_with(device_uuid="the-device")
+        mock.wrapper.session.expunge.assert_any_call(self.workload)
+        mock.wrapper.session.expunge.assert_any_call(self.service)
+
+    def test__device__not_found(self):
+        self.query_workload.get.return_value = None
+
+        self.assertIsNone(self.ledger.device("the-device"))
+        self.assertIsNone(self.ledger.device("the-device"))
+        self.assertEqual(2, self.query_workload.get.call_count)
+
+    def test__cached(self):
+        self.assertIsNone(self.ledger.cached("the-device"))
+
+        device = self.ledger.device("the-device")
+
+        self.assertIs(device, self.ledger.cached("the-device"))
+        self.query_workload.get.assert_called_once_with("the-device")
+
+    def test__find_service(self):
+        device = self.ledger.device("the-device")
+
+        self.assertIs(device, self.ledger.find_service("my-service"))
+        self.query_service.get.assert_not_called()
+
+    def test__find_service__not_loaded(self):
+        self.query_service.get.return_value = self.service
+
+        device = self.ledger.find_service("my-service")
+
+        self.assertIs(self.workload, device.workload)
+        self.query_service.get.assert_called_with("my-service")
+        self.query_workload.get.assert_called_with("the-device")
+
+    def test__find_service__unknown(self):
+        self.assertIsNone(self.ledger.find_service("unknown"))
+        self.query_service.get.assert_called_with("unknown")
+
+    def test__find_service__removed_but_not_flushed(self):
+        device = self.ledger.device("the-device")
+        self.ledger.remove_service(device, "my-service")
+        self.query_service.get.return_value = self.service
+
+        self.assertIsNone(self.ledger.find_service("my-service"))
+
+    def test__add_service(self):
+        device = self.ledger.device("the-device")
+
+        service = self.ledger.add_service(device, "new-service", ResourceVector(0.5, 0.5, 0.5, 0.5, 0.5))
+
+        self.assertEqual("new-service", service.service_uuid)
+        self.assertEqual("the-device", service.device_uuid)
+        self.assertEqual(ResourceVector(0.5, 0.5, 0.5, 0.5, 0.5), service.export())
+        self.assertIs(service, device.services["new-service"])
+        self.assertEqual(ResourceVector(1.5, 2.5, 3.5, 4.5, 5.5), device.workload.usage)
+        self.assertIs(device, self.ledger.find_service("new-service"))
+        mock.wrapper.session.add.assert_not_called()
+        mock.wrapper.session.commit.assert_not_called()
+
+    def test__remove_service(self):
+        device = self.ledger.device("the-device")
+
+        self.assertIs(self.service, self.ledger.remove_service(device, "my-service"))
+
+        self.assertEqual({}, device.services)
+        self.assertEqual(ResourceVector(0, 0, 0, 0, 0), device.workload.usage)
+        mock.wrapper.session.delete.assert_not_called()
+
+    def test__scale_service(self):
+        device = self.ledger.device("the-device")
+
+        self.ledger.scale_service(device, "my-service", ResourceVector(2, 2, 2, 2, 2))
+
+        self.assertEqual(ResourceVector(2, 2, 2, 2, 2), self.service.export())
+        self.assertEqual(ResourceVector(2, 2, 2, 2, 2), device.workload.usage)
+
+    def test__flush(self):
+        device = self.ledger.device("the-device")
+        self.ledger.scale_service(device, "my-service", ResourceVector(2, 2, 2, 2, 2))
+        self.ledger.add_service(device, "new-service", ResourceVector(1, 1, 1, 1, 1))
+
+        self.assertEqual(3, self.ledger.flush())
+
+        inserted, updated, workloads = self.flushed()
+        self.assertEqual(["new-service"], [row["service_uuid"] for row in inserted])
+        self.assertEqual(
+            [
+                {
+                    "service_uuid": "my-service",
+                    "device_uuid": "the-device",
+                    "allocated_cpu": 2,
+                    "allocated_ram": 2,
+                    "allocated_gpu": 2,
+                    "allocated_disk": 2,
+                    "allocated_network": 2,
+                }
+            ],
+            updated,
+        )
+        self.assertEqual(
+            [
+                {
+                    "uuid": "the-device",
+                    "usage_cpu": 3,
+                    "usage_ram": 3,
+                    "usage_gpu": 3,
+                    "usage_disk": 3,
+                    "usage_network": 3,
+                }
+            ],
+            workloads,
+        )
+        mock.wrapper.session.commit.assert_called_once_with()
+        self.assertEqual({"workload_rows_flushed": 3}, stats.snapshot())
+
+        self.assertEqual(0, self.ledger.flush())
+
+    def test__flush__inserted_service_is_updated_afterwards(self):
+        device = self.ledger.device("the-device")
+        self.ledger.add_service(device, "new-service", ResourceVector(1, 1, 1, 1, 1))
+        self.ledger.flush()
+        mock.wrapper.session.reset_mock()
+
+        self.ledger.scale_service(device, "new-service", ResourceVector(2, 2, 2, 2, 2))
+        self.ledger.flush()
+
+        inserted, updated, _ = self.flushed()
+        self.assertEqual([], inserted)
+        self.assertEqual(["new-service"], [row["service_uuid"] for row in updated])
+
+    def test__flush__removed_services(self):
+        device = self.ledger.device("the-device")
+        self.ledger.add_service(device, "short-lived", ResourceVector(1, 1, 1, 1, 1))
+        self.ledger.remove_service(device, "short-lived")
+        self.ledger.remove_service(device, "my-service")
+
+        self.assertEqual(2, self.ledger.flush())
+
+        self.assertTrue(self.query_service.filter.call_args[0][0].compare(Service.service_uuid.in_(["my-service"])))
+        self.query_service.filter().delete.assert_called_with(synchronize_session=False)
+        inserted, updated, _ = self.flushed()
+        self.assertEqual(([], []), (inserted, updated))
+
+    def test__flush__failed(self):
+        device = self.ledger.device("the-device")
+        self.ledger.add_service(device, "new-service", ResourceVector(1, 1, 1, 1, 1))
+        mock.wrapper.session.commit.side_effect = TimeoutError
+
+        with self.assertRaises(TimeoutError):
+            self.ledger.flush()
+
+        mock.wrapper.session.rollback.assert_called_with()
+        mock.wrapper.session.commit.side_effect = None
+        mock.wrapper.session.reset_mock()
+
+        self.assertEqual(2, self.ledger.flush())
+        inserted, _, workloads = self.flushed()
+        self.assertEqual(["new-service"], [row["service_uuid"] for row in inserted])
+        self.assertEqual(["the-device"], [row["uuid"] for row in workloads])
+
+    def test__evict(self):
+        device = self.ledger.device("the-device")
+        self.ledger.add_service(device, "new-service", ResourceVector(1, 1, 1, 1, 1))
+
+        self.assertEqual(["my-service", "new-service"], sorted(self.ledger.evict(["the-device", "other-device"])))
+
+        self.assertEqual(0, self.ledger.flush())
+        self.assertIsNot(device, self.ledger.device("the-device"))
+
+    def test__flush__drops_idle_devices(self):
+        device = self.ledger.device("the-device")
+        self.ledger.add_service(device, "new-service", ResourceVector(1, 1, 1, 1, 1))
+        self.query_workload.get.return_value = make_workload("other-device")
+        self.ledger.device("other-device")
+
+        self.time_patch.monotonic.return_value = 1061
+        self.ledger.device("other-device")
+        self.ledger.flush()
+
+        self.assertIsNone(self.ledger.cached("the-device"))
+        self.assertIsNotNone(self.ledger.cached("other-device"))
+        self.assertEqual({"workload_rows_flushed": 2, "workload_devices_dropped": 1}, stats.snapshot())
+
+        self.query_service.get.return_value = None
+        self.assertIsNone(self.ledger.find_service("new-service"))
+        self.query_service.get.assert_called_with("new-service")
+
+    def test__flush__keeps_devices_with_changes(self):
+        device = self.ledger.device("the-device")
+        self.ledger.add_service(device, "new-service", ResourceVector(1, 1, 1, 1, 1))
+        mock.wrapper.session.commit.side_effect = TimeoutError
+        self.time_patch.monotonic.return_value = 1061
+
+        with self.assertRaises(TimeoutError):
+            self.ledger.flush()
+
+        self.assertIs(device, self.ledger.cached("the-device"))
+        mock.wrapper.session.commit.side_effect = None
+
+    def test__flush__keeps_locked_devices(self):
+        device = self.ledger.device("the-device")
+        self.time_patch.monotonic.return_value = 1061
+
+        with device.lock:
+            self.ledger.flush()
+
+        self.assertIs(device, self.ledger.cached("the-device"))
+
+    @patch("ledger.Thread")
+    def test__start(self, thread_patch):
+        self.assertEqual(thread_patch(), self.ledger.start())
+
+        thread_patch.assert_called_with(target=self.ledger._run, name="workload-ledger", daemon=True)
+        thread_patch().start.assert_called_with()
+
+
+class TestWorkloadLedgerStrict(TestCase):
+    def setUp(self):
+        mock.reset_mocks()
+
+        self.query_workload = mock.MagicMock()
+        self.query_service = mock.MagicMock()
+        mock.wrapper.session.query = mock.MagicMock()
+        mock.wrapper.session.query.side_effect = {
+            Workload: self.query_workload,
+            Service: self.query_service,
+        }.__getitem__
+
+        self.workload = mock.MagicMock()
+        self.service = make_service("my-service")
+        self.query_workload.get.return_value = self.workload
+        self.query_service.filter_by().all.return_value = [self.service]
+
+        self.ledger = WorkloadLedger(True, 1, 60)
+
+    def test__device__loaded_every_time(self):
+        first: DeviceWorkload = self.ledger.device("the-device")
+        second: DeviceWorkload = self.ledger.device("the-device")
+
+        self.assertIsNot(first, second)
+        self.assertEqual(2, self.query_workload.get.call_count)
+        mock.wrapper.session.expunge.assert_not_called()
+
+    def test__find_service(self):
+        self.query_service.get.return_value = self.service
+
+        self.assertIs(self.workload, self.ledger.find_service("my-service").workload)
+        self.query_service.get.assert_called_with("my-service")
+
+    def test__add_service(self):
+        device = self.ledger.device("the-device")
+
+        service = self.ledger.add_service(device, "new-service", ResourceVector(1, 1, 1, 1, 1))
+
+        mock.wrapper.session.add.assert_called_with(service)
+        self.workload.service.assert_called_with(ResourceVector(1, 1, 1, 1, 1))
+
+    def test__remove_service(self):
+        device = self.ledger.device("the-device")
+
+        self.ledger.remove_service(device, "my-service")
+
+        mock.wrapper.session.delete.assert_called_with(self.service)
+        self.workload.service.assert_called_with(ResourceVector(-1, -2, -3, -4, -5))
+
+    def test__scale_service(self):
+        device = self.ledger.device("the-device")
+
+        self.ledger.scale_service(device, "my-service", ResourceVector(2, 2, 2, 2, 2))
+
+        self.assertEqual(ResourceVector(2, 2, 2, 2, 2), self.service.export())
+        self.workload.service.assert_called_with(ResourceVector(1, 0, -1, -2, -3))
+
+    def test__flush_evict_and_start_do_nothing(self):
+        self.ledger.device("the-device")
+
+        self.assertIsNone(self.ledger.cached("the-device"))
+        self.assertEqual(0, self.ledger.flush())
+        self.assertEqual([], self.ledger.evict(["the-device"]))
+        self.assertIsNone(self.ledger.start())
+        mock.wrapper.session.commit.assert_not_called()
@@ -1,5 +1,7 @@
+import signal
 from importlib import machinery, util
 from unittest import TestCase
+from unittest.mock import patch
 
 from mock.mock_loader import mock
 from resources import device, file, hardware
@@ -15,6 +17,9 @@ from schemes import (
     requirement_service,
     requirement_file_delete,
     basic_file_requirement,
+    requirement_file_resolve,
+    requirement_file_tree,
+    requirement_file_page,
 )
 
 
@@ -30,6 +35,34 @@ class TestApp(TestCase):
     def setUp(self):
         mock.reset_mocks()
 
+        upgrade_patcher = patch("migrations.upgrade")
+        self.upgrade_patch = upgrade_patcher.start()
+        self.addCleanup(upgrade_patcher.stop)
+
+        dispatcher_patcher = patch("outbox.start_dispatcher")
+        self.dispatcher_patch = dispatcher_patcher.start()
+        self.addCleanup(dispatcher_patcher.stop)
+
+        allocations_patcher = patch("resources.game_content.track_allocations")
+        self.allocations_patch = allocations_patcher.start()
+        self.addCleanup(allocations_patcher.stop)
+
+        filter_patcher = patch("models.device.Device.build_filter")
+        self.filter_patch = filter_patcher.start()
+        self.addCleanup(filter_patcher.stop)
+
+        workloads_patcher = patch("resources.game_content.workloads")
+        self.workloads_patch = workloads_patcher.start()
+        self.addCleanup(workloads_patcher.stop)
+
+        atexit_patcher = patch("atexit.register")
+        self.atexit_patch = atexit_patcher.start()
+        self.addCleanup(atexit_patcher.stop)
+
+        signal_patcher = patch("signal.signal")
+        self.signal_patch = signal_patcher.start()
+        self.addCleanup(signal_patcher.stop)
+
     def test__microservice_setup(self):
         app = import_app()
 
@@ -47,12 +80,23 @@ class TestApp(TestCase):
         import_main("__main__")
 
         mock.wrapper.Base.metadata.create_all.assert_called_with(bind=mock.wrapper.engine)
+        self.upgrade_patch.assert_called_with(mock.wrapper.engine)
+        self.filter_patch.assert_called_with()
+        mock.wrapper.Session.remove.assert_called_with()
+        self.dispatcher_patch.assert_called_with()
+        self.allocations_patch.assert_called_with()
+        self.workloads_patch.start.assert_called_with()
+        self.atexit_patch.assert_called_with(self.workloads_patch.flush)
+        self.assertEqual(signal.SIGTERM, self.signal_patch.call_args[0][0])
         mock.m.run.assert_called_with()
 
     def test__import_as_module(self):
         import_main()
 
         mock.wrapper.Base.metadata.create_all.assert_not_called()
+        self.upgrade_patch.assert_not_called()
+        self.allocations_patch.assert_not_called()
+        self.workloads_patch.start.assert_not_called()
         mock.m.run.assert_not_called()
 
     def test__endpoints_available(self):
@@ -68,6 +112,7 @@ class TestApp(TestCase):
             (["device", "info"], requirement_device, device.device_info, device_exists),
             (["device", "ping"], requirement_device, device.ping, device_exists),
             (["device", "all"], {}, device.list_devices),
+            (["device", "dashboard"], {}, device.dashboard),
             (["device", "create"], requirement_build, device.create_device),
             (["device", "starter_device"], {}, device.starter_device),
             (["device", "power"], requirement_device, device.power, device_exists, is_owner_of_device),
@@ -75,7 +120,10 @@ class TestApp(TestCase):
             (["device", "delete"], requirement_device, device.delete_device, device_exists),
             (["device", "spot"], {}, device.spot),
             (["file", "all"], basic_file_requirement, file.list_files, *device_reachable),
+            (["file", "page"], requirement_file_page, file.list_files_page, *device_reachable),
+            (["file", "tree"], requirement_file_tree, file.tree, *device_reachable),
             (["file", "info"], requirement_file, file.file_info, *file_errors),
+            (["file", "resolve"], requirement_file_resolve, file.resolve, *device_reachable),
             (["file", "move"], requirement_file_move, file.move, *file_errors),
             (["file", "update"], requirement_file_update, file.update, *file_errors),
             (
@@ -98,10 +146,16 @@ class TestApp(TestCase):
             (["exist"], device.exist),
             (["ping"], device.ms_ping, device_exists),
             (["owner"], device.owner, device_exists),
+            (["exist_many"], device.exist_many),
+            (["ping_many"], device.ping_many),
+            (["owner_many"], device.owner_many),
+            (["starter_device_many"], device.starter_device_many),
             (["hardware", "register"], hardware.hardware_register),
             (["hardware", "stop"], hardware.hardware_stop),
             (["hardware", "scale"], hardware.hardware_scale),
             (["delete_user"], device.delete_user),
+            (["stats"], device.get_stats),
+            (["access", "invalidate"], device.invalidate_access),
         ]
 
         for path, requires, func, *errors in expected_user_endpoints:
@@ -0,0 +1,205 @@
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from sqlalchemy import create_engine, inspect, text, MetaData, Table, Column, String, Index
+from sqlalchemy.dialects import mysql
+
+from mock.mock_loader import mock
+import migrations
+
+
+class TestMigrations(TestCase):
+    def setUp(self):
+        mock.reset_mocks()
+
+        self.engine = create_engine("sqlite://")
+        with self.engine.begin() as connection:
+            connection.execute(
+                text(
+                    "CREATE TABLE device_file ("
+                    "uuid VARCHAR(36) NOT NULL PRIMARY KEY, "
+                    "device VARCHAR(36) NOT NULL, "
+                    "filename VARCHAR(255) NOT NULL, "
+                    "content VARCHAR(255) NOT NULL DEFAULT '', "
+                    "is_directory BOOLEAN NOT NULL, "
+                    "parent_dir_uuid VARCHAR(36))"
+                )
+            )
+            connection.execute(
+                text(
+                    "CREATE TABLE device_file_content ("
+                    "file_uuid VARCHAR(36) NOT NULL PRIMARY KEY, "
+                    "device VARCHAR(36) NOT NULL, "
+                    "content VARCHAR(255) NOT NULL)"
+                )
+            )
+
+    def add_files(self, *files):
+        with self.engine.begin() as connection:
+            connection.execute(
+                text(
+                    "INSERT INTO device_file (uuid, device, filename, is_directory, parent_dir_uuid) "
+                    "VALUES (:uuid, 'device', :uuid, 1, :parent_dir_uuid)"
+                ),
+                [{"uuid": uuid, "parent_dir_uuid": parent_dir_uuid} for uuid, parent_dir_uuid in files],
+            )
+
+    def lineages(self) -> dict:
+        with self.engine.connect() as connection:
+            return {
+                uuid: lineage for uuid, lineage in connection.execute(text("SELECT uuid, lineage FROM device_file"))
+            }
+
+    def test__upgrade__file_lineage(self):
+        self.add_files(("c", "b"), ("a", None), ("b", "a"), ("d", "a"), ("e", None), ("f", "missing"))
+
+        migrations.upgrade(self.engine)
+
+        self.assertIn("lineage", [column["name"] for column in inspect(self.engine).get_columns("device_file")])
+        self.assertEqual({"a": "a/", "b": "a/b/", "c": "a/b/c/", "d": "a/d/", "e": "e/", "f": "f/"}, self.lineages())
+
+    def test__add_file_lineage__keeps_existing(self):
+        self.add_files(("a", None), ("b", "a"))
+        migrations.upgrade(self.engine)
+        self.add_files(("c", "b"))
+        with self.engine.begin() as connection:
+            connection.execute(text("UPDATE device_file SET lineage = 'x/' WHERE uuid = 'a'"))
+
+            migrations.add_file_lineage(connection)
+
+        self.assertEqual({"a": "x/", "b": "a/b/", "c": "a/b/c/"}, self.lineages())
+
+    def test__upgrade__file_lineage__cycle(self):
+        self.add_files(("a", "b"), ("b", "a"))
+
+        migrations.upgrade(self.engine)
+
+        self.assertEqual({"a", "b"}, set(self.lineages()))
+
+    def test__upgrade__file_content(self):
+        with self.engine.begin() as connection:
+            connection.execute(
+                text(
+                    "INSERT INTO device_file (uuid, device, filename, content, is_directory, parent_dir_uuid) "
+                    "VALUES ('a', 'device', 'a', '', 1, NULL), ('b', 'device', 'b', 'hello', 0, 'a'), "
+                    "('c', 'other', 'c', 'world', 0, NULL)"
+                )
+            )
+
+        migrations.upgrade(self.engine)
+        migrations.upgrade(self.engine)
+
+        with self.engine.connect() as connection:
+            self.assertNotIn("content", migrations.get_columns(connection, "device_file"))
+            contents = {
+                tuple(row)
+                for row in connection.execute(text("SELECT file_uuid, device, content FROM device_file_content"))
+            }
+        self.assertEqual({("b", "device", "hello"), ("c", "other", "world")}, contents)
+        self.assertEqual({"a": "a/", "b": "a/b/", "c": "c/"}, self.lineages())
+
+    def test__upgrade__versions(self):
+        steps = [MagicMock(), MagicMock()]
+
+        with patch("migrations.MIGRATIONS", steps[:1]):
+            migrations.upgrade(self.engine)
+        with patch("migrations.MIGRATIONS", steps):
+            migrations.upgrade(self.engine)
+            migrations.upgrade(self.engine)
+
+        self.assertEqual(1, steps[0].call_count)
+        self.assertEqual(1, steps[1].call_count)
+        with self.engine.connect() as connection:
+            versions = [version for version, in connection.execute(text("SELECT version FROM device_schema_version"))]
+        self.assertEqual([1, 2], versions)
+
+    def test__upgrade__failed_migration_is_retried(self):
+        steps = [MagicMock(), MagicMock(side_effect=RuntimeError)]
+
+        with patch("migrations.MIGRATIONS", steps):
+            self.assertRaises(RuntimeError, migrations.upgrade, self.engine)
+            steps[1].side_effect = None
+            migrations.upgrade(self.engine)
+
+        self.assertEqual(1, steps[0].call_count)
+        self.assertEqual(2, steps[1].call_count)
+
+    def test__create_indexes(self):
+        metadata = MetaData()
+        Table(
+            "device_file",
+            metadata,
+            Column("uuid", String(36), primary_key=True),
+            Column("device", String(36), index=True),
+            Column("filename", String(255)),
+            Index("ix_device_file_device_filename", "device", "filename"),
+        )
+        with self.engine.begin() as connection:
+            connection.execute(text("CREATE INDEX ix_device_file_device ON device_file (device)"))
+
+        with patch("migrations.wrapper.Base.metadata", metadata):
+            with self.engine.begin() as connection:
+                migrations.create_indexes(connection)
+                migrations.create_indexes(connection)
+
+        indexes = {index["name"]: index["column_names"] for index in inspect(self.engine).get_indexes("device_file")}
+        self.assertEqual(
+            {"ix_device_file_device": ["device"], "ix_device_file_device_filename": ["device", "filename"]}, indexes
+        )
+
+    def test__widen_outbox_next_attempt(self):
+        connection = MagicMock()
+        connection.dialect.name = "mysql"
+
+        migrations.widen_outbox_next_attempt(connection)
+
+        connection.execute.assert_called_once()
+        self.assertEqual(
+            "ALTER TABLE device_outbox MODIFY next_attempt DOUBLE NOT NULL", str(connection.execute.call_args[0][0])
+        )
+
+    def test__widen_outbox_next_attempt__sqlite(self):
+        connection = MagicMock()
+        connection.dialect.name = "sqlite"
+
+        migrations.widen_outbox_next_attempt(connection)
+
+        connection.execute.assert_not_called()
+
+    @patch("migrations.inspect")
+    def test__bound_file_lineage(self, inspect_patch):
+        metadata = MetaData()
+        Table(
+            "device_file",
+            metadata,
+            Column("uuid", String(36), primary_key=True),
+            Column("device", String(36)),
+            Column("lineage", String(888, collation="utf8_bin")),
+            Index("ix_device_file_device_lineage", "device", "lineage"),
+        )
+        connection = MagicMock()
+        connection.dialect = mysql.dialect()
+        inspect_patch(connection).get_indexes.return_value = [{"name": "ix_device_file_device_lineage"}]
+
+        with patch("migrations.wrapper.Base.metadata", metadata):
+            migrations.bound_file_lineage(connection)
+
+        statements = [
+            str(args[0].compile(dialect=connection.dialect)).strip() for args, _ in connection.execute.call_args_list
+        ]
+        self.assertEqual(
+            [
+                "DROP INDEX ix_device_file_device_lineage ON device_file",
+                "ALTER TABLE device_file MODIFY lineage VARCHAR(888) COLLATE utf8_bin",
+                "CREATE INDEX ix_device_file_device_lineage ON device_file (device, lineage)",
+            ],
+            statements,
+        )
+
+    def test__bound_file_lineage__sqlite(self):
+        connection = MagicMock()
+        connection.dialect.name = "sqlite"
+
+        migrations.bound_file_lineage(connection)
+
+        connection.execute.assert_not_called()
@@ -0,0 +1,166 @@
+import json
+from unittest import TestCase
+from unittest.mock import patch, call
+
+from sqlalchemy import MetaData
+from sqlalchemy.dialects import mysql
+from sqlalchemy.schema import CreateTable
+
+from mock.mock_loader import mock
+import outbox
+import stats
+from models.outbox import OutboxMessage
+from test_indexes import build_table
+
+
+def make_message(message_id: int, microservice=None, user=None, data=None, next_attempt=1000, attempts=0):
+    return OutboxMessage(
+        id=message_id,
+        microservice=microservice,
+        user=user,
+        endpoint=json.dumps(["some", "endpoint"]) if microservice is not None else None,
+        data=json.dumps(data or {}),
+        attempts=attempts,
+        next_attempt=next_attempt,
+    )
+
+
+class TestOutbox(TestCase):
+    def setUp(self):
+        mock.reset_mocks()
+        stats.reset()
+        outbox._wakeup.clear()
+
+        mock.wrapper.session.query = mock.MagicMock()
+        mock.wrapper.session.add = mock.MagicMock()
+        mock.wrapper.session.info = {}
+
+        time_patcher = patch("outbox.time")
+        self.time_patch = time_patcher.start()
+        self.time_patch.time.return_value = 1000
+        self.addCleanup(time_patcher.stop)
+
+        aliased_patcher = patch("outbox.aliased", return_value=OutboxMessage)
+        aliased_patcher.start()
+        self.addCleanup(aliased_patcher.stop)
+
+    def test__model__outbox_message__structure(self):
+        self.assertEqual("device_outbox", OutboxMessage.__tablename__)
+        self.assertTrue(issubclass(OutboxMessage, mock.wrapper.Base))
+        for col in ["id", "microservice", "user", "endpoint", "data", "attempts", "next_attempt"]:
+            self.assertTrue(col in dir(OutboxMessage))
+
+    def test__model__outbox_message__next_attempt_is_double_on_mysql(self):
+        ddl = str(CreateTable(build_table(MetaData(), OutboxMessage)).compile(dialect=mysql.dialect()))
+
+        self.assertRegex(ddl, r"next_attempt FLOAT\(53\) NOT NULL")
+
+    def test__enqueue_microservice(self):
+        outbox.enqueue_microservice("service", ["hardware", "stop"], {"device_uuid": "my-device"})
+
+        message: OutboxMessage = mock.wrapper.session.add.call_args[0][0]
+        self.assertEqual("service", message.microservice)
+        self.assertEqual(["hardware", "stop"], json.loads(message.endpoint))
+        self.assertEqual({"device_uuid": "my-device"}, json.loads(message.data))
+        self.assertEqual(0, message.attempts)
+        self.assertEqual(1000, message.next_attempt)
+        self.assertEqual({"outbox": True}, mock.wrapper.session.info)
+        mock.wrapper.session.commit.assert_not_called()
+
+    def test__enqueue_user(self):
+        outbox.enqueue_user("user", {"notify-id": "foo"})
+
+        message: OutboxMessage = mock.wrapper.session.add.call_args[0][0]
+        self.assertEqual("user", message.user)
+        self.assertEqual({"notify-id": "foo"}, json.loads(message.data))
+        self.assertEqual({"outbox": True}, mock.wrapper.session.info)
+        mock.wrapper.session.commit.assert_not_called()
+
+    def test__after_commit(self):
+        session = mock.MagicMock()
+        session.info = {}
+
+        outbox._after_commit(session)
+        self.assertFalse(outbox._wakeup.is_set())
+
+        session.info["outbox"] = True
+        outbox._after_commit(session)
+        self.assertTrue(outbox._wakeup.is_set())
+        self.assertEqual({}, session.info)
+
+    def test__dispatch(self):
+        messages = [
+            make_message(1, microservice="service", data={"n": 1}),
+            make_message(2, user="user", data={"n": 2}),
+            make_message(3, microservice="service", data={"n": 3}, attempts=2),
+            make_message(4, microservice="service", data={"n": 4}),
+            make_message(5, microservice="inventory", data={"n": 5}),
+        ]
+        query = mock.wrapper.session.query.return_value
+        query.filter().order_by().limit().all.return_value = messages
+
+        def contact_microservice(ms, endpoint, data):
+            if data["n"] == 3:
+                raise TimeoutError
+
+        mock.m.contact_microservice.side_effect = contact_microservice
+
+        self.assertEqual(3, outbox.dispatch())
+
+        mock.m.contact_microservice.assert_has_calls(
+            [call("service", ["some", "endpoint"], {"n": 1}), call("service", ["some", "endpoint"], {"n": 3})]
+        )
+        mock.m.contact_microservice.assert_any_call("inventory", ["some", "endpoint"], {"n": 5})
+        self.assertEqual(3, mock.m.contact_microservice.call_count)
+        mock.m.contact_user.assert_called_once_with("user", {"n": 2})
+        self.assertTrue(query.filter.call_args[0][0].compare(OutboxMessage.id.in_([1, 2, 5])))
+        query.filter().delete.assert_called_with(synchronize_session=False)
+        self.assertEqual(3, messages[2].attempts)
+        self.assertEqual(1000 + outbox.RETRY_DELAY * 4, messages[2].next_attempt)
+        self.assertEqual(0, messages[3].attempts)
+        mock.wrapper.session.delete.assert_not_called()
+        mock.wrapper.session.commit.assert_called_with()
+        self.assertEqual({"outbox_delivered": 3, "outbox_failed": 1}, stats.snapshot())
+
+    @patch("outbox.MAX_RETRY_DELAY", 60)
+    def test__dispatch__retry_delay_is_capped(self):
+        message = make_message(1, microservice="service", attempts=outbox.MAX_ATTEMPTS - 2)
+        mock.wrapper.session.query().filter().order_by().limit().all.return_value = [message]
+        mock.m.contact_microservice.side_effect = TimeoutError
+
+        self.assertEqual(0, outbox.dispatch())
+
+        self.assertEqual(outbox.MAX_ATTEMPTS - 1, message.attempts)
+        self.assertEqual(1000 + 60, message.next_attempt)
+        mock.wrapper.session.delete.assert_not_called()
+
+    def test__dispatch__dropped_after_max_attempts(self):
+        message = make_message(1, microservice="service", attempts=outbox.MAX_ATTEMPTS - 1)
+        mock.wrapper.session.query().filter().order_by().limit().all.return_value = [message]
+        mock.m.contact_microservice.side_effect = TimeoutError
+
+        self.assertEqual(0, outbox.dispatch())
+
+        mock.wrapper.session.delete.assert_called_once_with(message)
+        mock.m.debug.warning.assert_called_once()
+        mock.wrapper.session.commit.assert_called_with()
+        self.assertEqual({"outbox_failed": 1, "outbox_dropped": 1}, stats.snapshot())
+
+    def test__dispatch__nothing_pending(self):
+        query = mock.wrapper.session.query.return_value
+        query.filter().order_by().limit().all.return_value = []
+
+        self.assertEqual(0, outbox.dispatch())
+
+        query.filter().delete.assert_not_called()
+        mock.m.contact_microservice.assert_not_called()
+        mock.wrapper.session.commit.assert_called_with()
+
+    @patch("outbox.Thread")
+    @patch("outbox.event")
+    def test__start_dispatcher(self, event_patch, thread_patch):
+        self.assertEqual(thread_patch(), outbox.start_dispatcher())
+
+        event_patch.listen.assert_called_with(mock.wrapper.Session, "after_commit", outbox._after_commit)
+        thread_patch.assert_called_with(target=outbox._run, name="outbox", daemon=True)
+        thread_patch().start.assert_called_with()
@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+from resource_vector import ResourceVector
+
+
+class TestResourceVector(TestCase):
+    def test__dict(self):
+        data = {"cpu": 2, "ram": 3, "gpu": 5, "disk": 7, "network": 11}
+
+        vector = ResourceVector.from_dict({**data, "device_uuid": "the-device"})
+
+        self.assertEqual(ResourceVector(2, 3, 5, 7, 11), vector)
+        self.assertEqual(data, vector.to_dict())
+
+    def test__equality(self):
+        self.assertEqual(ResourceVector(1, 2, 3, 4, 5), ResourceVector(1, 2, 3, 4, 5))
+        self.assertEqual(ResourceVector(1, 2, 3, 4, 5), ResourceVector(1, 2, 3, 4, 5))
+        self.assertNotEqual(ResourceVector(1, 2, 3, 4, 5), ResourceVector(1, 2, 3, 4, 6))
+        self.assertNotEqual(ResourceVector(), (0, 0, 0, 0, 0))
+        self.assertNotEqual(ResourceVector(), [0, 0, 0, 0, 0])
+
+    def test__arithmetic(self):
+        a = ResourceVector(1, 2, 3, 4, 5)
+        b = ResourceVector(2, 4, 6, 8, 10)
+
+        self.assertEqual(ResourceVector(3, 6, 9, 12, 15), a + b)
+        self.assertEqual(ResourceVector(1, 2, 3, 4, 5), b - a)
+        self.assertEqual(ResourceVector(-1, -2, -3, -4, -5), -a)
+        self.assertEqual(ResourceVector(2, 8, 18, 32, 50), a * b)
+        self.assertEqual(ResourceVector(3, 6, 9, 12, 15), 3 * a)
+        self.assertEqual(ResourceVector(0.5, 0.5, 0.5, 0.5, 0.5), a / b)
+
+    def test__clamp(self):
+        self.assertEqual(ResourceVector(0.5, 1, 1, 0, 1), ResourceVector(0.5, 1, 7, 0, 1.5).clamp(1))
+
+    def test__scale_down_to(self):
+        usage = ResourceVector(10, 5, 0, 8, 3)
+        capacity = ResourceVector(5, 5, 1, 2, 6)
+
+        self.assertEqual(ResourceVector(0.5, 1, 1, 0.25, 1), usage.scale_down_to(capacity))
+
+    def test__is_close(self):
+        vector = ResourceVector(1, 2, 3, 4, 5)
+
+        self.assertTrue(vector.is_close(ResourceVector(1.005, 2, 3, 4, 5), 0.01))
+        self.assertFalse(vector.is_close(ResourceVector(1, 2, 3, 4, 5.02), 0.01))
@@ -1,6 +1,7 @@
 from unittest import TestCase
 
 from mock.mock_loader import mock
+from resource_vector import ResourceVector
 from models.service import Service
 
 
@@ -51,30 +52,19 @@ class TestServiceModel(TestCase):
         serialized["allocated_ram"] = 42
         self.assertEqual(expected_result, service.serialize)
 
-    def test__model__service__create(self):
-        actual_result = Service.create("my-device", "some-service", (1.1, 2.1, 3.2, 4.3, 5.5))
-
-        self.assertEqual("my-device", actual_result.device_uuid)
-        self.assertEqual("some-service", actual_result.service_uuid)
-        self.assertEqual(1.1, actual_result.allocated_cpu)
-        self.assertEqual(2.1, actual_result.allocated_ram)
-        self.assertEqual(3.2, actual_result.allocated_gpu)
-        self.assertEqual(4.3, actual_result.allocated_disk)
-        self.assertEqual(5.5, actual_result.allocated_network)
-        mock.wrapper.session.add.assert_called_with(actual_result)
-        mock.wrapper.session.commit.assert_called_with()
-
     def test__model__service__export(self):
-        service = Service.create("my-device", "some-service", (1.1, 2.1, 3.2, 4.3, 5.5))
+        service = Service(service_uuid="some-service", device_uuid="my-device")
+        service.overwrite(ResourceVector(1.1, 2.1, 3.2, 4.3, 5.5))
 
-        expected_result = (1.1, 2.1, 3.2, 4.3, 5.5)
+        expected_result = ResourceVector(1.1, 2.1, 3.2, 4.3, 5.5)
         actual_result = service.export()
 
         self.assertEqual(expected_result, actual_result)
 
     def test__model__service__overwrite(self):
-        service = Service.create("my-device", "some-service", (1.1, 2.1, 3.2, 4.3, 5.5))
-        service.overwrite((0.1, 0.2, 0.3, 0.4, 0.5))
+        service = Service(service_uuid="some-service", device_uuid="my-device")
+        service.overwrite(ResourceVector(1.1, 2.1, 3.2, 4.3, 5.5))
+        service.overwrite(ResourceVector(0.1, 0.2, 0.3, 0.4, 0.5))
 
         self.assertEqual(0.1, service.allocated_cpu)
         self.assertEqual(0.2, service.allocated_ram)
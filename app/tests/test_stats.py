@@ -0,0 +1,39 @@
+from threading import Thread
+from unittest import TestCase
+
+import stats
+
+
+class TestStats(TestCase):
+    def setUp(self):
+        stats.reset()
+
+    def test__increment(self):
+        stats.increment("foo")
+        stats.increment("foo", 2)
+        stats.increment("bar", 5)
+
+        self.assertEqual({"foo": 3, "bar": 5}, stats.snapshot())
+
+    def test__increment__threads(self):
+        threads = [Thread(target=lambda: [stats.increment("foo") for _ in range(1000)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual({"foo": 8000}, stats.snapshot())
+
+    def test__snapshot__is_a_copy(self):
+        stats.increment("foo")
+
+        stats.snapshot()["foo"] = 42
+
+        self.assertEqual({"foo": 1}, stats.snapshot())
+
+    def test__reset(self):
+        stats.increment("foo")
+
+        stats.reset()
+
+        self.assertEqual({}, stats.snapshot())
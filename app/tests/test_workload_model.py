@@ -1,6 +1,7 @@
 from unittest import TestCase
 
 from mock.mock_loader import mock
+from resource_vector import ResourceVector
 from models.workload import Workload
 
 
@@ -64,7 +65,7 @@ class TestWorkloadModel(TestCase):
         self.assertEqual(expected_result, workload.serialize)
 
     def test__model__workload__create(self):
-        actual_result = Workload.create("the-device", (3.1, 3.2, 3.3, 3.4, 3.5))
+        actual_result = Workload.create("the-device", ResourceVector(3.1, 3.2, 3.3, 3.4, 3.5))
 
         self.assertEqual("the-device", actual_result.uuid)
         self.assertEqual(3.1, actual_result.performance_cpu)
@@ -80,19 +81,40 @@ class TestWorkloadModel(TestCase):
         mock.wrapper.session.add.assert_called_with(actual_result)
         mock.wrapper.session.commit.assert_called_with()
 
+    def test__model__workload__create__without_commit(self):
+        actual_result = Workload.create("the-device", ResourceVector(3.1, 3.2, 3.3, 3.4, 3.5), commit=False)
+
+        mock.wrapper.session.add.assert_called_with(actual_result)
+        mock.wrapper.session.commit.assert_not_called()
+
     def test__model__workload__service(self):
-        workload = Workload.create("the-device", (3.1, 3.2, 3.3, 3.4, 3.5))
-        workload.service((1.01, 1.02, 1.03, 1.04, 1.05))
-
-        self.assertEqual(1.01, workload.usage_cpu)
-        self.assertEqual(1.02, workload.usage_ram)
-        self.assertEqual(1.03, workload.usage_gpu)
-        self.assertEqual(1.04, workload.usage_disk)
-        self.assertEqual(1.05, workload.usage_network)
-        mock.wrapper.session.commit.assert_called_with()
+        mock.wrapper.session.query = mock.MagicMock()
+        workload = Workload(uuid="the-device")
+        workload.service(ResourceVector(1.01, 1.02, 1.03, 1.04, 1.05))
+
+        mock.wrapper.session.query.assert_called_with(Workload)
+        mock.wrapper.session.query().filter_by.assert_called_with(uuid="the-device")
+        (values,) = mock.wrapper.session.query().filter_by().update.call_args[0]
+        self.assertEqual(
+            [
+                (Workload.usage_cpu, 1.01),
+                (Workload.usage_ram, 1.02),
+                (Workload.usage_gpu, 1.03),
+                (Workload.usage_disk, 1.04),
+                (Workload.usage_network, 1.05),
+            ],
+            [(column, expression.right.value) for column, expression in values.items()],
+        )
+        for column, expression in values.items():
+            self.assertIs(column, expression.left)
+        mock.wrapper.session.query().filter_by().update.assert_called_with(values, synchronize_session=False)
+        mock.wrapper.session.expire.assert_called_with(
+            workload, ["usage_cpu", "usage_ram", "usage_gpu", "usage_disk", "usage_network"]
+        )
+        mock.wrapper.session.commit.assert_not_called()
 
     def test__model__workload__workload_notification(self):
-        workload = Workload.create("the-device", (3.1, 3.2, 3.3, 3.4, 3.5))
+        workload = Workload.create("the-device", ResourceVector(3.1, 3.2, 3.3, 3.4, 3.5))
         workload.usage_cpu = 1.4
         workload.usage_ram = 3
         workload.usage_disk = 1000
@@ -109,7 +131,7 @@ class TestWorkloadModel(TestCase):
         self.assertEqual(expected_result, actual_result)
 
     def test__model__workload__display(self):
-        workload = Workload.create("the-device", (3.1, 3.2, 3.3, 3.4, 3.5))
+        workload = Workload.create("the-device", ResourceVector(3.1, 3.2, 3.3, 3.4, 3.5))
         workload.usage_cpu = 1.4
         workload.usage_ram = 3
         workload.usage_disk = 1000
@@ -119,3 +141,12 @@ class TestWorkloadModel(TestCase):
         actual_result = workload.display()
 
         self.assertEqual(expected_result, actual_result)
+
+    def test__model__workload__performance_and_usage(self):
+        workload = Workload.create("the-device", ResourceVector(3.1, 3.2, 3.3, 3.4, 3.5))
+
+        workload.usage += ResourceVector(1, 2, 3, 4, 5)
+
+        self.assertEqual(ResourceVector(3.1, 3.2, 3.3, 3.4, 3.5), workload.performance)
+        self.assertEqual(ResourceVector(1, 2, 3, 4, 5), workload.usage)
+        self.assertEqual(5, workload.usage_network)